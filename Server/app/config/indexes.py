@@ -0,0 +1,235 @@
+# config/indexes.py
+# Declarative index definitions for every collection the API queries.
+#
+#   python -m app.config.indexes apply    create missing indexes (idempotent)
+#   python -m app.config.indexes verify   explain() every route query shape, flag COLLSCANs
+#
+# The app also applies them on startup, see app/main.py.
+import asyncio
+import sys
+from datetime import datetime
+from bson import ObjectId
+from pymongo import IndexModel, ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+from app.config.database import db
+from app.models.book import BorrowStatus, NotificationType
+from app.utils.search import TEXT_INDEX_NAME, TEXT_INDEX_KEYS, TEXT_INDEX_WEIGHTS
+from app.utils.retention import NOTIFICATION_READ_TTL_DAYS
+
+INDEX_OPTIONS_CONFLICT = 85
+
+INDEXES = {
+    "users": [
+        IndexModel([("email", ASCENDING)], name="users_email_unique", unique=True),
+        # admin user directory: prefix search and filters, newest first
+        IndexModel([("name_lower", ASCENDING), ("_id", DESCENDING)], name="users_name_lower"),
+        IndexModel([("email_lower", ASCENDING), ("_id", DESCENDING)], name="users_email_lower"),
+        IndexModel([("role", ASCENDING), ("is_banned", ASCENDING), ("_id", DESCENDING)], name="users_role_banned"),
+    ],
+    "books": [
+        IndexModel([("isbn", ASCENDING)], name="books_isbn_unique", unique=True),
+        # Public catalog: only books with free copies, paged by _id
+        IndexModel(
+            [("_id", ASCENDING), ("available_copies", ASCENDING)],
+            name="books_available_partial",
+            partialFilterExpression={"available_copies": {"$gt": 0}},
+        ),
+        IndexModel(TEXT_INDEX_KEYS, name=TEXT_INDEX_NAME, weights=TEXT_INDEX_WEIGHTS, default_language="english"),
+    ],
+    "borrow_records": [
+        # my-borrows / borrowing-history, and the duplicate-borrow check
+        IndexModel(
+            [("user_email", ASCENDING), ("status", ASCENDING), ("request_date", DESCENDING), ("_id", DESCENDING)],
+            name="borrow_user_status_requested",
+        ),
+        # pending-requests
+        IndexModel(
+            [("status", ASCENDING), ("request_date", DESCENDING), ("_id", DESCENDING)],
+            name="borrow_status_requested",
+        ),
+        # due date scans
+        IndexModel([("status", ASCENDING), ("due_date", ASCENDING)], name="borrow_status_due"),
+        # admin/borrow-records
+        IndexModel([("request_date", DESCENDING), ("_id", DESCENDING)], name="borrow_requested"),
+        # active borrows of a book (delete_book, borrow_book)
+        IndexModel([("book_id", ASCENDING), ("status", ASCENDING)], name="borrow_book_status"),
+    ],
+    "notifications": [
+        IndexModel(
+            [("user_email", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+            name="notifications_user_created",
+        ),
+        # one notification per (borrow record, type); due-date scans upsert against it.
+        # Notifications without a borrow_id are not covered.
+        IndexModel(
+            [("borrow_id", ASCENDING), ("type", ASCENDING)],
+            name="notifications_borrow_type_unique",
+            unique=True,
+            partialFilterExpression={"borrow_id": {"$type": "string"}},
+        ),
+        # unread counter seeding and reconciliation
+        IndexModel([("user_email", ASCENDING), ("is_read", ASCENDING)], name="notifications_user_unread"),
+        # retention: read notifications expire NOTIFICATION_READ_TTL_DAYS after creation
+        IndexModel(
+            [("created_at", ASCENDING)],
+            name="notifications_read_ttl",
+            expireAfterSeconds=NOTIFICATION_READ_TTL_DAYS * 24 * 3600,
+            partialFilterExpression={"is_read": True},
+        ),
+    ],
+    "notifications_archive": [
+        IndexModel([("user_email", ASCENDING), ("created_at", DESCENDING)], name="archive_user_created"),
+    ],
+    "image_jobs": [
+        # worker claims: queued by next attempt, running by lease expiry
+        IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING)], name="image_jobs_status_next"),
+        # finished jobs are kept a week for status lookups
+        IndexModel([("finished_at", ASCENDING)], name="image_jobs_finished_ttl", expireAfterSeconds=7 * 24 * 3600),
+    ],
+    "blobs": [
+        # garbage collection of unreferenced images
+        IndexModel([("refcount", ASCENDING), ("last_unreferenced_at", ASCENDING)], name="blobs_unreferenced"),
+        # deletion worker and reconciliation check whether a stored key is still in use
+        IndexModel([("key", ASCENDING)], name="blobs_key"),
+        # books created with the URL of an uploaded image adopt its blob
+        IndexModel([("url", ASCENDING)], name="blobs_url"),
+    ],
+    "deletion_queue": [
+        # worker claims: queued by next attempt, running by lease expiry
+        IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING)], name="deletion_queue_status_next"),
+    ],
+    "sessions": [
+        # refresh sessions are deleted once expires_at passes
+        IndexModel([("expires_at", ASCENDING)], name="sessions_expiry", expireAfterSeconds=0),
+        # auth/sessions listing and revoking all of a user's sessions
+        IndexModel([("user_id", ASCENDING), ("last_used_at", DESCENDING)], name="sessions_user_used"),
+    ],
+}
+
+def query_shapes():
+    """
+    Every (collection, filter, sort) shape issued by the routes, with sample values
+    """
+    email = "verify@example.com"
+    now = datetime.now()
+    oid = ObjectId()
+    active = [BorrowStatus.PENDING, BorrowStatus.BORROWED, BorrowStatus.OVERDUE]
+    return [
+        ("users by email", "users", {"email": email}, None),
+        ("user directory search", "users",
+         {"$or": [{"name_lower": {"$regex": "^ver"}}, {"email_lower": {"$regex": "^ver"}}]}, [("_id", -1)]),
+        ("user directory filter", "users", {"role": "user", "is_banned": True}, [("_id", -1)]),
+        ("books by isbn", "books", {"isbn": "0000000000"}, None),
+        ("available books page", "books", {"$and": [{"available_copies": {"$gt": 0}}, {"_id": {"$gt": oid}}]}, [("_id", 1)]),
+        ("catalog search", "books", {"$text": {"$search": "sample"}, "available_copies": {"$gt": 0}}, None),
+        ("books by id list", "books", {"_id": {"$in": [oid]}}, None),
+        ("my borrows", "borrow_records", {"user_email": email, "status": {"$in": active}}, [("request_date", -1), ("_id", -1)]),
+        ("borrowing history", "borrow_records",
+         {"user_email": email, "status": {"$in": [BorrowStatus.RETURNED, BorrowStatus.REJECTED]}},
+         [("request_date", -1), ("_id", -1)]),
+        ("duplicate borrow check", "borrow_records",
+         {"book_id": str(oid), "user_email": email, "status": {"$in": active}}, None),
+        ("pending requests", "borrow_records", {"status": BorrowStatus.PENDING}, [("request_date", -1), ("_id", -1)]),
+        ("all borrow records", "borrow_records", {}, [("request_date", -1), ("_id", -1)]),
+        ("active borrows of book", "borrow_records",
+         {"book_id": str(oid), "status": {"$in": [BorrowStatus.BORROWED, BorrowStatus.PENDING, BorrowStatus.OVERDUE]}}, None),
+        ("due soon scan", "borrow_records", {"status": BorrowStatus.BORROWED, "due_date": {"$lte": now, "$gt": now}}, None),
+        ("overdue scan", "borrow_records", {"status": BorrowStatus.BORROWED, "due_date": {"$lt": now}}, None),
+        ("user notifications", "notifications", {"user_email": email}, [("created_at", -1), ("_id", -1)]),
+        ("notification dedupe", "notifications", {"borrow_id": str(oid), "type": NotificationType.OVERDUE}, None),
+        ("unread notifications", "notifications", {"user_email": email, "is_read": False}, None),
+        ("retention overflow", "notifications",
+         {"$and": [{"user_email": email}, {"$or": [{"created_at": {"$lt": now}}, {"created_at": now, "_id": {"$lt": oid}}]}]},
+         None),
+    ]
+
+# Indexes superseded by an entry in INDEXES; dropped by apply_indexes
+RETIRED_INDEXES = {
+    "notifications": ["notifications_borrow_type"],
+}
+
+async def apply_indexes():
+    """
+    Create every declared index. Existing identical indexes are a no-op, so
+    this is safe to run on every startup.
+
+    Returns:
+        List of (collection, index name, error message or None)
+    """
+    report = []
+    for collection, names in RETIRED_INDEXES.items():
+        existing = await db[collection].index_information()
+        for name in names:
+            if name in existing:
+                await db[collection].drop_index(name)
+
+    for collection, models in INDEXES.items():
+        for model in models:
+            name = model.document["name"]
+            try:
+                await db[collection].create_indexes([model])
+                report.append((collection, name, None))
+            except OperationFailure as e:
+                if e.code == INDEX_OPTIONS_CONFLICT and "expireAfterSeconds" in model.document:
+                    # TTL changed in config: adjust the existing index in place
+                    try:
+                        await db.command("collMod", collection, index={
+                            "name": name,
+                            "expireAfterSeconds": model.document["expireAfterSeconds"],
+                        })
+                        report.append((collection, name, None))
+                        continue
+                    except OperationFailure as collmod_error:
+                        e = collmod_error
+                # Typically duplicate keys for a unique index, or an existing
+                # index with the same name but different options
+                report.append((collection, name, str(e)))
+    return report
+
+def _stages(plan):
+    """
+    Yield every stage name in an explain() plan tree
+    """
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for key in ("inputStage", "queryPlan"):
+            if key in plan:
+                yield from _stages(plan[key])
+        for child in plan.get("inputStages", []):
+            yield from _stages(child)
+
+async def verify_indexes():
+    """
+    Run explain() on every query shape and flag the ones answered by a COLLSCAN
+
+    Returns:
+        List of (shape name, winning plan stages, uses_collscan)
+    """
+    report = []
+    for name, collection, query, sort in query_shapes():
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        winning = explain.get("queryPlanner", {}).get("winningPlan", {})
+        stages = list(_stages(winning))
+        report.append((name, stages, "COLLSCAN" in stages))
+    return report
+
+async def _main(command):
+    if command == "apply":
+        for collection, name, error in await apply_indexes():
+            print(f"{collection}.{name}: {'ERROR ' + error if error else 'ok'}")
+        return 0
+    if command == "verify":
+        collscans = 0
+        for name, stages, collscan in await verify_indexes():
+            collscans += collscan
+            print(f"{'COLLSCAN' if collscan else 'ok':8} {name}: {' <- '.join(stages)}")
+        return 1 if collscans else 0
+    print("usage: python -m app.config.indexes [apply|verify]")
+    return 2
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main(sys.argv[1] if len(sys.argv) > 1 else "apply")))
@@ -1,8 +1,25 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.staticfiles import StaticFiles
 from app.routes.auth import auth_router
 from app.routes.books import book_router  # Add this import
+from app.routes.uploads import upload_router
 from app.config.database import db
+from app.config.indexes import apply_indexes
+from app.utils.user_directory import backfill_user_search_fields
+from app.utils.background import start_periodic, stop_tasks
+from app.utils.unread_counter import reconcile_unread_counts, UNREAD_RECONCILE_INTERVAL
+from app.utils.outbox import outbox
+from app.utils.retention import retention, RETENTION_INTERVAL
+from app.utils.due_dates import due_date_scanner, DUE_DATE_SCAN_INTERVAL
+from app.utils.deadlines import deadlines
+from app.utils.revocation import revocations
+from app.utils.image_jobs import image_jobs
+from app.utils.upload_stream import UploadSizeLimitMiddleware
+from app.utils.blobs import blob_collector, BLOB_GC_INTERVAL
+from app.utils.deletions import deletion_queue, image_reconciler, IMAGE_RECONCILE_INTERVAL
+from app.utils.storage import storage, STORAGE_LOCAL_ROOT, STORAGE_LOCAL_URL_PATH
 import uvicorn
 import os
 from dotenv import load_dotenv
@@ -10,7 +27,52 @@ from dotenv import load_dotenv
 load_dotenv()
 PORT = int(os.getenv("PORT", 4000))
 
-app = FastAPI(title="Book Library API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    try:
+        for collection, name, error in await apply_indexes():
+            if error:
+                print(f"Error creating index {collection}.{name}: {error}")
+    except Exception as e:
+        print(f"Error applying indexes: {e}")
+    try:
+        await backfill_user_search_fields()
+    except Exception as e:
+        print(f"Error backfilling user search fields: {e}")
+    
+    # Revoked tokens must be known before the first request is served
+    try:
+        await revocations.load()
+    except Exception as e:
+        print(f"Error loading token revocations: {e}")
+    
+    # Background jobs
+    revocations.start()
+    outbox.start()
+    deadlines.start()
+    image_jobs.start()
+    deletion_queue.start()
+    tasks = [
+        start_periodic("reconcile-unread-counts", UNREAD_RECONCILE_INTERVAL, reconcile_unread_counts),
+        start_periodic("notification-retention", RETENTION_INTERVAL, retention.run),
+        # Safety net behind the deadline scheduler
+        start_periodic("due-date-scan", DUE_DATE_SCAN_INTERVAL, due_date_scanner.run, initial_delay=60),
+        start_periodic("blob-gc", BLOB_GC_INTERVAL, blob_collector.run),
+        start_periodic("image-reconcile", IMAGE_RECONCILE_INTERVAL, image_reconciler.run, initial_delay=300),
+    ]
+    yield
+    await stop_tasks(tasks)
+    await deadlines.stop()
+    await image_jobs.stop()
+    await deletion_queue.stop()
+    # Drain queued notifications last so nothing enqueued above is lost
+    await outbox.stop()
+    await revocations.stop()
+
+app = FastAPI(title="Book Library API", lifespan=lifespan)
+
+# Refuse oversized multipart bodies before they are parsed
+app.add_middleware(UploadSizeLimitMiddleware)
 
 # ✅ Add CORS so React Native can connect
 app.add_middleware(
@@ -24,6 +86,12 @@ app.add_middleware(
 # ✅ Register routes
 app.include_router(auth_router)
 app.include_router(book_router)  # Add this line
+app.include_router(upload_router)
+
+# Images stored by the local storage backend
+if storage.name == "local":
+    os.makedirs(STORAGE_LOCAL_ROOT, exist_ok=True)
+    app.mount(STORAGE_LOCAL_URL_PATH, StaticFiles(directory=STORAGE_LOCAL_ROOT), name="media")
 
 @app.get("/ping-db")
 async def ping_db():
@@ -69,6 +69,18 @@ class BorrowRecord(BaseModel):
 class ReturnRequest(BaseModel):
     borrow_id: str
 
+class BorrowAction(str, Enum):
+    APPROVE = "approve"
+    REJECT = "reject"
+    RETURN = "return"
+
+class BorrowActionItem(BaseModel):
+    borrow_id: str
+    action: BorrowAction
+
+class BulkBorrowActions(BaseModel):
+    actions: List[BorrowActionItem] = Field(..., min_length=1, max_length=1000)
+
 class Notification(BaseModel):
     user_email: str
     title: str
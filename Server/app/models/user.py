@@ -17,6 +17,9 @@ class UserLogin(BaseModel):
     email: EmailStr
     password: str
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
 class UserUpdate(BaseModel):
     is_banned: Optional[bool] = None
     ban_reason: Optional[str] = None
@@ -1,25 +1,23 @@
 # routes/auth.py
-from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form
-from passlib.context import CryptContext
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form, Request, Header, Query
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Optional
 from datetime import datetime
-import cloudinary
-import cloudinary.uploader
-import os
-from app.models.user import UserRegister, UserLogin, ProfileUpdate
+from app.models.user import UserRegister, UserLogin, ProfileUpdate, RefreshRequest
 from app.config.database import db
-from app.utils.auth_handler import create_access_token, verify_token
+from app.utils.auth_handler import create_access_token, verify_token, ACCESS_TOKEN_MINUTES
+from app.utils.etag import etag_response
+from app.utils.pagination import page_params, paginate, page_response
+from app.utils.user_directory import (
+    USER_SORT, COMPACT_USER_FIELDS, FULL_USER_FIELDS,
+    build_user_query, serialize_user, user_search_fields, user_summary
+)
+from app.utils.passwords import password_hasher
+from app.utils.revocation import revocations
+from app.utils.image_jobs import image_jobs
+from app.utils.sessions import create_session, rotate_session, list_sessions, revoke_session, revoke_user_sessions
 
 auth_router = APIRouter(prefix="/auth", tags=["Auth"])
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-# Configure Cloudinary
-cloudinary.config(
-    cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"),
-    api_key=os.getenv("CLOUDINARY_API_KEY"),
-    api_secret=os.getenv("CLOUDINARY_API_SECRET")
-)
 
 # Pydantic models for new endpoints
 class BanUserRequest(BaseModel):
@@ -67,30 +65,22 @@ async def register(
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
 
-    hashed_password = pwd_context.hash(password)
+    hashed_password = await password_hasher.hash(password)
     
     # Ensure role is valid
     if role not in ["admin", "user"]:
         role = "user"
 
-    # Handle profile image upload
-    profile_image_url = None
+    # Accept the profile image; it is uploaded in the background
+    image_job = None
     if profile_image:
-        try:
-            # Upload to Cloudinary
-            upload_result = cloudinary.uploader.upload(
-                profile_image.file,
-                folder="user_profiles",
-                public_id=f"profile_{email}"
-            )
-            profile_image_url = upload_result["secure_url"]
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Image upload failed: {str(e)}")
+        image_job = await image_jobs.accept(profile_image, email)
 
     # Create user document
     user_dict = {
         "name": name,
         "email": email,
+        **user_search_fields(name, email),
         "password": hashed_password,
         "dob": dob,
         "gender": gender,
@@ -101,15 +91,28 @@ async def register(
         "ban_reason": None,
         "banned_at": None,
         "created_at": datetime.utcnow(),
-        "profile_image": profile_image_url
+        "profile_image": None
     }
+    if image_job:
+        user_dict["profile_image_job_id"] = str(image_job["_id"])
 
-    await db["users"].insert_one(user_dict)
-    return {"message": "User registered successfully", "role": role}
+    try:
+        await db["users"].insert_one(user_dict)
+    except Exception:
+        if image_job:
+            image_jobs.discard(image_job)
+        raise
+    if image_job:
+        await image_jobs.submit(image_job, "user", email, folder="user_profiles")
+    return {
+        "message": "User registered successfully",
+        "role": role,
+        "image_job_id": user_dict.get("profile_image_job_id")
+    }
 
 # LOGIN
 @auth_router.post("/login")
-async def login(user: UserLogin):
+async def login(user: UserLogin, user_agent: Optional[str] = Header(None)):
     existing_user = await db["users"].find_one({"email": user.email})
     if not existing_user:
         raise HTTPException(status_code=400, detail="Invalid email or password")
@@ -122,32 +125,105 @@ async def login(user: UserLogin):
             detail=f"Account is banned. Reason: {ban_reason}"
         )
 
-    if not pwd_context.verify(user.password, existing_user["password"]):
+    if not await password_hasher.verify(user.password, existing_user["password"]):
         raise HTTPException(status_code=400, detail="Invalid email or password")
 
+    session_id, refresh_token = await create_session(existing_user, user_agent)
     token = create_access_token({
         "email": user.email,
         "role": existing_user.get("role", "user"),
         "name": existing_user.get("name", ""),
-        "user_id": str(existing_user["_id"])
+        "user_id": str(existing_user["_id"]),
+        "sid": session_id
     })
 
     return {
         "access_token": token,
+        "refresh_token": refresh_token,
+        "expires_in": ACCESS_TOKEN_MINUTES * 60,
         "token_type": "bearer",
         "role": existing_user.get("role", "user"),
         "name": existing_user.get("name", ""),
         "profile_image": existing_user.get("profile_image")
     }
 
+# REFRESH: trade a refresh token for a new access token (and a new refresh token)
+@auth_router.post("/refresh")
+async def refresh(body: RefreshRequest):
+    from bson import ObjectId
+
+    rotated = await rotate_session(body.refresh_token)
+    if rotated is None:
+        raise HTTPException(status_code=401, detail="Invalid or expired refresh token")
+    session, refresh_token = rotated
+
+    # Role, name and ban status may have changed since login
+    existing_user = await db["users"].find_one(
+        {"_id": ObjectId(session["user_id"])},
+        {"email": 1, "role": 1, "name": 1, "is_banned": 1}
+    )
+    if not existing_user or existing_user.get("is_banned", False):
+        await revoke_user_sessions(session["user_id"])
+        raise HTTPException(status_code=401, detail="Invalid or expired refresh token")
+
+    token = create_access_token({
+        "email": existing_user["email"],
+        "role": existing_user.get("role", "user"),
+        "name": existing_user.get("name", ""),
+        "user_id": session["user_id"],
+        "sid": str(session["_id"])
+    })
+
+    return {
+        "access_token": token,
+        "refresh_token": refresh_token,
+        "expires_in": ACCESS_TOKEN_MINUTES * 60,
+        "token_type": "bearer"
+    }
+
+# LIST MY SESSIONS
+@auth_router.get("/sessions")
+async def get_my_sessions(current_user: dict = Depends(get_current_user)):
+    sessions = await list_sessions(current_user.get("user_id"))
+    for session in sessions:
+        session["current"] = session["id"] == current_user.get("sid")
+    return sessions
+
+# REVOKE ONE OF MY SESSIONS
+@auth_router.delete("/sessions/{session_id}")
+async def delete_my_session(session_id: str, current_user: dict = Depends(get_current_user)):
+    """
+    End one of my sessions: its refresh token stops working
+
+    Access tokens already issued for it stay valid until they expire
+    (at most ACCESS_TOKEN_MINUTES); only a ban, which sets
+    tokens_revoked_at, cuts those off early.
+    """
+    if not await revoke_session(current_user.get("user_id"), session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {"message": "Session revoked"}
+
+# LOGOUT: end the session this token belongs to
+@auth_router.post("/logout")
+async def logout(current_user: dict = Depends(get_current_user)):
+    """
+    End the current session: its refresh token stops working
+
+    The access token itself stays valid until it expires (at most
+    ACCESS_TOKEN_MINUTES), so clients must discard it on logout.
+    """
+    if current_user.get("sid"):
+        await revoke_session(current_user.get("user_id"), current_user["sid"])
+    return {"message": "Logged out"}
+
 # GET MY PROFILE
 @auth_router.get("/me", response_model=UserResponse)
-async def get_my_profile(current_user: dict = Depends(get_current_user)):
+async def get_my_profile(request: Request, current_user: dict = Depends(get_current_user)):
     user = await db["users"].find_one({"email": current_user["email"]}, {"password": 0})
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    return {
+    return etag_response(request, {
         "id": str(user["_id"]),
         "email": user["email"],
         "name": user.get("name", ""),
@@ -161,7 +237,7 @@ async def get_my_profile(current_user: dict = Depends(get_current_user)):
         "gender": user.get("gender"),
         "address": user.get("address"),
         "phone": user.get("phone")
-    }
+    })
 # routes/auth.py - Update the update_profile endpoint
 @auth_router.put("/profile")
 async def update_profile(
@@ -182,6 +258,7 @@ async def update_profile(
     # Update basic profile fields
     if name is not None:
         update_data["name"] = name
+        update_data.update(user_search_fields(name=name))
     if dob is not None:
         update_data["dob"] = dob
     if gender is not None:
@@ -191,18 +268,11 @@ async def update_profile(
     if phone is not None:
         update_data["phone"] = phone
 
-    # Handle profile image upload
+    # Handle profile image upload: accepted now, uploaded in the background
+    image_job = None
     if profile_image:
-        try:
-            # Upload to Cloudinary
-            upload_result = cloudinary.uploader.upload(
-                profile_image.file,
-                folder="user_profiles",
-                public_id=f"profile_{current_user['email']}"
-            )
-            update_data["profile_image"] = upload_result["secure_url"]
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Image upload failed: {str(e)}")
+        image_job = await image_jobs.accept(profile_image, current_user["email"])
+        update_data["profile_image_job_id"] = str(image_job["_id"])
 
     if update_data:
         await db["users"].update_one(
@@ -210,7 +280,10 @@ async def update_profile(
             {"$set": update_data}
         )
 
-    return {"message": "Profile updated successfully"}
+    if image_job:
+        await image_jobs.submit(image_job, "user", current_user["email"], folder="user_profiles")
+
+    return {"message": "Profile updated successfully", "image_job_id": update_data.get("profile_image_job_id")}
 
 # UPDATE PROFILE IMAGE ONLY
 @auth_router.put("/profile/image")
@@ -222,47 +295,39 @@ async def update_profile_image(
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    try:
-        # Upload to Cloudinary
-        upload_result = cloudinary.uploader.upload(
-            profile_image.file,
-            folder="user_profiles",
-            public_id=f"profile_{current_user['email']}"
-        )
-        profile_image_url = upload_result["secure_url"]
-        
-        # Update user profile image
-        await db["users"].update_one(
-            {"email": current_user["email"]},
-            {"$set": {"profile_image": profile_image_url}}
-        )
+    # Upload in the background; profile_image changes when the job finishes
+    image_job = await image_jobs.accept(profile_image, current_user["email"])
+    await db["users"].update_one(
+        {"email": current_user["email"]},
+        {"$set": {"profile_image_job_id": str(image_job["_id"])}}
+    )
+    job_id = await image_jobs.submit(image_job, "user", current_user["email"], folder="user_profiles")
+
+    return {"message": "Profile image update accepted", "image_job_id": job_id}
+
+# GET ALL USERS (Admin only): searchable and paginated
+@auth_router.get("/users")
+async def get_all_users(
+    request: Request,
+    q: Optional[str] = Query(None, description="Prefix of the name or email"),
+    role: Optional[str] = Query(None, pattern="^(admin|user)$"),
+    is_banned: Optional[bool] = None,
+    view: str = Query("full", pattern="^(compact|full)$"),
+    page: dict = Depends(page_params),
+    current_admin: dict = Depends(get_current_admin)
+):
+    fields = COMPACT_USER_FIELDS if view == "compact" else FULL_USER_FIELDS
+    users, next_cursor = await paginate(
+        db["users"], build_user_query(q, role, is_banned), USER_SORT,
+        page["after"], page["limit"], fields
+    )
+    items = [serialize_user(user, fields) for user in users]
+    return etag_response(request, page_response(items, next_cursor))
 
-        return {"message": "Profile image updated successfully", "profile_image": profile_image_url}
-    
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Image upload failed: {str(e)}")
-
-# GET ALL USERS (Admin only)
-@auth_router.get("/users", response_model=List[UserResponse])
-async def get_all_users(current_admin: dict = Depends(get_current_admin)):
-    users = []
-    async for user in db["users"].find({}, {"password": 0}):  # Exclude password
-        users.append({
-            "id": str(user["_id"]),
-            "email": user["email"],
-            "name": user.get("name", ""),
-            "role": user.get("role", "user"),
-            "is_banned": user.get("is_banned", False),
-            "ban_reason": user.get("ban_reason"),
-            "banned_at": user.get("banned_at"),
-            "created_at": user.get("created_at"),
-            "profile_image": user.get("profile_image"),
-            "dob": user.get("dob"),
-            "gender": user.get("gender"),
-            "address": user.get("address"),
-            "phone": user.get("phone")
-        })
-    return users
+# USER COUNTS (Admin only); declared before /users/{user_id} so "summary" is not taken as an id
+@auth_router.get("/users/summary")
+async def get_users_summary(request: Request, current_admin: dict = Depends(get_current_admin)):
+    return etag_response(request, await user_summary())
 
 # BAN USER (Admin only)
 @auth_router.post("/users/{user_id}/ban")
@@ -286,13 +351,16 @@ async def ban_user(
     if user.get("role") == "admin":
         raise HTTPException(status_code=400, detail="Cannot ban admin users")
 
+    banned_at = datetime.utcnow()
     update_result = await db["users"].update_one(
         {"_id": user_object_id},
         {
             "$set": {
                 "is_banned": True,
                 "ban_reason": ban_request.reason,
-                "banned_at": datetime.utcnow()
+                "banned_at": banned_at,
+                # Invalidates every token issued so far (see app/utils/revocation.py)
+                "tokens_revoked_at": banned_at
             }
         }
     )
@@ -300,6 +368,10 @@ async def ban_user(
     if update_result.modified_count == 0:
         raise HTTPException(status_code=400, detail="Failed to ban user")
 
+    await revoke_user_sessions(user_id)
+    # Enforce on this worker right away; the others pick it up from the change stream
+    revocations.apply({"_id": user_object_id, "email": user.get("email"), "tokens_revoked_at": banned_at})
+
     return {"message": "User banned successfully", "reason": ban_request.reason}
 
 # UNBAN USER (Admin only)
@@ -337,7 +409,7 @@ async def unban_user(
 
 # GET USER BY ID (Admin only)
 @auth_router.get("/users/{user_id}", response_model=UserResponse)
-async def get_user(user_id: str, current_admin: dict = Depends(get_current_admin)):
+async def get_user(user_id: str, request: Request, current_admin: dict = Depends(get_current_admin)):
     from bson import ObjectId
     
     try:
@@ -349,7 +421,7 @@ async def get_user(user_id: str, current_admin: dict = Depends(get_current_admin
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    return {
+    return etag_response(request, {
         "id": str(user["_id"]),
         "email": user["email"],
         "name": user.get("name", ""),
@@ -363,4 +435,4 @@ async def get_user(user_id: str, current_admin: dict = Depends(get_current_admin
         "gender": user.get("gender"),
         "address": user.get("address"),
         "phone": user.get("phone")
-    }
\ No newline at end of file
+    })
\ No newline at end of file
@@ -1,18 +1,35 @@
-from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form, Query, Request, WebSocket, status
+from fastapi.responses import Response, StreamingResponse
 from bson import ObjectId
+from pymongo import ReturnDocument
 from datetime import datetime, timedelta
-import cloudinary
-import cloudinary.uploader
-from app.models.book import Book, BorrowRequest, BorrowRecord, ReturnRequest, BookStatus, BorrowStatus, Notification, NotificationType
+from typing import Optional
+import json
+from app.models.book import Book, BorrowRequest, BorrowRecord, ReturnRequest, BookStatus, BorrowStatus, Notification, NotificationType, BulkBorrowActions
 from app.config.database import db
-from app.utils.auth_handler import get_current_user
-
-# Configure Cloudinary
-cloudinary.config(
-    cloud_name="dtisam8ot",
-    api_key="416996345946976",
-    api_secret="dcfIgNOmXE5GkMyXgOAHnMxVeLg"
-)
+from app.utils.auth_handler import get_current_user, verify_token_string, token_cache
+from app.utils.search import build_search_query, search_books
+from app.utils.pagination import page_params, paginate, page_response, decode_cursor
+from app.utils.hydration import BookLoader, get_book_loader, attach_books
+from app.utils.catalog_cache import catalog_cache
+from app.utils.etag import render_json, conditional_response, etag_response, etag_matches, PUBLIC_CACHE_CONTROL
+from app.utils.book_import import detect_format, import_books, DEFAULT_CHUNK_SIZE, MAX_CHUNK_SIZE
+from app.utils.inventory import reserve_copies, release_copies
+from app.utils.borrow_actions import apply_borrow_actions
+from app.utils.notifications import create_notification
+from app.utils.unread_counter import get_unread_count, remove_unread
+from app.utils.realtime import serve_notification_socket, publish_pending, hub
+from app.utils.outbox import outbox
+from app.utils.retention import retention
+from app.utils.due_dates import due_date_scanner
+from app.utils.deadlines import deadlines
+from app.utils.passwords import password_hasher
+from app.utils.revocation import revocations
+from app.utils.image_jobs import image_jobs
+from app.utils.blobs import adopt_blob_url, release_blob, blob_collector
+from app.utils.deletions import release_legacy_image, deletion_queue, image_reconciler
+from app.utils.upload_stream import upload_budget
+from app.utils.covers import cover_cache, cover_version, attach_cover_variants, COVER_FORMATS, COVER_MIN_DIMENSION, COVER_MAX_DIMENSION, COVER_CACHE_CONTROL, COVER_SHORT_CACHE_CONTROL
 
 book_router = APIRouter(prefix="/books", tags=["Books"])
 
@@ -30,72 +47,87 @@ def is_valid_objectid(id_str):
     except:
         return False
 
-# Upload image to Cloudinary - FIXED VERSION
-async def upload_image_to_cloudinary(file: UploadFile):
-    try:
-        # Validate file type
-        if not file.content_type.startswith('image/'):
-            raise HTTPException(status_code=400, detail="File must be an image")
-        
-        # Validate file size (max 5MB)
-        max_size = 5 * 1024 * 1024  # 5MB
-        contents = await file.read()
-        if len(contents) > max_size:
-            raise HTTPException(status_code=400, detail="Image size must be less than 5MB")
-        
-        # Reset file pointer after reading
-        await file.seek(0)
-        
-        # Upload to Cloudinary
-        upload_result = cloudinary.uploader.upload(
-            contents,  # Use the content we already read
-            folder="library_books"
-        )
-        
-        return upload_result["secure_url"]  # Return the URL of the uploaded image
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Image upload failed: {str(e)}")
-
-# IMAGE UPLOAD ENDPOINT
-@book_router.post("/upload-image")
+# IMAGE UPLOAD ENDPOINT: the upload runs in the background; poll /uploads/jobs/{id}
+@book_router.post("/upload-image", status_code=status.HTTP_202_ACCEPTED)
 async def upload_book_image(
     image: UploadFile = File(...),
     current_user: dict = Depends(get_current_user)
 ):
     """
     Upload an image for a book
+
+    Pass the job's result_url as image_url to /books/add-book-json; the
+    uploaded image is kept for BLOB_GC_GRACE until a book is created with it.
     """
     if current_user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    try:
-        # Upload to Cloudinary
-        image_url = await upload_image_to_cloudinary(image)
-        
-        return {
-            "message": "Image uploaded successfully",
-            "image_url": image_url
-        }
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to upload image: {str(e)}")
+    job = await image_jobs.accept(image, current_user.get("email"))
+    job_id = await image_jobs.submit(job)
+    return {
+        "message": "Image accepted",
+        "image_job_id": job_id,
+        "status": "queued"
+    }
+
+# Sort orders used for keyset pagination; each ends with _id to keep keys unique
+BOOK_SORT = [("_id", 1)]
+BORROW_SORT = [("request_date", -1), ("_id", -1)]
+NOTIFICATION_SORT = [("created_at", -1), ("_id", -1)]
+
+# Serve a page of the catalog through the in-process catalog cache.
+# Pages are cached pre-rendered so the ETag is only computed once per refresh.
+async def get_cached_book_page(listing: str, query: dict, page: dict):
+    low = None
+    if page["after"]:
+        low = decode_cursor(page["after"])[0]
+        if not isinstance(low, ObjectId):
+            raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+    
+    async def load():
+        books, next_cursor = await paginate(db["books"], query, BOOK_SORT, **page)
+        high = books[-1]["_id"] if next_cursor else None
+        items = [attach_cover_variants(convert_objectid(book)) for book in books]
+        return render_json(page_response(items, next_cursor)), high
+    
+    return await catalog_cache.get((listing, page["after"], page["limit"]), load, low=low)
 
 # BOOK MANAGEMENT
 @book_router.get("/")
-async def get_available_books():
-    books = await db["books"].find({"available_copies": {"$gt": 0}}).to_list(1000)
-    return [convert_objectid(book) for book in books]
+async def get_available_books(request: Request, page: dict = Depends(page_params)):
+    rendered = await get_cached_book_page("available", {"available_copies": {"$gt": 0}}, page)
+    return conditional_response(request, rendered, PUBLIC_CACHE_CONTROL)
+
+@book_router.get("/search")
+async def search_catalog(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200),
+    category: Optional[str] = None,
+    available: Optional[bool] = None,
+    page: int = Query(1, ge=1),
+    limit: int = Query(20, ge=1, le=100)
+):
+    """
+    Ranked full text search over title, author, ISBN, category and description
+    """
+    query = build_search_query(q.strip(), category=category, available=available)
+    books, total = await search_books(query, page, limit)
+    
+    return etag_response(request, {
+        "items": [attach_cover_variants(convert_objectid(book)) for book in books],
+        "page": page,
+        "limit": limit,
+        "total": total,
+        "has_more": page * limit < total
+    }, PUBLIC_CACHE_CONTROL)
 
 @book_router.get("/all")
-async def get_all_books(current_user: dict = Depends(get_current_user)):
+async def get_all_books(request: Request, page: dict = Depends(page_params), current_user: dict = Depends(get_current_user)):
     if current_user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    books = await db["books"].find().to_list(1000)
-    return [convert_objectid(book) for book in books]
+    rendered = await get_cached_book_page("all", {}, page)
+    return conditional_response(request, rendered)
 
 # ADD BOOK WITH IMAGE - FIXED VERSION
 @book_router.post("/")
@@ -118,14 +150,6 @@ async def add_book(
     if existing_book:
         raise HTTPException(status_code=400, detail="Book with this ISBN already exists")
     
-    # Handle image upload
-    image_url = None
-    if image and image.filename:  # Check if image is provided and has filename
-        try:
-            image_url = await upload_image_to_cloudinary(image)
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Image upload error: {str(e)}")
-    
     # Validate available copies don't exceed total copies
     if available_copies > total_copies:
         raise HTTPException(
@@ -133,6 +157,12 @@ async def add_book(
             detail="Available copies cannot exceed total copies"
         )
     
+    # Accept the image now; it is uploaded in the background and
+    # image_url is set once that finishes
+    image_job = None
+    if image and image.filename:  # Check if image is provided and has filename
+        image_job = await image_jobs.accept(image, current_user.get("email"))
+    
     # Create book document
     book_dict = {
         "title": title,
@@ -142,21 +172,29 @@ async def add_book(
         "total_copies": total_copies,
         "available_copies": available_copies,
         "category": category,
-        "image_url": image_url,
+        "image_url": None,
         "created_at": datetime.now()
     }
+    if image_job:
+        book_dict["image_job_id"] = str(image_job["_id"])
     
     try:
         result = await db["books"].insert_one(book_dict)
         book_dict["_id"] = str(result.inserted_id)
-        
-        return {
-            "message": "Book added successfully", 
-            "book": book_dict,
-            "image_uploaded": image_url is not None
-        }
+        catalog_cache.invalidate_book(result.inserted_id)
     except Exception as e:
+        if image_job:
+            image_jobs.discard(image_job)
         raise HTTPException(status_code=500, detail=f"Failed to add book: {str(e)}")
+    
+    if image_job:
+        await image_jobs.submit(image_job, "book", book_dict["_id"])
+    
+    return {
+        "message": "Book added successfully", 
+        "book": book_dict,
+        "image_job_id": book_dict.get("image_job_id")
+    }
 
 # Add book with JSON (alternative without image)
 @book_router.post("/add-book-json")
@@ -176,11 +214,89 @@ async def add_book_json(book: Book, current_user: dict = Depends(get_current_use
     if book_dict["available_copies"] > book_dict["total_copies"]:
         book_dict["available_copies"] = book_dict["total_copies"]
     
-    result = await db["books"].insert_one(book_dict)
-    book_dict["_id"] = str(result.inserted_id)
+    # An image_url from /books/upload-image: the book takes a reference on its blob
+    book_id = ObjectId()
+    blob = await adopt_blob_url(book_dict.get("image_url"), str(book_id))
+    if blob is not None:
+        book_dict["image_blob"] = blob["_id"]
+        book_dict["image_blob_ref"] = str(book_id)
+    
+    book_dict["_id"] = book_id
+    try:
+        await db["books"].insert_one(book_dict)
+    except Exception:
+        if blob is not None:
+            await release_blob(blob["_id"], str(book_id))
+        raise
+    book_dict["_id"] = str(book_id)
+    catalog_cache.invalidate_book(book_id)
     
     return {"message": "Book added successfully", "book": book_dict}
 
+# BULK IMPORT (CSV or NDJSON)
+@book_router.post("/bulk-import")
+async def bulk_import_books(
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(None, pattern="^(csv|ndjson)$"),
+    chunk_size: int = Query(DEFAULT_CHUNK_SIZE, ge=1, le=MAX_CHUNK_SIZE),
+    ordered: bool = False,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Import a catalog file row by row. The response is streamed as NDJSON:
+    one report per row followed by a final {"summary": ...} line.
+    """
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    fmt = format or detect_format(file.filename, file.content_type)
+    
+    async def report_lines():
+        try:
+            async for report in import_books(file.file, fmt, chunk_size=chunk_size, ordered=ordered):
+                yield json.dumps(report) + "\n"
+        finally:
+            catalog_cache.invalidate_all()
+    
+    return StreamingResponse(report_lines(), media_type="application/x-ndjson")
+
+# Resized cover, rendered once per (image, size, format) and cached on disk.
+# List responses link to fixed variants whose URLs carry the image version (v),
+# so clients and CDNs may keep them forever; a new image gets a new URL.
+@book_router.get("/{book_id}/cover")
+async def get_book_cover(
+    request: Request,
+    book_id: str,
+    w: int = Query(..., ge=COVER_MIN_DIMENSION, le=COVER_MAX_DIMENSION),
+    h: int = Query(..., ge=COVER_MIN_DIMENSION, le=COVER_MAX_DIMENSION),
+    fmt: str = Query("jpeg", pattern="^(jpeg|webp|png)$"),
+    v: Optional[str] = None
+):
+    if not is_valid_objectid(book_id):
+        raise HTTPException(status_code=400, detail="Invalid book ID")
+    
+    book = await db["books"].find_one(
+        {"_id": ObjectId(book_id)},
+        {"image_url": 1, "image_blob": 1}
+    )
+    if not book:
+        raise HTTPException(status_code=404, detail="Book not found")
+    if not book.get("image_url"):
+        raise HTTPException(status_code=404, detail="Book has no cover image")
+    
+    cache_control = COVER_CACHE_CONTROL if v == cover_version(book) else COVER_SHORT_CACHE_CONTROL
+    try:
+        data, name = await cover_cache.get(book, w, h, fmt)
+    except Exception as e:
+        print(f"Error rendering cover for book {book_id}: {e}")
+        raise HTTPException(status_code=502, detail="Cover image is unavailable")
+    
+    etag = '"' + name.split(".")[0] + '"'
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=data, media_type=COVER_FORMATS[fmt][1], headers=headers)
+
 # Update book image - FIXED VERSION
 @book_router.put("/{book_id}/image")
 async def update_book_image(
@@ -202,24 +318,18 @@ async def update_book_image(
     if not image or not image.filename:
         raise HTTPException(status_code=400, detail="No image file provided")
     
-    try:
-        # Upload new image
-        image_url = await upload_image_to_cloudinary(image)
-        
-        # Update book with new image
-        await db["books"].update_one(
-            {"_id": ObjectId(book_id)},
-            {"$set": {"image_url": image_url}}
-        )
-        
-        return {
-            "message": "Book image updated successfully", 
-            "image_url": image_url
-        }
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to update image: {str(e)}")
+    # Upload in the background; image_url changes when the job finishes
+    image_job = await image_jobs.accept(image, current_user.get("email"))
+    await db["books"].update_one(
+        {"_id": ObjectId(book_id)},
+        {"$set": {"image_job_id": str(image_job["_id"])}}
+    )
+    job_id = await image_jobs.submit(image_job, "book", book_id)
+    
+    return {
+        "message": "Book image update accepted", 
+        "image_job_id": job_id
+    }
 
 # UPDATE BOOK with optional image - FIXED VERSION
 @book_router.put("/{book_id}")
@@ -275,21 +385,26 @@ async def update_book(
     if category is not None:
         update_data["category"] = category
     
-    # Handle image upload if provided
+    # Handle image upload if provided: accepted now, uploaded in the background
+    image_job = None
     if image and image.filename:
-        try:
-            image_url = await upload_image_to_cloudinary(image)
-            update_data["image_url"] = image_url
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Image upload error: {str(e)}")
+        image_job = await image_jobs.accept(image, current_user.get("email"))
+        update_data["image_job_id"] = str(image_job["_id"])
     
     if update_data:
         await db["books"].update_one(
             {"_id": ObjectId(book_id)},
             {"$set": update_data}
         )
+        catalog_cache.invalidate_book(book_id)
+    
+    if image_job:
+        await image_jobs.submit(image_job, "book", book_id)
     
-    return {"message": "Book updated successfully"}
+    return {
+        "message": "Book updated successfully",
+        "image_job_id": update_data.get("image_job_id")
+    }
 
 # DELETE BOOK
 @book_router.delete("/{book_id}")
@@ -316,17 +431,20 @@ async def delete_book(book_id: str, current_user: dict = Depends(get_current_use
             detail="Cannot delete book that is currently borrowed or has pending requests"
         )
     
-    # Delete image from Cloudinary if exists
-    if existing_book.get("image_url"):
-        try:
-            # Extract public_id from URL
-            image_url = existing_book["image_url"]
-            public_id = image_url.split("/")[-1].split(".")[0]
-            cloudinary.uploader.destroy(f"library_books/{public_id}")
-        except Exception as e:
-            print(f"Error deleting image from Cloudinary: {e}")
-    
-    await db["books"].delete_one({"_id": ObjectId(book_id)})
+    # Release the image the book holds at deletion time, not the one read above:
+    # an image job may have attached a new one since
+    deleted_book = await db["books"].find_one_and_delete(
+        {"_id": ObjectId(book_id)},
+        projection={"image_url": 1, "image_blob": 1, "image_blob_ref": 1}
+    )
+    if not deleted_book:
+        raise HTTPException(status_code=404, detail="Book not found")
+    catalog_cache.invalidate_book(book_id)
+    # The stored image is deleted in the background once nothing references it
+    if deleted_book.get("image_blob"):
+        await release_blob(deleted_book["image_blob"], deleted_book.get("image_blob_ref"))
+    else:
+        await release_legacy_image(deleted_book.get("image_url"))
     return {"message": "Book deleted successfully"}
 
 # UPDATED BORROWING SYSTEM WITH PENDING STATUS
@@ -374,6 +492,7 @@ async def borrow_book(borrow_request: BorrowRequest, current_user: dict = Depend
     # Insert borrow record
     result = await db["borrow_records"].insert_one(borrow_record)
     borrow_record["_id"] = result.inserted_id
+    publish_pending("added", borrow_record)
     
     # Create notification for admin (in real app, you might want to notify admins)
     # For now, we'll just create a notification for the user
@@ -387,7 +506,7 @@ async def borrow_book(borrow_request: BorrowRequest, current_user: dict = Depend
         "is_read": False,
         "created_at": datetime.now()
     }
-    await db["notifications"].insert_one(notification)
+    await create_notification(notification)
     
     # Prepare response
     borrow_record_response = convert_objectid(borrow_record)
@@ -428,6 +547,9 @@ async def return_book(return_request: ReturnRequest, current_user: dict = Depend
     if borrow_record["status"] == BorrowStatus.PENDING:
         raise HTTPException(status_code=400, detail="Cannot return a book that is still pending approval")
     
+    if borrow_record["status"] not in (BorrowStatus.BORROWED, BorrowStatus.OVERDUE):
+        raise HTTPException(status_code=400, detail="Book is not currently borrowed")
+    
     # Calculate fine if overdue
     return_date = datetime.now()
     fine_amount = 0.0
@@ -436,9 +558,13 @@ async def return_book(return_request: ReturnRequest, current_user: dict = Depend
         days_overdue = (return_date - borrow_record["due_date"]).days
         fine_amount = days_overdue * 5.0  # $5 per day fine
     
-    # Update borrow record
-    await db["borrow_records"].update_one(
-        {"_id": ObjectId(return_request.borrow_id)},
+    # Update borrow record; the status guard makes concurrent returns of the
+    # same record release only one copy
+    result = await db["borrow_records"].update_one(
+        {
+            "_id": ObjectId(return_request.borrow_id),
+            "status": {"$in": [BorrowStatus.BORROWED, BorrowStatus.OVERDUE]}
+        },
         {
             "$set": {
                 "return_date": return_date,
@@ -447,15 +573,15 @@ async def return_book(return_request: ReturnRequest, current_user: dict = Depend
             }
         }
     )
+    if result.modified_count == 0:
+        raise HTTPException(status_code=400, detail="Book already returned")
     
-    # Update book available copies
-    await db["books"].update_one(
-        {"_id": ObjectId(borrow_record["book_id"])},
-        {"$inc": {"available_copies": 1}}
-    )
+    # Give the copy back (capped at total_copies) and get the title in the same round trip
+    book = await release_copies(borrow_record["book_id"])
+    catalog_cache.invalidate_book(borrow_record["book_id"])
+    deadlines.cancel(return_request.borrow_id)
     
     # Create return notification
-    book = await db["books"].find_one({"_id": ObjectId(borrow_record["book_id"])})
     notification = {
         "user_email": user_email,
         "title": "Book Returned",
@@ -466,30 +592,29 @@ async def return_book(return_request: ReturnRequest, current_user: dict = Depend
         "is_read": False,
         "created_at": datetime.now()
     }
-    await db["notifications"].insert_one(notification)
+    await create_notification(notification)
     
     return {"message": "Book returned successfully", "fine_amount": fine_amount}
 
 # ADMIN BORROW MANAGEMENT
 @book_router.get("/pending-requests")
-async def get_pending_borrow_requests(current_user: dict = Depends(get_current_user)):
+async def get_pending_borrow_requests(
+    request: Request,
+    page: dict = Depends(page_params),
+    loader: BookLoader = Depends(get_book_loader),
+    current_user: dict = Depends(get_current_user)
+):
     if current_user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    pending_requests = await db["borrow_records"].find({
-        "status": BorrowStatus.PENDING
-    }).sort("request_date", -1).to_list(1000)
+    pending_requests, next_cursor = await paginate(
+        db["borrow_records"], {"status": BorrowStatus.PENDING}, BORROW_SORT, **page
+    )
     
-    # Get book details for each request
-    result = []
-    for request in pending_requests:
-        book = await db["books"].find_one({"_id": ObjectId(request["book_id"])})
-        request = convert_objectid(request)
-        if book:
-            request["book"] = convert_objectid(book)
-        result.append(request)
+    # Attach book details with one batched lookup
+    result = await attach_books(pending_requests, loader)
     
-    return result
+    return etag_response(request, page_response(result, next_cursor))
 
 @book_router.put("/approve-borrow/{borrow_id}")
 async def approve_borrow_request(
@@ -502,64 +627,72 @@ async def approve_borrow_request(
     if not is_valid_objectid(borrow_id):
         raise HTTPException(status_code=400, detail="Invalid borrow ID format")
     
-    # Find borrow record
-    borrow_record = await db["borrow_records"].find_one({
-        "_id": ObjectId(borrow_id),
-        "status": BorrowStatus.PENDING
-    })
+    # Calculate dates
+    borrow_date = datetime.now()
+    due_date = borrow_date + timedelta(days=14)  # Default 14 days
     
-    if not borrow_record:
+    pending = await db["borrow_records"].find_one(
+        {"_id": ObjectId(borrow_id), "status": BorrowStatus.PENDING},
+        {"book_id": 1}
+    )
+    if not pending:
         raise HTTPException(status_code=404, detail="Pending borrow request not found")
     
-    # Check if book is still available
-    book = await db["books"].find_one({"_id": ObjectId(borrow_record["book_id"])})
-    if not book:
-        raise HTTPException(status_code=404, detail="Book not found")
+    # Take a copy before the record becomes BORROWED, so a return can never
+    # give back a copy the loan has not taken yet
+    book = await reserve_copies(pending["book_id"])
     
-    if book["available_copies"] <= 0:
-        # Update borrow status to rejected
-        await db["borrow_records"].update_one(
-            {"_id": ObjectId(borrow_id)},
+    if not book:
+        existing_book = await db["books"].find_one({"_id": ObjectId(pending["book_id"])}, {"title": 1})
+        if not existing_book:
+            raise HTTPException(status_code=404, detail="Book not found")
+        
+        # No copies left: the request is rejected, unless another admin got to it first
+        borrow_record = await db["borrow_records"].find_one_and_update(
+            {"_id": ObjectId(borrow_id), "status": BorrowStatus.PENDING},
             {"$set": {"status": BorrowStatus.REJECTED}}
         )
+        if not borrow_record:
+            raise HTTPException(status_code=404, detail="Pending borrow request not found")
+        publish_pending("removed", borrow_record)
         
         # Create rejection notification
         notification = {
             "user_email": borrow_record["user_email"],
             "title": "Borrow Request Rejected",
-            "message": f"Your borrow request for '{book['title']}' was rejected because no copies are available.",
+            "message": f"Your borrow request for '{existing_book['title']}' was rejected because no copies are available.",
             "type": NotificationType.BORROW_REJECTED,
             "borrow_id": borrow_id,
             "book_id": borrow_record["book_id"],
             "is_read": False,
             "created_at": datetime.now()
         }
-        await db["notifications"].insert_one(notification)
+        await create_notification(notification)
         
         raise HTTPException(status_code=400, detail="No copies available")
     
-    # Calculate dates
-    borrow_date = datetime.now()
-    due_date = borrow_date + timedelta(days=14)  # Default 14 days
-    
-    # Update borrow record
-    await db["borrow_records"].update_one(
-        {"_id": ObjectId(borrow_id)},
+    # Claim the pending request: only one concurrent approval can win it
+    borrow_record = await db["borrow_records"].find_one_and_update(
+        {"_id": ObjectId(borrow_id), "status": BorrowStatus.PENDING},
         {
             "$set": {
                 "status": BorrowStatus.BORROWED,
                 "borrow_date": borrow_date,
                 "due_date": due_date,
-                "approved_date": datetime.now()
+                "approved_date": borrow_date
             }
-        }
+        },
+        return_document=ReturnDocument.AFTER
     )
     
-    # Update book available copies
-    await db["books"].update_one(
-        {"_id": ObjectId(borrow_record["book_id"])},
-        {"$inc": {"available_copies": -1}}
-    )
+    if not borrow_record:
+        # Approved or rejected meanwhile: give the copy back
+        await release_copies(pending["book_id"])
+        raise HTTPException(status_code=404, detail="Pending borrow request not found")
+    
+    catalog_cache.invalidate_book(borrow_record["book_id"])
+    deadlines.schedule(borrow_id, due_date)
+    publish_pending("removed", borrow_record)
     
     # Create approval notification
     notification = {
@@ -572,7 +705,7 @@ async def approve_borrow_request(
         "is_read": False,
         "created_at": datetime.now()
     }
-    await db["notifications"].insert_one(notification)
+    await create_notification(notification)
     
     return {"message": "Borrow request approved successfully"}
 
@@ -587,23 +720,21 @@ async def reject_borrow_request(
     if not is_valid_objectid(borrow_id):
         raise HTTPException(status_code=400, detail="Invalid borrow ID format")
     
-    # Find borrow record
-    borrow_record = await db["borrow_records"].find_one({
-        "_id": ObjectId(borrow_id),
-        "status": BorrowStatus.PENDING
-    })
+    # Reject only while still pending, so a concurrent approve that already
+    # reserved a copy is never overwritten
+    borrow_record = await db["borrow_records"].find_one_and_update(
+        {"_id": ObjectId(borrow_id), "status": BorrowStatus.PENDING},
+        {"$set": {"status": BorrowStatus.REJECTED}}
+    )
     
     if not borrow_record:
+        if await db["borrow_records"].find_one({"_id": ObjectId(borrow_id)}, {"_id": 1}):
+            raise HTTPException(status_code=409, detail="Borrow request is no longer pending")
         raise HTTPException(status_code=404, detail="Pending borrow request not found")
     
+    publish_pending("removed", borrow_record)
     book = await db["books"].find_one({"_id": ObjectId(borrow_record["book_id"])})
     
-    # Update borrow status to rejected
-    await db["borrow_records"].update_one(
-        {"_id": ObjectId(borrow_id)},
-        {"$set": {"status": BorrowStatus.REJECTED}}
-    )
-    
     # Create rejection notification
     notification = {
         "user_email": borrow_record["user_email"],
@@ -615,61 +746,82 @@ async def reject_borrow_request(
         "is_read": False,
         "created_at": datetime.now()
     }
-    await db["notifications"].insert_one(notification)
+    await create_notification(notification)
     
     return {"message": "Borrow request rejected successfully"}
 
 # USER BORROW RECORDS
 @book_router.get("/my-borrows")
-async def get_my_borrowed_books(current_user: dict = Depends(get_current_user)):
+async def get_my_borrowed_books(
+    request: Request,
+    page: dict = Depends(page_params),
+    loader: BookLoader = Depends(get_book_loader),
+    current_user: dict = Depends(get_current_user)
+):
     user_email = current_user.get("email")
     
-    borrow_records = await db["borrow_records"].find({
+    borrow_records, next_cursor = await paginate(db["borrow_records"], {
         "user_email": user_email,
         "status": {"$in": [BorrowStatus.PENDING, BorrowStatus.BORROWED, BorrowStatus.OVERDUE]}
-    }).sort("request_date", -1).to_list(1000)
+    }, BORROW_SORT, **page)
     
-    # Get book details for each borrow record
-    result = []
-    for record in borrow_records:
-        book = await db["books"].find_one({"_id": ObjectId(record["book_id"])})
-        record = convert_objectid(record)
-        if book:
-            record["book"] = convert_objectid(book)
-        result.append(record)
+    # Attach book details with one batched lookup
+    result = await attach_books(borrow_records, loader)
     
-    return result
+    return etag_response(request, page_response(result, next_cursor))
 
 @book_router.get("/borrowing-history")
-async def get_borrowing_history(current_user: dict = Depends(get_current_user)):
+async def get_borrowing_history(
+    request: Request,
+    page: dict = Depends(page_params),
+    loader: BookLoader = Depends(get_book_loader),
+    current_user: dict = Depends(get_current_user)
+):
     user_email = current_user.get("email")
     
-    borrow_records = await db["borrow_records"].find({
+    borrow_records, next_cursor = await paginate(db["borrow_records"], {
         "user_email": user_email,
         "status": {"$in": [BorrowStatus.RETURNED, BorrowStatus.REJECTED]}
-    }).sort("request_date", -1).to_list(1000)
+    }, BORROW_SORT, **page)
     
-    # Get book details for each borrow record
-    result = []
-    for record in borrow_records:
-        book = await db["books"].find_one({"_id": ObjectId(record["book_id"])})
-        record = convert_objectid(record)
-        if book:
-            record["book"] = convert_objectid(book)
-        result.append(record)
+    # Attach book details with one batched lookup
+    result = await attach_books(borrow_records, loader)
     
-    return result
+    return etag_response(request, page_response(result, next_cursor))
 
 # NOTIFICATION SYSTEM
 @book_router.get("/notifications")
-async def get_user_notifications(current_user: dict = Depends(get_current_user)):
+async def get_user_notifications(request: Request, page: dict = Depends(page_params), current_user: dict = Depends(get_current_user)):
     user_email = current_user.get("email")
     
-    notifications = await db["notifications"].find({
-        "user_email": user_email
-    }).sort("created_at", -1).to_list(1000)
+    notifications, next_cursor = await paginate(
+        db["notifications"], {"user_email": user_email}, NOTIFICATION_SORT, **page
+    )
+    
+    return etag_response(request, page_response([convert_objectid(notif) for notif in notifications], next_cursor))
+
+# Badge count, served from the per-user counter instead of scanning notifications
+@book_router.get("/notifications/unread-count")
+async def get_unread_notification_count(request: Request, current_user: dict = Depends(get_current_user)):
+    unread = await get_unread_count(current_user.get("email"))
+    return etag_response(request, {"unread": unread})
+
+# Live notifications (and the pending-queue feed for admins) over WebSocket.
+# Browsers can't set headers on a WebSocket, so the token comes in the query string.
+@book_router.websocket("/notifications/ws")
+async def notifications_socket(
+    websocket: WebSocket,
+    token: str = Query(...),
+    last_id: Optional[str] = None
+):
+    try:
+        current_user = verify_token_string(token)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
     
-    return [convert_objectid(notif) for notif in notifications]
+    await websocket.accept()
+    await serve_notification_socket(websocket, current_user, last_id)
 
 @book_router.put("/notifications/{notification_id}/read")
 async def mark_notification_as_read(
@@ -682,13 +834,15 @@ async def mark_notification_as_read(
         raise HTTPException(status_code=400, detail="Invalid notification ID format")
     
     result = await db["notifications"].update_one(
-        {"_id": ObjectId(notification_id), "user_email": user_email},
+        {"_id": ObjectId(notification_id), "user_email": user_email, "is_read": False},
         {"$set": {"is_read": True}}
     )
     
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Notification not found")
     
+    await remove_unread(user_email)
+    
     return {"message": "Notification marked as read"}
 
 @book_router.delete("/notifications/{notification_id}")
@@ -701,109 +855,104 @@ async def delete_notification(
     if not is_valid_objectid(notification_id):
         raise HTTPException(status_code=400, detail="Invalid notification ID format")
     
-    result = await db["notifications"].delete_one({
-        "_id": ObjectId(notification_id), 
-        "user_email": user_email
-    })
+    notification = await db["notifications"].find_one_and_delete(
+        {"_id": ObjectId(notification_id), "user_email": user_email},
+        projection={"is_read": 1}
+    )
     
-    if result.deleted_count == 0:
+    if notification is None:
         raise HTTPException(status_code=404, detail="Notification not found")
     
+    if not notification.get("is_read", False):
+        await remove_unread(user_email)
+    
     return {"message": "Notification deleted successfully"}
 
 # SCHEDULED NOTIFICATIONS FOR DUE DATES
 @book_router.post("/check-due-dates")
-async def check_due_dates():
+async def check_due_dates(current_user: dict = Depends(get_current_user)):
     """
-    This endpoint should be called by a scheduled task/cron job
+    Run the due-date scan now. It also runs in-process every
+    DUE_DATE_SCAN_INTERVAL seconds, so this is only needed to force a pass.
     """
-    # Find books due in 2 days
-    due_soon_date = datetime.now() + timedelta(days=2)
-    
-    due_soon_books = await db["borrow_records"].find({
-        "status": BorrowStatus.BORROWED,
-        "due_date": {"$lte": due_soon_date, "$gt": datetime.now()}
-    }).to_list(1000)
-    
-    # Find overdue books
-    overdue_books = await db["borrow_records"].find({
-        "status": BorrowStatus.BORROWED,
-        "due_date": {"$lt": datetime.now()}
-    }).to_list(1000)
-    
-    # Create due soon notifications
-    for record in due_soon_books:
-        book = await db["books"].find_one({"_id": ObjectId(record["book_id"])})
-        if book:
-            # Check if notification already exists
-            existing_notif = await db["notifications"].find_one({
-                "borrow_id": str(record["_id"]),
-                "type": NotificationType.DUE_SOON
-            })
-            
-            if not existing_notif:
-                notification = {
-                    "user_email": record["user_email"],
-                    "title": "Book Due Soon",
-                    "message": f"Your book '{book['title']}' is due on {record['due_date'].strftime('%Y-%m-%d')}. Please return it soon.",
-                    "type": NotificationType.DUE_SOON,
-                    "borrow_id": str(record["_id"]),
-                    "book_id": record["book_id"],
-                    "is_read": False,
-                    "created_at": datetime.now()
-                }
-                await db["notifications"].insert_one(notification)
-    
-    # Create overdue notifications
-    for record in overdue_books:
-        book = await db["books"].find_one({"_id": ObjectId(record["book_id"])})
-        if book:
-            # Update status to overdue
-            await db["borrow_records"].update_one(
-                {"_id": record["_id"]},
-                {"$set": {"status": BorrowStatus.OVERDUE}}
-            )
-            
-            # Check if notification already exists
-            existing_notif = await db["notifications"].find_one({
-                "borrow_id": str(record["_id"]),
-                "type": NotificationType.OVERDUE
-            })
-            
-            if not existing_notif:
-                days_overdue = (datetime.now() - record["due_date"]).days
-                notification = {
-                    "user_email": record["user_email"],
-                    "title": "Book Overdue",
-                    "message": f"Your book '{book['title']}' is {days_overdue} day(s) overdue. Please return it immediately.",
-                    "type": NotificationType.OVERDUE,
-                    "borrow_id": str(record["_id"]),
-                    "book_id": record["book_id"],
-                    "is_read": False,
-                    "created_at": datetime.now()
-                }
-                await db["notifications"].insert_one(notification)
-    
-    return {"message": "Due date check completed"}
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    stats = await due_date_scanner.run()
+    return {"message": "Due date check completed", "stats": stats}
+
+@book_router.post("/admin/reconcile-images")
+async def reconcile_images(current_user: dict = Depends(get_current_user)):
+    """
+    Queue the deletion of stored images that nothing references. It also runs
+    in-process every IMAGE_RECONCILE_INTERVAL seconds.
+    """
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    await image_reconciler.run()
+    return {"message": "Image reconciliation completed", "stats": image_reconciler.stats()}
+
+# Apply many approve/reject/return actions in one call
+@book_router.post("/admin/borrow-actions")
+async def bulk_borrow_actions(
+    bulk_request: BulkBorrowActions,
+    current_user: dict = Depends(get_current_user)
+):
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    results, touched_books = await apply_borrow_actions(bulk_request.actions)
+    for book_id in touched_books:
+        catalog_cache.invalidate_book(book_id)
+    
+    return {
+        "processed": sum(1 for result in results if result["ok"]),
+        "failed": sum(1 for result in results if not result["ok"]),
+        "results": results
+    }
+
+# Runtime metrics of the in-process subsystems (per worker)
+@book_router.get("/admin/metrics")
+async def get_metrics(current_user: dict = Depends(get_current_user)):
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return {
+        "notification_outbox": outbox.stats(),
+        "catalog_cache": catalog_cache.stats(),
+        "realtime": hub.stats(),
+        "notification_retention": retention.stats(),
+        "due_date_scanner": due_date_scanner.stats(),
+        "deadlines": deadlines.stats(),
+        "password_hashing": password_hasher.stats(),
+        "token_cache": token_cache.stats(),
+        "token_revocations": revocations.stats(),
+        "image_jobs": image_jobs.stats(),
+        "uploads": upload_budget.stats(),
+        "image_storage": blob_collector.stats(),
+        "cover_cache": cover_cache.stats(),
+        "image_deletions": await deletion_queue.stats(),
+        "image_reconciliation": image_reconciler.stats()
+    }
 
 # Get all borrow records for admin
 @book_router.get("/admin/borrow-records")
-async def get_all_borrow_records(current_user: dict = Depends(get_current_user)):
+async def get_all_borrow_records(
+    request: Request,
+    page: dict = Depends(page_params),
+    loader: BookLoader = Depends(get_book_loader),
+    current_user: dict = Depends(get_current_user)
+):
     if current_user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    borrow_records = await db["borrow_records"].find().sort("request_date", -1).to_list(1000)
+    borrow_records, next_cursor = await paginate(db["borrow_records"], {}, BORROW_SORT, **page)
     
-    # Get book details for each borrow record
-    result = []
-    for record in borrow_records:
-        book = await db["books"].find_one({"_id": ObjectId(record["book_id"])})
-        record = convert_objectid(record)
-        if book:
-            record["book"] = convert_objectid(book)
-        result.append(record)
+    # Attach book details with one batched lookup
+    result = await attach_books(borrow_records, loader)
     
-    return result
+    return etag_response(request, page_response(result, next_cursor))
 
 
 
@@ -884,9 +1033,9 @@ async def get_all_borrow_records(current_user: dict = Depends(get_current_user))
 
 # # Configure Cloudinary
 # cloudinary.config(
-#     cloud_name="dtisam8ot",
-#     api_key="416996345946976",
-#     api_secret="dcfIgNOmXE5GkMyXgOAHnMxVeLg"
+#     cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"),
+#     api_key=os.getenv("CLOUDINARY_API_KEY"),
+#     api_secret=os.getenv("CLOUDINARY_API_SECRET")
 # )
 
 # book_router = APIRouter(prefix="/books", tags=["Books"])
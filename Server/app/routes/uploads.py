@@ -0,0 +1,20 @@
+# routes/uploads.py
+from fastapi import APIRouter, HTTPException, Depends
+from bson import ObjectId
+from app.config.database import db
+from app.utils.auth_handler import get_current_user
+from app.utils.image_jobs import serialize_job
+
+upload_router = APIRouter(prefix="/uploads", tags=["Uploads"])
+
+# IMAGE JOB STATUS (owner or admin)
+@upload_router.get("/jobs/{job_id}")
+async def get_image_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    if not ObjectId.is_valid(job_id):
+        raise HTTPException(status_code=400, detail="Invalid job ID format")
+    
+    job = await db["image_jobs"].find_one({"_id": ObjectId(job_id)})
+    if not job or (current_user.get("role") != "admin" and job.get("owner") != current_user.get("email")):
+        raise HTTPException(status_code=404, detail="Upload job not found")
+    
+    return serialize_job(job)
@@ -1,33 +1,93 @@
 import jwt
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from fastapi import HTTPException, Depends, status, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 import os
+from app.utils.revocation import revocations
 
 load_dotenv()
 SECRET_KEY = os.getenv("JWT_SECRET", "your-fallback-secret-key-change-in-production")
 ALGORITHM = "HS256"
+# Short-lived: clients renew through /auth/refresh
+ACCESS_TOKEN_MINUTES = int(os.getenv("ACCESS_TOKEN_MINUTES", 15))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 10000))
 
 # Create HTTPBearer for token extraction
 security = HTTPBearer()
 
-def create_access_token(data: dict, expires_delta: int = 60):
+def create_access_token(data: dict, expires_delta: int = ACCESS_TOKEN_MINUTES):
     """
     Create a JWT access token
     
     Args:
-        data: Dictionary containing user data (email, role, name)
-        expires_delta: Token expiration time in minutes (default: 60 minutes)
+        data: Dictionary containing user data (email, role, name, session id)
+        expires_delta: Token expiration time in minutes (default: ACCESS_TOKEN_MINUTES)
     """
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=expires_delta)
     to_encode.update({"exp": expire, "iat": datetime.utcnow()})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+class TokenCache:
+    """
+    Bounded LRU of verified tokens -> decoded payloads
+
+    Entries are dropped once the token's exp has passed, so a cached token is
+    never accepted past its expiry. Only tokens that verified are cached.
+    Locked because verify_token is a sync dependency and runs in FastAPI's
+    threadpool.
+    """
+
+    def __init__(self, max_entries: int = TOKEN_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self.misses += 1
+                return None
+            payload, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._entries[token]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return payload
+
+    def put(self, token: str, payload: dict):
+        expires_at = payload.get("exp")
+        with self._lock:
+            self._entries[token] = (payload, expires_at)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+token_cache = TokenCache()
+
 def decode_access_token(token: str):
     """
-    Decode and verify a JWT token
+    Decode and verify a JWT token, reusing the result for repeated tokens
     
     Args:
         token: JWT token string
@@ -35,13 +95,17 @@ def decode_access_token(token: str):
     Returns:
         Decoded token payload if valid, None otherwise
     """
+    payload = token_cache.get(token)
+    if payload is not None:
+        return dict(payload)
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
     except jwt.ExpiredSignatureError:
         return None
     except jwt.InvalidTokenError:
         return None
+    token_cache.put(token, payload)
+    return dict(payload)
 
 def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """
@@ -61,6 +125,12 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
             detail="Invalid or expired token",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if revocations.is_revoked(payload):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token has been revoked",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     return payload
 
 # Alternative verification function that can work with just a token string
@@ -75,6 +145,12 @@ def verify_token_string(token: str):
             detail="Invalid or expired token",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if revocations.is_revoked(payload):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token has been revoked",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     return payload
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
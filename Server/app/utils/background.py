@@ -0,0 +1,30 @@
+import asyncio
+
+async def _run_periodically(name: str, interval: float, job, initial_delay: float):
+    await asyncio.sleep(initial_delay)
+    while True:
+        try:
+            await job()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error in background job {name}: {e}")
+        await asyncio.sleep(interval)
+
+def start_periodic(name: str, interval: float, job, initial_delay: float = None):
+    """
+    Run `job` (a coroutine function) every `interval` seconds until cancelled
+
+    Errors are printed and the loop keeps going. Cancel the returned task on
+    shutdown (see the lifespan in app/main.py).
+    """
+    delay = interval if initial_delay is None else initial_delay
+    return asyncio.create_task(_run_periodically(name, interval, job, delay), name=name)
+
+async def stop_tasks(tasks):
+    """
+    Cancel background tasks and wait for them to finish
+    """
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,170 @@
+import os
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from dotenv import load_dotenv
+from app.config.database import db
+from app.utils.storage import storage
+from app.utils.deletions import enqueue_deletions, deletion_running
+
+load_dotenv()
+# An unreferenced blob is kept this long before it is deleted, so an upload
+# that is about to reuse it does not lose the race
+BLOB_GC_GRACE = float(os.getenv("BLOB_GC_GRACE", 24 * 3600))
+BLOB_GC_INTERVAL = float(os.getenv("BLOB_GC_INTERVAL", 3600))
+BLOB_GC_BATCH = int(os.getenv("BLOB_GC_BATCH", 100))
+
+# blobs: {_id: sha256, key, url, size, content_type, refcount, refs, created_at, last_unreferenced_at}
+#
+# A book's image_blob / a user's profile_image_blob holds one reference.
+# Uploads take their reference before writing the target, and the collector
+# only deletes blobs it can atomically remove with refcount <= 0, so a blob
+# cannot be collected while an upload is attaching it.
+#
+# References are named: an image job takes its reference under its own id,
+# the target records that name next to the blob (image_blob_ref /
+# profile_image_blob_ref), and whoever later replaces or deletes the image
+# releases it by name. Taking or releasing a named reference twice is a
+# no-op, so retried jobs never count a reference twice. (Blobs stored
+# before references were named only carry the refcount.)
+#
+# Stored images are deleted later by the deletion queue, which skips keys
+# that have a blob document. An upload that has to store its image therefore
+# reserves the blob document first (url still None) and only then checks that
+# no deletion of the key is running: either the deletion worker sees the
+# reservation and skips, or the upload sees the deletion and retries after it.
+
+class BlobBusy(Exception):
+    """
+    The stored image for this content is being deleted; retry the upload later
+    """
+
+def _hold(ref: str, on_insert: dict = None):
+    """
+    Update pipeline taking the reference `ref` unless it is already held
+    """
+    refs = {"$ifNull": ["$refs", []]}
+    stage = {
+        "refcount": {"$cond": [
+            {"$in": [ref, refs]},
+            "$refcount",
+            {"$add": [{"$ifNull": ["$refcount", 0]}, 1]},
+        ]},
+        "refs": {"$setUnion": [refs, [ref]]},
+    }
+    for field, value in (on_insert or {}).items():
+        stage[field] = {"$ifNull": [f"${field}", {"$literal": value}]}
+    return [{"$set": stage}]
+
+async def acquire_blob(sha256: str, ref: str):
+    """
+    Take the reference `ref` on an existing, stored blob
+
+    Returns:
+        The blob, or None if no blob has this content stored yet
+    """
+    return await db["blobs"].find_one_and_update(
+        {"_id": sha256, "url": {"$ne": None}},
+        _hold(ref),
+        return_document=ReturnDocument.AFTER
+    )
+
+async def reserve_blob(sha256: str, key: str, size: int, content_type: str, ref: str):
+    """
+    Take the reference `ref` on a blob about to be stored, creating it if needed
+
+    Call store_blob_url once the image is stored under the returned blob's key.
+
+    Raises:
+        BlobBusy: a deletion of the key is running (the reference is dropped)
+    """
+    blob = await db["blobs"].find_one_and_update(
+        {"_id": sha256},
+        _hold(ref, {
+            "key": key,
+            "url": None,
+            "size": size,
+            "content_type": content_type,
+            "created_at": datetime.utcnow(),
+        }),
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    if await deletion_running(blob["key"]):
+        await release_blob(sha256, ref)
+        raise BlobBusy(f"Stored image {blob['key']} is being deleted")
+    return blob
+
+async def store_blob_url(sha256: str, url: str):
+    return await db["blobs"].find_one_and_update(
+        {"_id": sha256},
+        {"$set": {"url": url}},
+        return_document=ReturnDocument.AFTER
+    )
+
+async def adopt_blob_url(url: str, ref: str):
+    """
+    Take the reference `ref` on the blob stored at `url` (a result_url of
+    /books/upload-image), for a book created with that URL
+
+    Returns:
+        The blob, or None if the URL is not a stored blob
+    """
+    if not url:
+        return None
+    return await db["blobs"].find_one_and_update(
+        {"url": url},
+        _hold(ref),
+        return_document=ReturnDocument.AFTER
+    )
+
+async def release_blob(sha256: str, ref: str = None):
+    """
+    Drop the reference `ref` if it is still held (or, without a name, one
+    reference); blobs left without references are collected later
+    """
+    if not sha256:
+        return
+    if ref is None:
+        await db["blobs"].update_one(
+            {"_id": sha256},
+            {"$inc": {"refcount": -1}, "$set": {"last_unreferenced_at": datetime.utcnow()}}
+        )
+        return
+    await db["blobs"].update_one(
+        {"_id": sha256, "refs": ref},
+        {"$pull": {"refs": ref}, "$inc": {"refcount": -1}, "$set": {"last_unreferenced_at": datetime.utcnow()}}
+    )
+
+class BlobCollector:
+    """
+    Removes blobs that have had no references for BLOB_GC_GRACE seconds and
+    queues their stored images for deletion (see app/utils/deletions.py)
+    """
+
+    def __init__(self):
+        self.runs = 0
+        self.collected = 0
+
+    async def run(self):
+        cutoff = datetime.utcnow() - timedelta(seconds=BLOB_GC_GRACE)
+        unreferenced = {"refcount": {"$lte": 0}, "last_unreferenced_at": {"$lt": cutoff}}
+        candidates = await db["blobs"].find(unreferenced, {"_id": 1}).limit(BLOB_GC_BATCH).to_list(BLOB_GC_BATCH)
+        keys = []
+        for candidate in candidates:
+            # Re-checked atomically: a reference taken since the find wins
+            blob = await db["blobs"].find_one_and_delete({"_id": candidate["_id"], **unreferenced})
+            if blob is not None:
+                keys.append(blob["key"])
+        # If this fails the images are orphaned; the reconciliation job finds them
+        await enqueue_deletions(keys, "blob-gc")
+        self.collected += len(keys)
+        self.runs += 1
+
+    def stats(self):
+        return {
+            "backend": storage.name,
+            "gc_runs": self.runs,
+            "gc_collected": self.collected,
+        }
+
+blob_collector = BlobCollector()
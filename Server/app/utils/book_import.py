@@ -0,0 +1,142 @@
+import codecs
+import csv
+import json
+from datetime import datetime
+from itertools import islice
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError
+from app.config.database import db
+from app.models.book import BookCreate
+
+DEFAULT_CHUNK_SIZE = 500
+MAX_CHUNK_SIZE = 5000
+
+def detect_format(filename: str, content_type: str):
+    """
+    Guess the import format from the upload's name or content type
+    """
+    name = (filename or "").lower()
+    content_type = (content_type or "").lower()
+    if name.endswith((".ndjson", ".jsonl")) or "ndjson" in content_type or "jsonl" in content_type:
+        return "ndjson"
+    return "csv"
+
+def iter_rows(fileobj, fmt: str):
+    """
+    Lazily yield (row_number, dict or error message) from a binary file object
+
+    Rows are decoded one line at a time, so only the current line is held in
+    memory regardless of the size of the upload.
+    """
+    text = codecs.getreader("utf-8-sig")(fileobj)
+    if fmt == "ndjson":
+        for row_number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield row_number, f"Invalid JSON: {e}"
+                continue
+            yield row_number, row if isinstance(row, dict) else "Each line must be a JSON object"
+    else:
+        reader = csv.DictReader(text)
+        for row_number, row in enumerate(reader, start=1):
+            # Empty CSV cells mean "not provided" for optional fields
+            yield row_number, {key: value for key, value in row.items() if key and value not in ("", None)}
+
+def validate_row(row):
+    """
+    Validate a raw row against BookCreate and build the book document
+
+    Returns:
+        (book document, None) if valid, (None, error message) otherwise
+    """
+    if isinstance(row, str):
+        return None, row
+    try:
+        book = BookCreate(**row)
+    except ValidationError as e:
+        errors = "; ".join(f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors())
+        return None, errors
+    if book.available_copies > book.total_copies:
+        return None, "Available copies cannot exceed total copies"
+
+    book_dict = book.dict()
+    book_dict["created_at"] = datetime.now()
+    return book_dict, None
+
+async def import_books(fileobj, fmt: str, chunk_size: int = DEFAULT_CHUNK_SIZE, ordered: bool = False):
+    """
+    Import books chunk by chunk and yield one report dict per row, then a summary
+
+    Each chunk costs one $in query for ISBN dedupe and one insert_many. With
+    ordered=True the import stops at the first failed insert, like an ordered
+    insert_many would.
+    """
+    rows = iter_rows(fileobj, fmt)
+    seen_isbns = set()
+    summary = {"inserted": 0, "duplicate": 0, "invalid": 0, "failed": 0, "skipped": 0}
+    aborted = False
+
+    while not aborted:
+        # Parsing touches the (possibly disk-spooled) upload, keep it off the event loop
+        chunk = await run_in_threadpool(lambda: list(islice(rows, chunk_size)))
+        if not chunk:
+            break
+
+        reports = []
+        pending = []
+        for row_number, row in chunk:
+            book_dict, error = validate_row(row)
+            if error:
+                reports.append({"row": row_number, "status": "invalid", "error": error})
+                continue
+            if book_dict["isbn"] in seen_isbns:
+                reports.append({"row": row_number, "status": "duplicate", "isbn": book_dict["isbn"]})
+                continue
+            seen_isbns.add(book_dict["isbn"])
+            report = {"row": row_number, "status": "pending", "isbn": book_dict["isbn"]}
+            reports.append(report)
+            pending.append((report, book_dict))
+
+        if pending:
+            existing = await db["books"].find(
+                {"isbn": {"$in": [book_dict["isbn"] for _, book_dict in pending]}},
+                {"isbn": 1}
+            ).to_list(None)
+            existing_isbns = {book["isbn"] for book in existing}
+            for report, _ in pending:
+                if report["isbn"] in existing_isbns:
+                    report["status"] = "duplicate"
+            pending = [(report, book_dict) for report, book_dict in pending if report["status"] == "pending"]
+
+        if pending:
+            docs = [book_dict for _, book_dict in pending]
+            failed = {}
+            try:
+                await db["books"].insert_many(docs, ordered=ordered)
+            except BulkWriteError as e:
+                failed = {err["index"]: err.get("errmsg", "Insert failed") for err in e.details.get("writeErrors", [])}
+                aborted = ordered
+
+            first_failure = min(failed) if failed else None
+            for index, (report, book_dict) in enumerate(pending):
+                if index in failed:
+                    duplicate = "E11000" in failed[index]
+                    report["status"] = "duplicate" if duplicate else "failed"
+                    if not duplicate:
+                        report["error"] = failed[index]
+                elif ordered and first_failure is not None and index > first_failure:
+                    report["status"] = "skipped"
+                else:
+                    report["status"] = "inserted"
+                    report["id"] = str(book_dict["_id"])
+
+        for report in reports:
+            summary[report["status"]] += 1
+            yield report
+
+    summary["aborted"] = aborted
+    yield {"summary": summary}
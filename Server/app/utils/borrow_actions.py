@@ -0,0 +1,206 @@
+import asyncio
+from collections import defaultdict
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import UpdateOne
+from app.config.database import db
+from app.models.book import BorrowAction, BorrowStatus, NotificationType
+from app.utils.deadlines import deadlines
+from app.utils.hydration import BookLoader
+from app.utils.inventory import release_copies, reserve_up_to
+from app.utils.notifications import build_notification, create_notifications
+from app.utils.realtime import publish_pending
+
+ACTIVE_STATUSES = [BorrowStatus.BORROWED, BorrowStatus.OVERDUE]
+
+def _now():
+    # Mongo stores milliseconds; truncate so values read back compare equal
+    now = datetime.now()
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+async def apply_borrow_actions(actions):
+    """
+    Apply a batch of approve/reject/return actions with a fixed number of queries
+
+    Records are read with one $in query and transitioned with one status-guarded
+    bulk_write. Inventory is then adjusted once per book (returns first, so the
+    copies they free can be lent out again), approvals that could not get a copy
+    are compensated to rejected, and every notification goes out in one insert_many.
+
+    Returns:
+        One result dict per action, in request order
+    """
+    results = []
+    seen = set()
+    object_ids = []
+    for item in actions:
+        result = {"borrow_id": item.borrow_id, "action": item.action.value, "ok": False}
+        results.append(result)
+        if item.borrow_id in seen:
+            result["error"] = "Duplicate action for this borrow record"
+            continue
+        seen.add(item.borrow_id)
+        try:
+            object_ids.append(ObjectId(item.borrow_id))
+        except Exception:
+            result["error"] = "Invalid borrow ID format"
+
+    records = await db["borrow_records"].find({"_id": {"$in": object_ids}}).to_list(None)
+    records = {str(record["_id"]): record for record in records}
+
+    now = _now()
+    due_date = now + timedelta(days=14)  # Default 14 days
+    ops = []
+    planned = []
+    for item, result in zip(actions, results):
+        if "error" in result:
+            continue
+        record = records.get(item.borrow_id)
+        if record is None:
+            result["error"] = "Borrow record not found"
+            continue
+        try:
+            ObjectId(record["book_id"])
+        except Exception:
+            result["error"] = "Invalid book ID on borrow record"
+            continue
+
+        if item.action in (BorrowAction.APPROVE, BorrowAction.REJECT):
+            if record["status"] != BorrowStatus.PENDING:
+                result["error"] = "Pending borrow request not found"
+                continue
+            if item.action == BorrowAction.APPROVE:
+                update = {
+                    "status": BorrowStatus.BORROWED,
+                    "borrow_date": now,
+                    "due_date": due_date,
+                    "approved_date": now
+                }
+            else:
+                update = {"status": BorrowStatus.REJECTED}
+            ops.append(UpdateOne({"_id": record["_id"], "status": BorrowStatus.PENDING}, {"$set": update}))
+        else:
+            if record["status"] not in ACTIVE_STATUSES:
+                result["error"] = "Book is not currently borrowed"
+                continue
+            fine_amount = 0.0
+            if record.get("due_date") and now > record["due_date"]:
+                fine_amount = (now - record["due_date"]).days * 5.0  # $5 per day fine
+            record["fine_amount"] = fine_amount
+            update = {"return_date": now, "status": BorrowStatus.RETURNED, "fine_amount": fine_amount}
+            ops.append(UpdateOne({"_id": record["_id"], "status": {"$in": ACTIVE_STATUSES}}, {"$set": update}))
+        planned.append((item.action, record, result))
+
+    if ops:
+        write = await db["borrow_records"].bulk_write(ops, ordered=False)
+        if write.modified_count < len(ops):
+            # Some records changed under us; keep only the transitions we made
+            current = await db["borrow_records"].find(
+                {"_id": {"$in": [record["_id"] for _, record, _ in planned]}},
+                {"status": 1, "approved_date": 1, "return_date": 1}
+            ).to_list(None)
+            current = {doc["_id"]: doc for doc in current}
+            won = []
+            for action, record, result in planned:
+                doc = current.get(record["_id"], {})
+                if action == BorrowAction.APPROVE:
+                    ours = doc.get("status") == BorrowStatus.BORROWED and doc.get("approved_date") == now
+                elif action == BorrowAction.REJECT:
+                    ours = doc.get("status") == BorrowStatus.REJECTED
+                else:
+                    ours = doc.get("status") == BorrowStatus.RETURNED and doc.get("return_date") == now
+                if ours:
+                    won.append((action, record, result))
+                else:
+                    result["error"] = "Borrow record was changed by another request"
+            planned = won
+
+    # Inventory, aggregated per book
+    returns = defaultdict(list)
+    approvals = defaultdict(list)
+    for action, record, result in planned:
+        if action == BorrowAction.RETURN:
+            returns[record["book_id"]].append((record, result))
+        elif action == BorrowAction.APPROVE:
+            approvals[record["book_id"]].append((record, result))
+
+    titles = {}
+    released = await asyncio.gather(*[release_copies(book_id, len(items)) for book_id, items in returns.items()])
+    for book_id, book in zip(returns, released):
+        if book:
+            titles[book_id] = book["title"]
+
+    compensations = []
+    reserved = await asyncio.gather(*[reserve_up_to(book_id, len(items)) for book_id, items in approvals.items()])
+    for (book_id, items), (book, granted) in zip(approvals.items(), reserved):
+        if book:
+            titles[book_id] = book["title"]
+        for index, (record, result) in enumerate(items):
+            if index < granted:
+                continue
+            claimed = {"_id": record["_id"], "status": BorrowStatus.BORROWED, "approved_date": now}
+            if book is None:
+                revert = {"status": BorrowStatus.PENDING, "borrow_date": None, "due_date": None, "approved_date": None}
+                result["error"] = "Book not found"
+            else:
+                revert = {"status": BorrowStatus.REJECTED, "borrow_date": None, "due_date": None, "approved_date": None}
+                result["rejected"] = True
+            compensations.append(UpdateOne(claimed, {"$set": revert}))
+    if compensations:
+        await db["borrow_records"].bulk_write(compensations, ordered=False)
+
+    missing_titles = [record["book_id"] for _, record, _ in planned if record["book_id"] not in titles]
+    if missing_titles:
+        books = await BookLoader().load_many(missing_titles)
+        titles.update({book_id: book["title"] for book_id, book in books.items() if book})
+
+    notifications = []
+    for action, record, result in planned:
+        if result.get("error"):
+            continue
+        title = titles.get(record["book_id"], "the book")
+        if action == BorrowAction.APPROVE and not result.get("rejected"):
+            result["status"] = BorrowStatus.BORROWED.value
+            deadlines.schedule(str(record["_id"]), due_date)
+            notifications.append(build_notification(
+                record, "Borrow Request Approved",
+                f"Your borrow request for '{title}' has been approved. Due date: {due_date.strftime('%Y-%m-%d')}",
+                NotificationType.BORROW_APPROVED
+            ))
+        elif action == BorrowAction.APPROVE:
+            # Same outcome as the single approve endpoint: rejected, reported as an error
+            result.pop("rejected")
+            result["status"] = BorrowStatus.REJECTED.value
+            result["error"] = "No copies available"
+            notifications.append(build_notification(
+                record, "Borrow Request Rejected",
+                f"Your borrow request for '{title}' was rejected because no copies are available.",
+                NotificationType.BORROW_REJECTED
+            ))
+            continue
+        elif action == BorrowAction.REJECT:
+            result["status"] = BorrowStatus.REJECTED.value
+            notifications.append(build_notification(
+                record, "Borrow Request Rejected",
+                f"Your borrow request for '{title}' was rejected.",
+                NotificationType.BORROW_REJECTED
+            ))
+        else:
+            result["status"] = BorrowStatus.RETURNED.value
+            deadlines.cancel(str(record["_id"]))
+            result["fine_amount"] = record["fine_amount"]
+            notifications.append(build_notification(
+                record, "Book Returned",
+                f"You have successfully returned '{title}'. Fine amount: ${record['fine_amount']}",
+                NotificationType.BOOK_RETURNED
+            ))
+        result["ok"] = True
+
+    await create_notifications(notifications)
+
+    for action, record, result in planned:
+        if action != BorrowAction.RETURN and result.get("status"):
+            publish_pending("removed", record)
+
+    touched_books = set(returns) | set(approvals)
+    return results, touched_books
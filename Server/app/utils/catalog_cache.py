@@ -0,0 +1,124 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from bson import ObjectId
+from dotenv import load_dotenv
+
+load_dotenv()
+CATALOG_CACHE_TTL = float(os.getenv("CATALOG_CACHE_TTL", 30))
+CATALOG_CACHE_MAX_STALE = float(os.getenv("CATALOG_CACHE_MAX_STALE", 300))
+CATALOG_CACHE_MAX_ENTRIES = int(os.getenv("CATALOG_CACHE_MAX_ENTRIES", 256))
+
+class _Entry:
+    __slots__ = ("value", "fetched_at", "low", "high")
+
+    def __init__(self, value, low, high):
+        self.value = value
+        self.fetched_at = time.monotonic()
+        # Range of book _ids covered by this page: (low, high], None = unbounded
+        self.low = low
+        self.high = high
+
+    def covers(self, book_id: ObjectId):
+        return (self.low is None or book_id > self.low) and (self.high is None or book_id <= self.high)
+
+def _report_refresh_error(task):
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Error refreshing catalog cache: {task.exception()}")
+
+class CatalogCache:
+    """
+    In-process read cache for the paginated catalog listings
+
+    Entries are fresh for `ttl` seconds. After that they are served stale for
+    up to `max_stale` more seconds while a single background task reloads them,
+    so a slow or briefly unreachable Mongo does not stall browsing. Mutations
+    drop exactly the pages whose _id range contains the changed book.
+
+    The cache is per process; with several workers, other processes pick up a
+    change when their own entries go stale.
+    """
+
+    def __init__(self, ttl=CATALOG_CACHE_TTL, max_stale=CATALOG_CACHE_MAX_STALE, max_entries=CATALOG_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._generation = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    async def get(self, key, loader, low=None):
+        """
+        Return the cached page for `key`, loading it with `loader` when needed
+
+        Args:
+            key: Hashable cache key (listing name, cursor, limit)
+            loader: Coroutine function returning (value, high) where high is the
+                last _id on the page, or None on the last page
+            low: _id the page starts after, None for the first page
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = time.monotonic() - entry.fetched_at
+            if age < self.ttl:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return entry.value
+            if age < self.ttl + self.max_stale:
+                self.stale_hits += 1
+                if key not in self._inflight:
+                    task = asyncio.create_task(self._load(key, loader, low))
+                    task.add_done_callback(_report_refresh_error)
+                    self._inflight[key] = task
+                return entry.value
+
+        self.misses += 1
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._load(key, loader, low))
+            self._inflight[key] = task
+        return await asyncio.shield(task)
+
+    async def _load(self, key, loader, low):
+        generation = self._generation
+        try:
+            value, high = await loader()
+            # Don't store a result that raced with an invalidation
+            if generation == self._generation:
+                self._entries[key] = _Entry(value, low, high)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def invalidate_book(self, book_id):
+        """
+        Drop every cached page whose _id range contains `book_id`
+        """
+        try:
+            book_id = ObjectId(book_id)
+        except Exception:
+            return self.invalidate_all()
+        self._generation += 1
+        for key in [key for key, entry in self._entries.items() if entry.covers(book_id)]:
+            del self._entries[key]
+
+    def invalidate_all(self):
+        self._generation += 1
+        self._entries.clear()
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+        }
+
+catalog_cache = CatalogCache()
@@ -0,0 +1,193 @@
+import asyncio
+import hashlib
+import io
+import os
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageOps
+from dotenv import load_dotenv
+from app.utils.storage import storage
+
+load_dotenv()
+COVER_CACHE_DIR = os.getenv("COVER_CACHE_DIR", os.path.join(tempfile.gettempdir(), "library_covers"))
+COVER_CACHE_MAX_BYTES = int(os.getenv("COVER_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+COVER_WORKERS = int(os.getenv("COVER_WORKERS", 2))
+COVER_QUALITY = int(os.getenv("COVER_QUALITY", 80))
+# Originals are at most 5MB (see MAX_IMAGE_SIZE); legacy URLs get the same bound
+COVER_MAX_SOURCE_BYTES = 5 * 1024 * 1024
+COVER_MIN_DIMENSION = 16
+COVER_MAX_DIMENSION = 1024
+
+# Sizes the app asks for; list responses link to these
+COVER_VARIANTS = {
+    "thumb": (160, 240),
+    "medium": (480, 720),
+}
+COVER_FORMATS = {
+    "jpeg": ("JPEG", "image/jpeg"),
+    "webp": ("WEBP", "image/webp"),
+    "png": ("PNG", "image/png"),
+}
+# Variant URLs carry the image version, so their content never changes
+COVER_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Requests without (or with an outdated) version only get a short lifetime
+COVER_SHORT_CACHE_CONTROL = "public, max-age=300"
+
+def cover_version(book: dict):
+    """
+    Identifies the book's current image: its blob digest, or a hash of a legacy URL
+    """
+    if book.get("image_blob"):
+        return book["image_blob"][:16]
+    if book.get("image_url"):
+        return hashlib.sha256(book["image_url"].encode()).hexdigest()[:16]
+    return None
+
+def cover_variant_urls(book: dict, fmt: str = "jpeg"):
+    """
+    Relative URLs of the standard cover variants, or None if the book has no image
+    """
+    version = cover_version(book)
+    if version is None:
+        return None
+    return {
+        name: f"/books/{book['_id']}/cover?w={width}&h={height}&fmt={fmt}&v={version}"
+        for name, (width, height) in COVER_VARIANTS.items()
+    }
+
+def attach_cover_variants(book: dict):
+    """
+    Add image_variants (see cover_variant_urls) to a serialized book
+    """
+    book["image_variants"] = cover_variant_urls(book)
+    return book
+
+def _render(source: bytes, width: int, height: int, fmt: str):
+    image = Image.open(io.BytesIO(source))
+    image = ImageOps.exif_transpose(image)
+    # Fit inside the box, keeping the aspect ratio; never upscale
+    image.thumbnail((width, height), Image.LANCZOS)
+    pil_format, _ = COVER_FORMATS[fmt]
+    if pil_format == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    out = io.BytesIO()
+    if pil_format == "PNG":
+        image.save(out, pil_format, optimize=True)
+    else:
+        image.save(out, pil_format, quality=COVER_QUALITY, optimize=pil_format == "JPEG")
+    return out.getvalue()
+
+class CoverCache:
+    """
+    Resized cover variants, rendered once and kept in a size-bounded disk LRU
+
+    Files live in COVER_CACHE_DIR named by a hash of (image version, size,
+    format); recency is tracked in memory and seeded from file mtimes at
+    startup. Concurrent requests for a missing variant share one render.
+    """
+
+    def __init__(self, directory: str = COVER_CACHE_DIR, max_bytes: int = COVER_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._pending = {}
+        self._loaded = False
+        self._executor = ThreadPoolExecutor(max_workers=COVER_WORKERS, thread_name_prefix="cover")
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _load(self):
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".tmp") or not os.path.isfile(path):
+                continue
+            stat = os.stat(path)
+            files.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self._bytes += size
+        self._loaded = True
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._entries:
+            name, size = self._entries.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    def _store(self, name: str, data: bytes):
+        path = os.path.join(self.directory, name)
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+
+    def _read(self, name: str):
+        with open(os.path.join(self.directory, name), "rb") as f:
+            return f.read()
+
+    async def get(self, book: dict, width: int, height: int, fmt: str):
+        """
+        Returns:
+            (variant bytes, cache name usable as an ETag)
+        """
+        loop = asyncio.get_running_loop()
+        if not self._loaded:
+            await loop.run_in_executor(self._executor, self._load)
+
+        key = f"{cover_version(book)}:{width}x{height}:{fmt}"
+        name = hashlib.sha256(key.encode()).hexdigest()[:32] + "." + fmt
+        if name in self._entries:
+            try:
+                data = await loop.run_in_executor(self._executor, self._read, name)
+                self._entries.move_to_end(name)
+                self.hits += 1
+                return data, name
+            except FileNotFoundError:
+                self._bytes -= self._entries.pop(name)
+
+        task = self._pending.get(name)
+        if task is None:
+            self.misses += 1
+            # Its own task, so a requester going away does not cancel the render
+            # for everyone else sharing it
+            task = asyncio.create_task(self._render_variant(book["image_url"], name, width, height, fmt))
+            self._pending[name] = task
+            task.add_done_callback(lambda done: self._finished(name, done))
+        return await asyncio.shield(task), name
+
+    def _finished(self, name: str, task: asyncio.Task):
+        if self._pending.get(name) is task:
+            del self._pending[name]
+        # Retrieve the outcome so a failure every requester abandoned is not logged
+        if not task.cancelled():
+            task.exception()
+
+    async def _render_variant(self, image_url: str, name: str, width: int, height: int, fmt: str):
+        loop = asyncio.get_running_loop()
+        source = await loop.run_in_executor(self._executor, storage.read, image_url, COVER_MAX_SOURCE_BYTES)
+        data = await loop.run_in_executor(self._executor, _render, source, width, height, fmt)
+        await loop.run_in_executor(self._executor, self._store, name, data)
+        self._entries[name] = len(data)
+        self._bytes += len(data)
+        self._evict()
+        return data
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+cover_cache = CoverCache()
@@ -0,0 +1,144 @@
+import asyncio
+import heapq
+import itertools
+import os
+from datetime import datetime
+from bson import ObjectId
+from dotenv import load_dotenv
+from app.config.database import db
+from app.models.book import BorrowStatus
+from app.utils.due_dates import due_date_scanner, DUE_SOON_WINDOW
+
+load_dotenv()
+# Upper bound on one sleep, so wall-clock jumps are noticed
+DEADLINE_MAX_SLEEP = float(os.getenv("DEADLINE_MAX_SLEEP", 300))
+
+DUE_SOON = "due_soon"
+OVERDUE = "overdue"
+
+class DeadlineScheduler:
+    """
+    In-memory min-heap of borrow deadlines
+
+    Every borrowed record has two entries: its due-soon reminder time
+    (due_date - DUE_SOON_WINDOW) and its due date. A single task sleeps until
+    the earliest one and hands whatever is due to the due-date scanner, so
+    transitions happen on time instead of at the next scan.
+
+    The heap is loaded from borrow_records at startup and kept current by
+    schedule() (approvals) and cancel() (returns). Cancelled entries are left
+    in the heap and skipped when popped. Each worker keeps its own heap;
+    firing is idempotent, and the periodic full scan catches anything a
+    worker did not see.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._deadlines = {}
+        self._seq = itertools.count()
+        self._wake = asyncio.Event()
+        self._task = None
+        self.loaded = 0
+        self.fired_due_soon = 0
+        self.fired_overdue = 0
+        self.max_lateness_ms = 0.0
+
+    def schedule(self, borrow_id: str, due_date: datetime, remind: bool = True):
+        """
+        (Re)schedule the deadlines of a borrowed record
+        """
+        self._deadlines[borrow_id] = due_date
+        if remind:
+            self._push(due_date - DUE_SOON_WINDOW, borrow_id, DUE_SOON, due_date)
+        self._push(due_date, borrow_id, OVERDUE, due_date)
+
+    def cancel(self, borrow_id: str):
+        """
+        Forget a record's deadlines (returned, or otherwise no longer borrowed)
+        """
+        self._deadlines.pop(borrow_id, None)
+
+    def _push(self, fire_at: datetime, borrow_id: str, kind: str, due_date: datetime):
+        earliest = self._heap[0][0] if self._heap else None
+        heapq.heappush(self._heap, (fire_at, next(self._seq), borrow_id, kind, due_date))
+        if earliest is None or fire_at < earliest:
+            self._wake.set()
+
+    async def load(self):
+        """
+        Schedule every borrowed record. Reminders already sent are not rescheduled.
+        """
+        cursor = db["borrow_records"].find(
+            {"status": BorrowStatus.BORROWED},
+            {"due_date": 1, "due_soon_notified": 1}
+        ).batch_size(1000)
+        count = 0
+        async for record in cursor:
+            if record.get("due_date"):
+                self.schedule(str(record["_id"]), record["due_date"], not record.get("due_soon_notified"))
+                count += 1
+        self.loaded = count
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="deadline-scheduler")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    def _pop_due(self, now: datetime):
+        due = {DUE_SOON: [], OVERDUE: []}
+        while self._heap and self._heap[0][0] <= now:
+            fire_at, _, borrow_id, kind, due_date = heapq.heappop(self._heap)
+            # Skip entries that were cancelled or superseded by a reschedule
+            if self._deadlines.get(borrow_id) != due_date:
+                continue
+            if kind == OVERDUE:
+                self._deadlines.pop(borrow_id, None)
+            due[kind].append(ObjectId(borrow_id))
+            lateness = (now - fire_at).total_seconds() * 1000
+            self.max_lateness_ms = max(self.max_lateness_ms, lateness)
+        return due
+
+    async def _run(self):
+        try:
+            await self.load()
+        except Exception as e:
+            print(f"Error loading borrow deadlines: {e}")
+
+        while True:
+            self._wake.clear()
+            due = self._pop_due(datetime.now())
+            try:
+                if due[DUE_SOON]:
+                    self.fired_due_soon += await due_date_scanner.fire_due_soon(due[DUE_SOON])
+                if due[OVERDUE]:
+                    self.fired_overdue += await due_date_scanner.fire_overdue(due[OVERDUE])
+            except Exception as e:
+                print(f"Error firing borrow deadlines: {e}")
+
+            timeout = DEADLINE_MAX_SLEEP
+            if self._heap:
+                until_next = (self._heap[0][0] - datetime.now()).total_seconds()
+                timeout = max(0.0, min(timeout, until_next))
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self):
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "tracked_records": len(self._deadlines),
+            "heap_entries": len(self._heap),
+            "loaded_at_startup": self.loaded,
+            "fired_due_soon": self.fired_due_soon,
+            "fired_overdue": self.fired_overdue,
+            "max_lateness_ms": round(self.max_lateness_ms, 2),
+        }
+
+deadlines = DeadlineScheduler()
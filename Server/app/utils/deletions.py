@@ -0,0 +1,290 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import UpdateOne
+from dotenv import load_dotenv
+from app.config.database import db
+from app.utils.storage import storage
+
+load_dotenv()
+DELETION_BATCH = int(os.getenv("DELETION_BATCH", 100))
+DELETION_MAX_ATTEMPTS = int(os.getenv("DELETION_MAX_ATTEMPTS", 8))
+# Seconds before the first retry; doubled on every further attempt, up to DELETION_MAX_BACKOFF
+DELETION_BACKOFF = float(os.getenv("DELETION_BACKOFF", 30))
+DELETION_MAX_BACKOFF = float(os.getenv("DELETION_MAX_BACKOFF", 6 * 3600))
+DELETION_LEASE = float(os.getenv("DELETION_LEASE", 300))
+DELETION_POLL_INTERVAL = float(os.getenv("DELETION_POLL_INTERVAL", 30))
+IMAGE_RECONCILE_INTERVAL = float(os.getenv("IMAGE_RECONCILE_INTERVAL", 24 * 3600))
+# Assets younger than this are left alone, so uploads that are still being
+# attached to a book or user are never mistaken for orphans
+IMAGE_RECONCILE_MIN_AGE = float(os.getenv("IMAGE_RECONCILE_MIN_AGE", 24 * 3600))
+# Folders image_jobs.submit() stores into
+IMAGE_FOLDERS = ("library_books", "user_profiles")
+
+QUEUED = "queued"
+RUNNING = "running"
+FAILED = "failed"
+
+# deletion_queue: {_id: storage key, status, reason, attempts, next_attempt_at,
+#                  lease_owner, lease_until, error, created_at, updated_at}
+#
+# Entries are keyed by the storage key, so a key is queued at most once.
+# Deleted entries are removed; entries that run out of attempts stay FAILED
+# until the reconciliation job finds the asset again and re-queues it.
+
+def _due(now: datetime):
+    return {"$or": [
+        {"status": QUEUED, "next_attempt_at": {"$lte": now}},
+        {"status": RUNNING, "lease_until": {"$lt": now}},
+    ]}
+
+async def enqueue_deletions(keys: list, reason: str):
+    """
+    Queue storage keys for deletion by the background worker
+    """
+    keys = list(dict.fromkeys(key for key in keys if key))
+    if not keys:
+        return
+    now = datetime.utcnow()
+    await db["deletion_queue"].bulk_write([
+        UpdateOne(
+            {"_id": key},
+            {"$setOnInsert": {
+                "status": QUEUED,
+                "reason": reason,
+                "attempts": 0,
+                "next_attempt_at": now,
+                "error": None,
+                "created_at": now,
+                "updated_at": now,
+            }},
+            upsert=True
+        )
+        for key in keys
+    ], ordered=False)
+    # Give up-for-now entries another full round of attempts
+    await db["deletion_queue"].update_many(
+        {"_id": {"$in": keys}, "status": FAILED},
+        {"$set": {"status": QUEUED, "attempts": 0, "next_attempt_at": now, "updated_at": now}}
+    )
+    deletion_queue.notify()
+
+async def deletion_running(key: str):
+    """
+    Whether a worker has claimed the deletion of `key` and may be deleting it now
+    """
+    return await db["deletion_queue"].find_one({"_id": key, "status": RUNNING}, {"_id": 1}) is not None
+
+async def release_legacy_image(url: str):
+    """
+    Queue the deletion of an image stored before blobs existed, once no book
+    or user points at its URL any more
+    """
+    if not url:
+        return
+    key = storage.key_for_url(url)
+    if key is None:
+        return
+    # The same asset may have been adopted as a blob; release_blob owns it then
+    if await db["blobs"].find_one({"key": key}, {"_id": 1}):
+        return
+    if await db["books"].find_one({"image_url": url}, {"_id": 1}):
+        return
+    if await db["users"].find_one({"profile_image": url}, {"_id": 1}):
+        return
+    await enqueue_deletions([key], "legacy")
+
+class DeletionQueue:
+    """
+    Drains deletion_queue in batches through storage.delete_many
+
+    A batch is claimed with a lease (so several app workers can drain the
+    queue side by side and a crashed worker's batch is retried), keys that
+    became referenced again by a blob are dropped, and failures are retried
+    with capped exponential backoff.
+    """
+
+    def __init__(self):
+        self._wake = asyncio.Event()
+        self._task = None
+        self.deleted = 0
+        self.skipped = 0
+        self.retried = 0
+        self.failed = 0
+
+    def notify(self):
+        self._wake.set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="image-deletions")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            # Cleared before claiming, so an enqueue racing with the claim still wakes us
+            self._wake.clear()
+            try:
+                claimed = await self.drain_batch()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error draining deletion queue: {e}")
+                claimed = 0
+            if claimed >= DELETION_BATCH:
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), DELETION_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _claim(self):
+        now = datetime.utcnow()
+        candidates = await db["deletion_queue"].find(_due(now), {"_id": 1}) \
+            .sort("next_attempt_at", 1).limit(DELETION_BATCH).to_list(DELETION_BATCH)
+        if not candidates:
+            return None, []
+        owner = ObjectId()
+        ids = [candidate["_id"] for candidate in candidates]
+        # Re-checks the due condition, so entries another worker claimed meanwhile are left out
+        await db["deletion_queue"].update_many(
+            {"_id": {"$in": ids}, **_due(now)},
+            {
+                "$set": {
+                    "status": RUNNING,
+                    "lease_owner": owner,
+                    "lease_until": now + timedelta(seconds=DELETION_LEASE),
+                    "updated_at": now,
+                },
+                "$inc": {"attempts": 1},
+            }
+        )
+        entries = await db["deletion_queue"].find({"_id": {"$in": ids}, "lease_owner": owner}).to_list(None)
+        return owner, entries
+
+    async def drain_batch(self):
+        """
+        Claim and process one batch
+
+        Returns:
+            Number of entries claimed
+        """
+        owner, entries = await self._claim()
+        if not entries:
+            return 0
+
+        keys = [entry["_id"] for entry in entries]
+        # Checked after claiming: an upload reserving one of these keys from
+        # now on sees the claim and waits (see app/utils/blobs.py)
+        in_use = set(await db["blobs"].distinct("key", {"key": {"$in": keys}}))
+        if in_use:
+            await db["deletion_queue"].delete_many({"_id": {"$in": list(in_use)}, "lease_owner": owner})
+            self.skipped += len(in_use)
+        keys = [key for key in keys if key not in in_use]
+
+        loop = asyncio.get_running_loop()
+        try:
+            errors = await loop.run_in_executor(None, storage.delete_many, keys) if keys else {}
+        except Exception as e:
+            errors = {key: str(e) for key in keys}
+
+        done = [key for key in keys if key not in errors]
+        if done:
+            await db["deletion_queue"].delete_many({"_id": {"$in": done}, "lease_owner": owner})
+            self.deleted += len(done)
+
+        now = datetime.utcnow()
+        updates = []
+        for entry in entries:
+            key = entry["_id"]
+            if key not in errors:
+                continue
+            if entry["attempts"] >= DELETION_MAX_ATTEMPTS:
+                print(f"Giving up deleting image {key} after {entry['attempts']} attempts: {errors[key]}")
+                change = {"status": FAILED}
+                self.failed += 1
+            else:
+                delay = min(DELETION_BACKOFF * 2 ** (entry["attempts"] - 1), DELETION_MAX_BACKOFF)
+                change = {"status": QUEUED, "next_attempt_at": now + timedelta(seconds=delay)}
+                self.retried += 1
+            change.update({"error": errors[key], "updated_at": now})
+            updates.append(UpdateOne({"_id": key, "lease_owner": owner}, {"$set": change}))
+        if updates:
+            await db["deletion_queue"].bulk_write(updates, ordered=False)
+        return len(entries)
+
+    async def stats(self):
+        counts = await db["deletion_queue"].aggregate([
+            {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+        ]).to_list(None)
+        return {
+            "pending": {row["_id"]: row["count"] for row in counts},
+            "deleted": self.deleted,
+            "skipped": self.skipped,
+            "retried": self.retried,
+            "failed": self.failed,
+        }
+
+class ImageReconciler:
+    """
+    Queues the deletion of stored images nothing references
+
+    Lists every asset in IMAGE_FOLDERS and compares it with the blobs
+    collection, book image URLs and user profile images (which also covers
+    images uploaded before blobs existed). Assets younger than
+    IMAGE_RECONCILE_MIN_AGE are skipped.
+    """
+
+    def __init__(self):
+        self._lock = asyncio.Lock()
+        self.runs = 0
+        self.last_run_at = None
+        self.last_listed = 0
+        self.last_orphans = 0
+
+    async def _referenced_keys(self):
+        keys = set()
+        async for blob in db["blobs"].find({}, {"key": 1}):
+            keys.add(blob["key"])
+        for collection, field in (("books", "image_url"), ("users", "profile_image")):
+            async for doc in db[collection].find({field: {"$nin": [None, ""]}}, {field: 1}):
+                key = storage.key_for_url(doc[field])
+                if key:
+                    keys.add(key)
+        return keys
+
+    async def run(self):
+        if self._lock.locked():
+            return
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            cutoff = datetime.utcnow() - timedelta(seconds=IMAGE_RECONCILE_MIN_AGE)
+            listed = []
+            for folder in IMAGE_FOLDERS:
+                listed += await loop.run_in_executor(None, lambda: list(storage.list_keys(folder)))
+            # Read references after listing: anything attached meanwhile is seen as referenced
+            referenced = await self._referenced_keys()
+            orphans = [key for key, created_at in listed if key not in referenced and created_at < cutoff]
+            await enqueue_deletions(orphans, "reconcile")
+
+            self.runs += 1
+            self.last_run_at = datetime.utcnow()
+            self.last_listed = len(listed)
+            self.last_orphans = len(orphans)
+
+    def stats(self):
+        return {
+            "runs": self.runs,
+            "last_run_at": self.last_run_at,
+            "last_listed": self.last_listed,
+            "last_orphans": self.last_orphans,
+        }
+
+deletion_queue = DeletionQueue()
+image_reconciler = ImageReconciler()
@@ -0,0 +1,161 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from app.config.database import db
+from app.models.book import BorrowStatus, NotificationType
+from app.utils.hydration import BookLoader
+from app.utils.notifications import build_notification, upsert_notifications
+
+load_dotenv()
+DUE_SOON_WINDOW = timedelta(days=2)
+# Deadlines fire from app/utils/deadlines.py; the full scan is only a safety net
+DUE_DATE_SCAN_INTERVAL = float(os.getenv("DUE_DATE_SCAN_INTERVAL", 6 * 3600))
+DUE_DATE_SCAN_BATCH = int(os.getenv("DUE_DATE_SCAN_BATCH", 500))
+
+RECORD_FIELDS = {"book_id": 1, "user_email": 1, "due_date": 1}
+
+class DueDateScanner:
+    """
+    Sends due-soon reminders and flips overdue borrows, in streamed batches
+
+    Candidates are read with a cursor (no upper bound on how many), and each
+    batch of DUE_DATE_SCAN_BATCH records costs one books $in lookup, one
+    update_many and one bulk upsert of notifications. The unique
+    (borrow_id, type) index makes repeated runs idempotent.
+    """
+
+    def __init__(self):
+        self._lock = asyncio.Lock()
+        self.runs = 0
+        self.last_run_at = None
+        self.last_run_ms = 0.0
+        self.last_scanned = 0
+        self.last_due_soon = 0
+        self.last_overdue = 0
+
+    async def run(self):
+        # A manual trigger and the scheduled run never overlap
+        async with self._lock:
+            started = time.perf_counter()
+            now = datetime.now()
+            loader = BookLoader()
+
+            due_soon = await self._scan(
+                {
+                    "status": BorrowStatus.BORROWED,
+                    "due_date": {"$lte": now + DUE_SOON_WINDOW, "$gt": now},
+                    "due_soon_notified": {"$ne": True},
+                },
+                lambda batch: self._notify_due_soon(batch, loader)
+            )
+            overdue = await self._scan(
+                {"status": BorrowStatus.BORROWED, "due_date": {"$lt": now}},
+                lambda batch: self._flip_overdue(batch, loader, now)
+            )
+
+            self.runs += 1
+            self.last_run_at = now
+            self.last_run_ms = (time.perf_counter() - started) * 1000
+            self.last_due_soon = due_soon
+            self.last_overdue = overdue
+            self.last_scanned = due_soon + overdue
+            return self.stats()
+
+    async def fire_due_soon(self, borrow_ids):
+        """
+        Send due-soon reminders for specific records (used by the deadline
+        scheduler). Records returned or already reminded are skipped.
+
+        Returns:
+            Number of records handled
+        """
+        now = datetime.now()
+        return await self._scan(
+            {
+                "_id": {"$in": borrow_ids},
+                "status": BorrowStatus.BORROWED,
+                "due_date": {"$gt": now},
+                "due_soon_notified": {"$ne": True},
+            },
+            lambda batch: self._notify_due_soon(batch, BookLoader())
+        )
+
+    async def fire_overdue(self, borrow_ids):
+        """
+        Flip specific records to overdue (used by the deadline scheduler).
+        Records returned in the meantime are skipped.
+
+        Returns:
+            Number of records handled
+        """
+        now = datetime.now()
+        return await self._scan(
+            {"_id": {"$in": borrow_ids}, "status": BorrowStatus.BORROWED, "due_date": {"$lte": now}},
+            lambda batch: self._flip_overdue(batch, BookLoader(), now)
+        )
+
+    async def _scan(self, query: dict, handle_batch):
+        scanned = 0
+        batch = []
+        cursor = db["borrow_records"].find(query, RECORD_FIELDS).batch_size(DUE_DATE_SCAN_BATCH)
+        async for record in cursor:
+            batch.append(record)
+            if len(batch) == DUE_DATE_SCAN_BATCH:
+                await handle_batch(batch)
+                scanned += len(batch)
+                batch = []
+        if batch:
+            await handle_batch(batch)
+            scanned += len(batch)
+        return scanned
+
+    async def _titles(self, batch, loader: BookLoader):
+        books = await loader.load_many([record["book_id"] for record in batch])
+        return {book_id: book["title"] for book_id, book in books.items() if book}
+
+    async def _notify_due_soon(self, batch, loader: BookLoader):
+        titles = await self._titles(batch, loader)
+        await upsert_notifications([
+            build_notification(
+                record, "Book Due Soon",
+                f"Your book '{titles.get(record['book_id'], 'the book')}' is due on {record['due_date'].strftime('%Y-%m-%d')}. Please return it soon.",
+                NotificationType.DUE_SOON
+            )
+            for record in batch
+        ])
+        # Remember the reminder went out so later scans skip these records
+        await db["borrow_records"].update_many(
+            {"_id": {"$in": [record["_id"] for record in batch]}},
+            {"$set": {"due_soon_notified": True}}
+        )
+
+    async def _flip_overdue(self, batch, loader: BookLoader, now: datetime):
+        await db["borrow_records"].update_many(
+            {"_id": {"$in": [record["_id"] for record in batch]}, "status": BorrowStatus.BORROWED},
+            {"$set": {"status": BorrowStatus.OVERDUE}}
+        )
+        titles = await self._titles(batch, loader)
+        await upsert_notifications([
+            build_notification(
+                record, "Book Overdue",
+                f"Your book '{titles.get(record['book_id'], 'the book')}' is {(now - record['due_date']).days} day(s) overdue. Please return it immediately.",
+                NotificationType.OVERDUE
+            )
+            for record in batch
+        ])
+
+    def stats(self):
+        seconds = self.last_run_ms / 1000
+        return {
+            "runs": self.runs,
+            "last_run_at": self.last_run_at,
+            "last_run_ms": round(self.last_run_ms, 2),
+            "last_scanned": self.last_scanned,
+            "last_due_soon": self.last_due_soon,
+            "last_overdue": self.last_overdue,
+            "records_per_second": round(self.last_scanned / seconds, 1) if seconds else 0.0,
+        }
+
+due_date_scanner = DueDateScanner()
@@ -0,0 +1,71 @@
+import hashlib
+import json
+import os
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from dotenv import load_dotenv
+
+load_dotenv()
+CATALOG_MAX_AGE = int(os.getenv("CATALOG_MAX_AGE", 30))
+
+# Public catalog pages may be stored by shared caches/reverse proxies;
+# everything behind auth must be revalidated by the client on every use.
+PUBLIC_CACHE_CONTROL = f"public, max-age={CATALOG_MAX_AGE}, stale-while-revalidate={CATALOG_MAX_AGE * 10}"
+PRIVATE_CACHE_CONTROL = "private, no-cache"
+
+def render_json(payload):
+    """
+    Serialize a payload the way JSONResponse does and derive its strong ETag
+
+    Returns:
+        (body bytes, quoted ETag value)
+    """
+    body = json.dumps(
+        jsonable_encoder(payload),
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+    etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+    return body, etag
+
+def _opaque_tag(etag: str):
+    return etag[2:] if etag.startswith("W/") else etag
+
+def etag_matches(request: Request, etag: str):
+    """
+    Check the request's If-None-Match header against `etag`
+
+    Uses weak comparison (RFC 9110): a W/ prefix on either side is ignored.
+    """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    etag = _opaque_tag(etag)
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or _opaque_tag(candidate) == etag:
+            return True
+    return False
+
+def conditional_response(request: Request, rendered, cache_control: str = PRIVATE_CACHE_CONTROL):
+    """
+    Answer 304 when the client already holds `rendered`, else send it with its ETag
+
+    Args:
+        request: Incoming request (for If-None-Match)
+        rendered: (body, etag) tuple from render_json
+        cache_control: Cache-Control header value
+    """
+    body, etag = rendered
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def etag_response(request: Request, payload, cache_control: str = PRIVATE_CACHE_CONTROL):
+    """
+    Render `payload` as JSON and return it (or a 304) with a content-hash ETag
+    """
+    return conditional_response(request, render_json(payload), cache_control)
@@ -0,0 +1,65 @@
+from bson import ObjectId
+from app.config.database import db
+
+class BookLoader:
+    """
+    Per-request batching loader for book documents (DataLoader style)
+
+    All ids requested through load_many are fetched with a single $in query,
+    and every book fetched is remembered for the rest of the request, so a
+    listing costs one books query no matter how many records it returns.
+    """
+
+    def __init__(self, collection=None):
+        self.collection = collection if collection is not None else db["books"]
+        self.queries = 0
+        self._cache = {}
+
+    async def load_many(self, book_ids):
+        """
+        Return a dict mapping each requested id to its book (or None if missing)
+        """
+        missing = []
+        for book_id in set(book_ids):
+            if book_id in self._cache:
+                continue
+            try:
+                missing.append(ObjectId(book_id))
+            except Exception:
+                self._cache[book_id] = None
+
+        if missing:
+            self.queries += 1
+            books = await self.collection.find({"_id": {"$in": missing}}).to_list(len(missing))
+            for book in books:
+                book["_id"] = str(book["_id"])
+                self._cache[book["_id"]] = book
+            for object_id in missing:
+                self._cache.setdefault(str(object_id), None)
+
+        return {book_id: self._cache.get(book_id) for book_id in book_ids}
+
+    async def load(self, book_id):
+        books = await self.load_many([book_id])
+        return books[book_id]
+
+def get_book_loader():
+    """
+    FastAPI dependency; FastAPI caches dependencies per request, so every
+    consumer within one request shares the same loader
+    """
+    return BookLoader()
+
+async def attach_books(records, loader: BookLoader):
+    """
+    Stringify record ids and attach the matching book under "book"
+    """
+    books = await loader.load_many([record.get("book_id") for record in records])
+    result = []
+    for record in records:
+        record["_id"] = str(record["_id"])
+        book = books.get(record.get("book_id"))
+        if book:
+            record["book"] = book
+        result.append(record)
+    return result
@@ -0,0 +1,327 @@
+import asyncio
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from bson import ObjectId
+from fastapi import UploadFile
+from pymongo import ReturnDocument
+from dotenv import load_dotenv
+from app.config.database import db
+from app.utils.blobs import acquire_blob, reserve_blob, store_blob_url, release_blob
+from app.utils.deletions import release_legacy_image
+from app.utils.catalog_cache import catalog_cache
+from app.utils.storage import storage
+from app.utils.upload_stream import spool_image, MAX_IMAGE_SIZE
+
+load_dotenv()
+IMAGE_UPLOAD_WORKERS = int(os.getenv("IMAGE_UPLOAD_WORKERS", 4))
+IMAGE_JOB_MAX_ATTEMPTS = int(os.getenv("IMAGE_JOB_MAX_ATTEMPTS", 5))
+# Seconds before the first retry; doubled on every further attempt
+IMAGE_JOB_BACKOFF = float(os.getenv("IMAGE_JOB_BACKOFF", 5))
+# A running job whose lease ran out (worker died) is picked up again
+IMAGE_JOB_LEASE = float(os.getenv("IMAGE_JOB_LEASE", 300))
+IMAGE_JOB_POLL_INTERVAL = float(os.getenv("IMAGE_JOB_POLL_INTERVAL", 5))
+IMAGE_SPOOL_DIR = os.getenv("IMAGE_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "library_uploads"))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# target type -> (collection, key field, image field, field holding the pending job id,
+#                  field holding the blob, field holding the name of the blob reference)
+TARGETS = {
+    "book": ("books", "_id", "image_url", "image_job_id", "image_blob", "image_blob_ref"),
+    "user": ("users", "email", "profile_image", "profile_image_job_id", "profile_image_blob",
+             "profile_image_blob_ref"),
+}
+
+def _target_key(job: dict):
+    collection, key = TARGETS[job["target"]][:2]
+    value = ObjectId(job["target_id"]) if key == "_id" else job["target_id"]
+    return collection, {key: value}
+
+def _target_filter(job: dict):
+    collection, query = _target_key(job)
+    job_field = TARGETS[job["target"]][3]
+    # Only the latest upload for a target may set its image
+    return collection, {**query, job_field: str(job["_id"])}
+
+class ImageJobQueue:
+    """
+    Image uploads handed off to background workers
+
+    accept() validates the upload and spools it to IMAGE_SPOOL_DIR, submit()
+    records an image_jobs document, and IMAGE_UPLOAD_WORKERS workers claim
+    jobs and store the image through the storage backend on a thread pool.
+    Images are content-addressed: if a blob with the same SHA-256 exists it
+    is reused without uploading. When a job finishes, the book's image_url or
+    user's profile_image is patched, the job's blob reference moves to the
+    target and the old image is released; a job is only marked done once all
+    of that succeeded, and failures are retried with exponential backoff
+    up to IMAGE_JOB_MAX_ATTEMPTS times.
+    """
+
+    def __init__(self, workers: int = IMAGE_UPLOAD_WORKERS):
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image-upload")
+        self._wake = asyncio.Event()
+        self._tasks = []
+        self.completed = 0
+        self.deduplicated = 0
+        self.retried = 0
+        self.failed = 0
+
+    async def accept(self, file: UploadFile, owner: str):
+        """
+        Validate an uploaded image and spool it to disk (streamed, see
+        spool_image)
+
+        Returns:
+            Job document to pass to submit() (or discard() if the write it
+            belongs to is abandoned)
+        """
+        job_id = ObjectId()
+        path = os.path.join(IMAGE_SPOOL_DIR, str(job_id))
+        size, content_type, sha256 = await spool_image(file, path, MAX_IMAGE_SIZE)
+        return {
+            "_id": job_id,
+            "owner": owner,
+            "path": path,
+            "size": size,
+            "content_type": content_type,
+            "sha256": sha256,
+        }
+
+    async def submit(self, job: dict, target: str = None, target_id: str = None,
+                     folder: str = "library_books"):
+        """
+        Queue an accepted upload. With a target, the finished URL is written to
+        that book (target_id = book id) or user (target_id = email).
+        Without one, the image is only kept for BLOB_GC_GRACE.
+
+        Returns:
+            The job id
+        """
+        now = datetime.utcnow()
+        job.update({
+            "target": target,
+            "target_id": target_id,
+            "folder": folder,
+            "status": QUEUED,
+            "attempts": 0,
+            "next_attempt_at": now,
+            "error": None,
+            "result_url": None,
+            "created_at": now,
+            "updated_at": now,
+        })
+        await db["image_jobs"].insert_one(job)
+        self._wake.set()
+        return str(job["_id"])
+
+    def discard(self, job: dict):
+        _remove_file(job["path"])
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self._worker(), name=f"image-upload-{i}")
+                for i in range(self.workers)
+            ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _claim(self):
+        now = datetime.utcnow()
+        return await db["image_jobs"].find_one_and_update(
+            {"$or": [
+                {"status": QUEUED, "next_attempt_at": {"$lte": now}},
+                {"status": RUNNING, "lease_until": {"$lt": now}},
+            ]},
+            {
+                "$set": {"status": RUNNING, "lease_until": now + timedelta(seconds=IMAGE_JOB_LEASE), "updated_at": now},
+                "$inc": {"attempts": 1},
+            },
+            sort=[("next_attempt_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _worker(self):
+        while True:
+            # Cleared before claiming, so a submit() racing with the claim still wakes us
+            self._wake.clear()
+            try:
+                job = await self._claim()
+            except Exception as e:
+                print(f"Error claiming image job: {e}")
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), IMAGE_JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._process(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # The job is still RUNNING: its lease runs out and it is claimed again
+                print(f"Error processing image job {job['_id']}: {e}")
+
+    async def _process(self, job: dict):
+        try:
+            blob = await self._store(job)
+            attached = bool(job.get("target")) and await self._attach(job, blob["url"])
+            if not attached:
+                # No-op if whoever replaced or deleted our image already released it
+                await release_blob(job["sha256"], str(job["_id"]))
+        except Exception as e:
+            await self._fail(job, e)
+            return
+
+        # Only now, so a failure above leaves the job to be retried
+        now = datetime.utcnow()
+        await db["image_jobs"].update_one(
+            {"_id": job["_id"]},
+            {"$set": {"status": DONE, "result_url": blob["url"], "error": None, "updated_at": now, "finished_at": now}}
+        )
+        _remove_file(job["path"])
+        self.completed += 1
+
+    async def _store(self, job: dict):
+        """
+        Take the job's reference (named by the job id) on the blob for its
+        content, storing the image first if no blob has it yet
+        """
+        ref = str(job["_id"])
+        blob = await acquire_blob(job["sha256"], ref)
+        if blob is not None:
+            self.deduplicated += 1
+            return blob
+        key = f"{job['folder']}/{job['sha256']}"
+        # Raises BlobBusy while a deletion of the key runs; the job is retried
+        blob = await reserve_blob(job["sha256"], key, job["size"], job["content_type"], ref)
+        loop = asyncio.get_running_loop()
+        try:
+            url = await loop.run_in_executor(
+                self._executor, storage.put, job["path"], blob["key"], job["content_type"]
+            )
+        except Exception:
+            await release_blob(job["sha256"], ref)
+            raise
+        return await store_blob_url(job["sha256"], url)
+
+    async def _attach(self, job: dict, url: str):
+        """
+        Point the target at the blob, handing it the job's reference, and
+        release the image it replaces
+
+        Safe to repeat: the replaced image is recorded on the job before the
+        target is patched, and the target records the job's reference, so a
+        retry knows whether the patch happened and what to release.
+
+        Returns:
+            Whether the target now holds the job's reference
+        """
+        ref = str(job["_id"])
+        _, _, field, job_field, blob_field, ref_field = TARGETS[job["target"]]
+        collection, query = _target_key(job)
+        target = await db[collection].find_one(query, {field: 1, job_field: 1, blob_field: 1, ref_field: 1})
+        if target is None:
+            return False
+
+        if target.get(ref_field) == ref:
+            # Patched by an earlier attempt; finish releasing what it replaced
+            # (an unnamed reference is left alone rather than released twice)
+            replaced = job.get("replaced") or {}
+            if replaced.get("blob") and replaced.get("ref"):
+                await release_blob(replaced["blob"], replaced["ref"])
+            if job["target"] == "book":
+                catalog_cache.invalidate_book(job["target_id"])
+            return True
+        if target.get(job_field) != ref:
+            # A newer upload owns the target now
+            return False
+
+        replaced = {"blob": target.get(blob_field), "ref": target.get(ref_field), "url": target.get(field)}
+        await db["image_jobs"].update_one({"_id": job["_id"]}, {"$set": {"replaced": replaced}})
+        result = await db[collection].update_one(
+            {**query, job_field: ref, ref_field: replaced["ref"], field: replaced["url"]},
+            {"$set": {field: url, blob_field: job["sha256"], ref_field: ref}, "$unset": {job_field: ""}}
+        )
+        if result.modified_count == 0:
+            raise RuntimeError(f"{job['target']} {job['target_id']} changed while attaching its image")
+
+        if replaced["blob"]:
+            await release_blob(replaced["blob"], replaced["ref"])
+        elif replaced["url"] and replaced["url"] != url:
+            await release_legacy_image(replaced["url"])
+        if job["target"] == "book":
+            catalog_cache.invalidate_book(job["target_id"])
+        return True
+
+    async def _fail(self, job: dict, error: Exception):
+        now = datetime.utcnow()
+        if job["attempts"] >= IMAGE_JOB_MAX_ATTEMPTS:
+            print(f"Image job {job['_id']} failed after {job['attempts']} attempts: {error}")
+            await db["image_jobs"].update_one(
+                {"_id": job["_id"]},
+                {"$set": {"status": FAILED, "error": str(error), "updated_at": now, "finished_at": now}}
+            )
+            if job.get("target"):
+                collection, query = _target_filter(job)
+                job_field = TARGETS[job["target"]][3]
+                await db[collection].update_one(query, {"$unset": {job_field: ""}})
+            await release_blob(job["sha256"], str(job["_id"]))
+            _remove_file(job["path"])
+            self.failed += 1
+            return
+
+        delay = IMAGE_JOB_BACKOFF * 2 ** (job["attempts"] - 1)
+        await db["image_jobs"].update_one(
+            {"_id": job["_id"]},
+            {"$set": {
+                "status": QUEUED,
+                "error": str(error),
+                "next_attempt_at": now + timedelta(seconds=delay),
+                "updated_at": now,
+            }}
+        )
+        self.retried += 1
+
+    def stats(self):
+        return {
+            "workers": len(self._tasks),
+            "completed": self.completed,
+            "deduplicated": self.deduplicated,
+            "retried": self.retried,
+            "failed": self.failed,
+        }
+
+def _remove_file(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def serialize_job(job: dict):
+    return {
+        "id": str(job["_id"]),
+        "status": job["status"],
+        "attempts": job.get("attempts", 0),
+        "error": job.get("error"),
+        "result_url": job.get("result_url"),
+        "target": job.get("target"),
+        "target_id": job.get("target_id"),
+        "created_at": job.get("created_at"),
+        "updated_at": job.get("updated_at"),
+    }
+
+image_jobs = ImageJobQueue()
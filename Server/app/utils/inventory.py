@@ -0,0 +1,52 @@
+from bson import ObjectId
+from pymongo import ReturnDocument
+from app.config.database import db
+
+# Copy counts are only ever changed with single guarded updates, so concurrent
+# approvals and returns can't push available_copies below 0 or above total_copies.
+
+async def reserve_copies(book_id: str, count: int = 1, projection: dict = None):
+    """
+    Atomically take `count` copies of a book if that many are available
+
+    Returns:
+        The updated book (restricted to `projection`), or None if the book
+        does not exist or has fewer than `count` copies available
+    """
+    return await db["books"].find_one_and_update(
+        {"_id": ObjectId(book_id), "available_copies": {"$gte": count}},
+        {"$inc": {"available_copies": -count}},
+        projection=projection or {"title": 1},
+        return_document=ReturnDocument.AFTER
+    )
+
+async def release_copies(book_id: str, count: int = 1, projection: dict = None):
+    """
+    Atomically give back `count` copies, never exceeding total_copies
+
+    Returns:
+        The updated book (restricted to `projection`), or None if it no longer exists
+    """
+    return await db["books"].find_one_and_update(
+        {"_id": ObjectId(book_id)},
+        [{"$set": {"available_copies": {"$min": [{"$add": ["$available_copies", count]}, "$total_copies"]}}}],
+        projection=projection or {"title": 1},
+        return_document=ReturnDocument.AFTER
+    )
+
+async def reserve_up_to(book_id: str, count: int):
+    """
+    Atomically take as many copies as are available, up to `count`
+
+    Returns:
+        (book before the update or None if it does not exist, copies granted)
+    """
+    before = await db["books"].find_one_and_update(
+        {"_id": ObjectId(book_id)},
+        [{"$set": {"available_copies": {"$max": [{"$subtract": ["$available_copies", count]}, 0]}}}],
+        projection={"title": 1, "available_copies": 1},
+        return_document=ReturnDocument.BEFORE
+    )
+    if before is None:
+        return None, 0
+    return before, max(0, min(count, before.get("available_copies", 0)))
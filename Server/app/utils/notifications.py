@@ -0,0 +1,69 @@
+from datetime import datetime
+from pymongo import UpdateOne
+from app.config.database import db
+from app.utils.outbox import outbox
+from app.utils.realtime import publish_notifications
+from app.utils.unread_counter import add_unread
+
+def build_notification(record: dict, title: str, message: str, notification_type, borrow_id: str = None):
+    """
+    Build a notification document about a borrow record
+    """
+    return {
+        "user_email": record["user_email"],
+        "title": title,
+        "message": message,
+        "type": notification_type,
+        "borrow_id": borrow_id or str(record["_id"]),
+        "book_id": record["book_id"],
+        "is_read": False,
+        "created_at": datetime.now()
+    }
+
+async def create_notification(notification: dict):
+    """
+    Hand a notification to the outbox. It is written, counted as unread and
+    pushed to the user's open sockets by the next batched flush.
+    """
+    await outbox.enqueue(notification)
+
+async def create_notifications(notifications: list):
+    """
+    Hand many notifications to the outbox at once
+    """
+    if not notifications:
+        return
+    await outbox.enqueue_many(notifications)
+
+async def upsert_notifications(notifications: list):
+    """
+    Store notifications that must exist at most once per (borrow_id, type)
+
+    Relies on the unique notifications_borrow_type_unique index: existing ones
+    are left untouched, and only the newly inserted ones are counted as unread
+    and pushed. Bypasses the outbox because the caller needs to know which
+    notifications were new.
+
+    Returns:
+        Number of notifications inserted
+    """
+    if not notifications:
+        return 0
+    result = await db["notifications"].bulk_write([
+        UpdateOne(
+            {"borrow_id": notification["borrow_id"], "type": notification["type"]},
+            {"$setOnInsert": notification},
+            upsert=True
+        )
+        for notification in notifications
+    ], ordered=False)
+
+    inserted = []
+    for index, inserted_id in result.upserted_ids.items():
+        notification = notifications[index]
+        notification["_id"] = inserted_id
+        inserted.append(notification)
+    if inserted:
+        await add_unread(inserted)
+        publish_notifications(inserted)
+    return len(inserted)
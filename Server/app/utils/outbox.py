@@ -0,0 +1,183 @@
+import asyncio
+import os
+import time
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, PyMongoError
+from dotenv import load_dotenv
+from app.config.database import db
+from app.utils.realtime import publish_notifications
+from app.utils.unread_counter import add_unread
+
+load_dotenv()
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 200))
+OUTBOX_FLUSH_INTERVAL = float(os.getenv("OUTBOX_FLUSH_INTERVAL", 0.5))
+OUTBOX_MAX_QUEUE = int(os.getenv("OUTBOX_MAX_QUEUE", 10000))
+# Database errors are retried until the write lands, backing off up to this many seconds
+OUTBOX_MAX_BACKOFF = float(os.getenv("OUTBOX_MAX_BACKOFF", 30))
+OUTBOX_DRAIN_TIMEOUT = float(os.getenv("OUTBOX_DRAIN_TIMEOUT", 10))
+
+DUPLICATE_KEY = 11000
+
+class NotificationOutbox:
+    """
+    Buffers notifications from request handlers and writes them in batches
+
+    A background task (started from the lifespan) flushes with insert_many once
+    OUTBOX_BATCH_SIZE notifications are queued or OUTBOX_FLUSH_INTERVAL seconds
+    after the first one arrived. The queue is bounded: when it is full,
+    enqueue() waits, which slows writers down instead of growing memory.
+
+    Notifications get their _id when enqueued, so retries are idempotent
+    (a duplicate key just means an earlier attempt landed). Database errors
+    are retried with capped backoff until the batch is written; meanwhile
+    the queue fills up and enqueue() applies backpressure. On shutdown the
+    queue is drained before the process exits.
+    """
+
+    def __init__(self, batch_size=OUTBOX_BATCH_SIZE, flush_interval=OUTBOX_FLUSH_INTERVAL, max_queue=OUTBOX_MAX_QUEUE):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self._task = None
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.flush_errors = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    async def enqueue(self, notification: dict):
+        await self.enqueue_many([notification])
+
+    async def enqueue_many(self, notifications: list):
+        for notification in notifications:
+            notification.setdefault("_id", ObjectId())
+        if not self.running:
+            # No writer (e.g. scripts calling handlers directly): write inline
+            await self._write(notifications)
+            return
+        for notification in notifications:
+            await self.queue.put(notification)
+            self.enqueued += 1
+
+    def start(self):
+        if not self.running:
+            self._task = asyncio.create_task(self._run(), name="notification-outbox")
+
+    async def stop(self, timeout: float = OUTBOX_DRAIN_TIMEOUT):
+        """
+        Drain everything still queued, then stop the writer
+        """
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            print(f"Notification outbox: {self.queue.qsize()} notification(s) not written before shutdown")
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._flush(batch)
+            except asyncio.CancelledError:
+                self.dropped += len(batch)
+                print(f"Notification outbox: {len(batch)} notification(s) not written before shutdown")
+                raise
+            except Exception as e:
+                print(f"Notification outbox error: {e}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def _flush(self, batch):
+        try:
+            await self._write_retrying(batch)
+        except Exception as e:
+            # Rejected documents (or a bug) fail the same way on every retry:
+            # write one by one so only the offending notifications are lost
+            print(f"Notification outbox flush failed, writing individually: {e}")
+            for notification in batch:
+                try:
+                    await self._write_retrying([notification])
+                except Exception as e:
+                    self.dropped += 1
+                    print(f"Dropping notification {notification['_id']}: {e}")
+
+    async def _write_retrying(self, notifications):
+        """
+        Write, retrying database errors with capped backoff until it lands
+        """
+        attempt = 0
+        while True:
+            try:
+                await self._write(notifications)
+                return
+            except BulkWriteError:
+                raise
+            except PyMongoError as e:
+                self.flush_errors += 1
+                attempt += 1
+                print(f"Notification outbox flush failed (attempt {attempt}): {e}")
+                await asyncio.sleep(min(2 ** (attempt - 1) * 0.1, OUTBOX_MAX_BACKOFF))
+
+    async def _write(self, notifications):
+        started = time.perf_counter()
+        written = notifications
+        try:
+            await db["notifications"].insert_many(notifications, ordered=False)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(error.get("code") != DUPLICATE_KEY for error in errors):
+                raise
+            # Already written by an earlier attempt
+            duplicates = {error["index"] for error in errors}
+            written = [n for i, n in enumerate(notifications) if i not in duplicates]
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.flushes += 1
+        self.written += len(written)
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        self._total_flush_ms += elapsed_ms
+
+        try:
+            await add_unread(written)
+        except PyMongoError as e:
+            # The notifications are stored; reconciliation will fix the counters
+            print(f"Error updating unread counters: {e}")
+        publish_notifications(written)
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue.qsize(),
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "flushes": self.flushes,
+            "flush_errors": self.flush_errors,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "avg_flush_ms": round(self._total_flush_ms / self.flushes, 2) if self.flushes else 0.0,
+            "max_flush_ms": round(self.max_flush_ms, 2),
+        }
+
+outbox = NotificationOutbox()
@@ -0,0 +1,83 @@
+import base64
+from typing import Optional
+from bson import json_util
+from fastapi import HTTPException, Query
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+def encode_cursor(values: list) -> str:
+    """
+    Encode the sort key values of the last document on a page into an opaque cursor
+    """
+    raw = json_util.dumps(values).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> list:
+    """
+    Decode a cursor produced by encode_cursor, raising 400 if it was tampered with
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json_util.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+    if not isinstance(values, list):
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+    return values
+
+def keyset_filter(sort: list, values: list) -> dict:
+    """
+    Build the filter selecting documents strictly after `values` in `sort` order
+
+    For sort [(a, -1), (_id, -1)] this yields
+    {"$or": [{a: {"$lt": va}}, {a: va, _id: {"$lt": vid}}]}
+    """
+    if len(values) != len(sort):
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+
+    clauses = []
+    for i, (field, direction) in enumerate(sort):
+        clause = {sort[j][0]: values[j] for j in range(i)}
+        clause[field] = {"$gt" if direction == 1 else "$lt": values[i]}
+        clauses.append(clause)
+    return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+
+def page_params(
+    after: Optional[str] = Query(None, description="Cursor returned as next_cursor by the previous page"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+):
+    """
+    FastAPI dependency collecting the shared pagination query parameters
+    """
+    return {"after": after, "limit": limit}
+
+async def paginate(collection, query: dict, sort: list, after: Optional[str] = None,
+                   limit: int = DEFAULT_PAGE_SIZE, projection: Optional[dict] = None):
+    """
+    Fetch one page of `collection` using keyset pagination
+
+    Args:
+        collection: Motor collection to read from
+        query: Base Mongo filter
+        sort: List of (field, direction); must end with _id so keys are unique
+        after: Opaque cursor from a previous page
+        limit: Page size
+
+    Returns:
+        (documents, next_cursor) where next_cursor is None on the last page
+    """
+    if after:
+        query = {"$and": [query, keyset_filter(sort, decode_cursor(after))]}
+
+    # Read one extra document to know whether another page exists
+    docs = await collection.find(query, projection).sort(sort).limit(limit + 1).to_list(limit + 1)
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        last = docs[-1]
+        next_cursor = encode_cursor([last.get(field) for field, _ in sort])
+    return docs, next_cursor
+
+def page_response(items: list, next_cursor: Optional[str]):
+    return {"items": items, "next_cursor": next_cursor}
@@ -0,0 +1,64 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+from dotenv import load_dotenv
+
+load_dotenv()
+# bcrypt releases the GIL, so threads give real parallelism here
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", os.cpu_count() or 2))
+# Hashes allowed to wait for a worker before new ones are shed with 503
+PASSWORD_MAX_QUEUE = int(os.getenv("PASSWORD_MAX_QUEUE", 32))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a dedicated thread pool instead of the event loop
+
+    At most PASSWORD_WORKERS hashes run at once and PASSWORD_MAX_QUEUE more
+    may wait; beyond that the request is refused with 503 so a login burst
+    cannot pile up unbounded work.
+    """
+
+    def __init__(self, workers: int = PASSWORD_WORKERS, max_queue: int = PASSWORD_MAX_QUEUE):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self.in_flight = 0
+        self.completed = 0
+        self.shed = 0
+
+    async def _submit(self, fn, *args):
+        if self.in_flight >= self.workers + self.max_queue:
+            self.shed += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server is busy, please try again",
+                headers={"Retry-After": "1"},
+            )
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, fn, *args)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+
+    async def hash(self, password: str):
+        return await self._submit(pwd_context.hash, password)
+
+    async def verify(self, password: str, hashed: str):
+        return await self._submit(pwd_context.verify, password, hashed)
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "shed": self.shed,
+        }
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,158 @@
+import asyncio
+import os
+from collections import defaultdict
+from bson import ObjectId
+from fastapi import WebSocketDisconnect
+from fastapi.encoders import jsonable_encoder
+from dotenv import load_dotenv
+from app.config.database import db
+
+load_dotenv()
+HEARTBEAT_INTERVAL = float(os.getenv("WS_HEARTBEAT_INTERVAL", 25))
+SUBSCRIBER_QUEUE_SIZE = int(os.getenv("WS_QUEUE_SIZE", 100))
+
+def encode_event(event: str, data=None, **extra):
+    message = {"event": event, **extra}
+    if data is not None:
+        message["data"] = jsonable_encoder(data, custom_encoder={ObjectId: str})
+    return message
+
+class Subscriber:
+    """
+    One connected socket. Messages are queued and written by the socket's own
+    sender loop, so a slow client never blocks the request that published.
+    """
+
+    def __init__(self, email: str, is_admin: bool):
+        self.email = email
+        self.is_admin = is_admin
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+
+    def push(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # The client fell too far behind; its sender loop closes the socket
+            # and the client catches up through replay when it reconnects
+            self.overflowed = True
+
+class ConnectionHub:
+    """
+    In-process registry of notification sockets, keyed by user email
+
+    Each uvicorn worker has its own hub; a client only receives live events
+    published by the worker it is connected to and relies on replay-from-last-id
+    on reconnect for the rest.
+    """
+
+    def __init__(self):
+        self._users = defaultdict(set)
+        self._admins = set()
+
+    def subscribe(self, email: str, is_admin: bool = False):
+        subscriber = Subscriber(email, is_admin)
+        self._users[email].add(subscriber)
+        if is_admin:
+            self._admins.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        subscribers = self._users.get(subscriber.email)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._users[subscriber.email]
+        self._admins.discard(subscriber)
+
+    def publish_to_user(self, email: str, message):
+        for subscriber in list(self._users.get(email, ())):
+            subscriber.push(message)
+
+    def publish_to_admins(self, message):
+        for subscriber in list(self._admins):
+            subscriber.push(message)
+
+    def stats(self):
+        return {
+            "users": len(self._users),
+            "connections": sum(len(subscribers) for subscribers in self._users.values()),
+            "admin_connections": len(self._admins),
+        }
+
+hub = ConnectionHub()
+
+def publish_notifications(notifications):
+    """
+    Push freshly stored notifications to their owners' open sockets
+    """
+    for notification in notifications:
+        hub.publish_to_user(notification["user_email"], encode_event("notification", notification))
+
+def publish_pending(op: str, record: dict):
+    """
+    Live pending-queue feed for admins: op is "added" or "removed"
+    """
+    hub.publish_to_admins(encode_event("pending", record, op=op))
+
+REPLAY_LIMIT = 200
+
+async def serve_notification_socket(websocket, current_user: dict, last_id: str = None):
+    """
+    Run an accepted notification socket until the client goes away
+
+    Replays up to REPLAY_LIMIT notifications newer than `last_id`, then streams
+    live events, sending a ping whenever the socket has been idle for
+    HEARTBEAT_INTERVAL seconds.
+    """
+    email = current_user.get("email")
+    subscriber = hub.subscribe(email, current_user.get("role") == "admin")
+    receiver = asyncio.create_task(_drain_client(websocket))
+    try:
+        # Subscribe before replaying so nothing published meanwhile is lost;
+        # anything seen in both is skipped below
+        replayed = set()
+        if last_id and ObjectId.is_valid(last_id):
+            missed = await db["notifications"].find(
+                {"user_email": email, "_id": {"$gt": ObjectId(last_id)}}
+            ).sort("_id", 1).limit(REPLAY_LIMIT).to_list(REPLAY_LIMIT)
+            for notification in missed:
+                replayed.add(str(notification["_id"]))
+                await websocket.send_json(encode_event("notification", notification))
+            if len(missed) == REPLAY_LIMIT:
+                # Too far behind: the client should reload the list over REST
+                await websocket.send_json(encode_event("replay_truncated"))
+        await websocket.send_json(encode_event("ready"))
+
+        while not receiver.done():
+            getter = asyncio.create_task(subscriber.queue.get())
+            done, _ = await asyncio.wait({getter, receiver}, timeout=HEARTBEAT_INTERVAL, return_when=asyncio.FIRST_COMPLETED)
+            if getter not in done:
+                getter.cancel()
+                if receiver.done():
+                    break
+                await websocket.send_json(encode_event("ping"))
+                continue
+            if subscriber.overflowed:
+                await websocket.close(code=1013)
+                break
+            message = getter.result()
+            if message.get("event") == "notification" and message["data"].get("_id") in replayed:
+                continue
+            await websocket.send_json(message)
+    except (WebSocketDisconnect, RuntimeError, OSError):
+        # Client went away mid-send
+        pass
+    finally:
+        hub.unsubscribe(subscriber)
+        receiver.cancel()
+
+async def _drain_client(websocket):
+    """
+    Read (and ignore) client frames; returns when the client disconnects
+    """
+    try:
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
@@ -0,0 +1,121 @@
+import os
+import time
+from collections import Counter
+from datetime import datetime
+from pymongo.errors import BulkWriteError
+from dotenv import load_dotenv
+from app.config.database import db
+from app.utils.pagination import keyset_filter
+from app.utils.unread_counter import remove_unread
+
+load_dotenv()
+NOTIFICATION_READ_TTL_DAYS = int(os.getenv("NOTIFICATION_READ_TTL_DAYS", 30))
+# Notifications kept per user; 0 archives all of them
+NOTIFICATION_MAX_PER_USER = max(0, int(os.getenv("NOTIFICATION_MAX_PER_USER", 200)))
+RETENTION_INTERVAL = float(os.getenv("RETENTION_INTERVAL", 3600))
+RETENTION_USERS_PER_RUN = int(os.getenv("RETENTION_USERS_PER_RUN", 200))
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", 500))
+RETENTION_MAX_DOCS_PER_RUN = int(os.getenv("RETENTION_MAX_DOCS_PER_RUN", 5000))
+
+NEWEST_FIRST = [("created_at", -1), ("_id", -1)]
+
+# Read notifications are expired by the TTL index declared in app/config/indexes.py.
+# This job caps what is left: each user keeps their newest NOTIFICATION_MAX_PER_USER
+# notifications and the rest move to notifications_archive.
+
+class NotificationRetention:
+    def __init__(self):
+        # Users are visited in email order across runs; resume where the last run stopped
+        self._resume_from = None
+        self.runs = 0
+        self.archived = 0
+        self.last_run_at = None
+        self.last_run_ms = 0.0
+
+    async def run(self):
+        """
+        Archive overflow notifications for the next slice of users
+
+        Touches at most RETENTION_USERS_PER_RUN users and moves at most
+        RETENTION_MAX_DOCS_PER_RUN documents, RETENTION_BATCH_SIZE at a time.
+
+        Returns:
+            Number of notifications archived
+        """
+        started = time.perf_counter()
+        query = {"user_email": {"$gte": self._resume_from}} if self._resume_from else {}
+        # Distinct recipients in email order (served from the user_email index prefix)
+        users = await db["notifications"].aggregate([
+            {"$match": query},
+            {"$sort": {"user_email": 1}},
+            {"$group": {"_id": "$user_email"}},
+            {"$sort": {"_id": 1}},
+            {"$limit": RETENTION_USERS_PER_RUN},
+        ]).to_list(RETENTION_USERS_PER_RUN)
+        self._resume_from = users[-1]["_id"] if len(users) == RETENTION_USERS_PER_RUN else None
+
+        budget = RETENTION_MAX_DOCS_PER_RUN
+        archived = 0
+        for user in users:
+            moved = await self._compact_user(user["_id"], budget)
+            archived += moved
+            budget -= moved
+            if budget <= 0:
+                # This user may still have overflow, start from them next run
+                self._resume_from = user["_id"]
+                break
+
+        self.runs += 1
+        self.archived += archived
+        self.last_run_at = datetime.now()
+        self.last_run_ms = (time.perf_counter() - started) * 1000
+        return archived
+
+    async def _compact_user(self, email: str, budget: int):
+        if NOTIFICATION_MAX_PER_USER == 0:
+            overflow = {"user_email": email}
+        else:
+            # The oldest notification the user is allowed to keep
+            newest = await db["notifications"].find({"user_email": email}, {"created_at": 1}) \
+                .sort(NEWEST_FIRST).skip(NOTIFICATION_MAX_PER_USER - 1).limit(1).to_list(1)
+            if not newest:
+                return 0
+            overflow = {
+                "$and": [
+                    {"user_email": email},
+                    keyset_filter(NEWEST_FIRST, [newest[0].get("created_at"), newest[0]["_id"]]),
+                ]
+            }
+
+        moved = 0
+        while moved < budget:
+            batch_size = min(RETENTION_BATCH_SIZE, budget - moved)
+            batch = await db["notifications"].find(overflow).limit(batch_size).to_list(batch_size)
+            if not batch:
+                break
+            archived_at = datetime.now()
+            for notification in batch:
+                notification["archived_at"] = archived_at
+            try:
+                await db["notifications_archive"].insert_many(batch, ordered=False)
+            except BulkWriteError as e:
+                # Duplicates mean a previous run archived them but didn't get to delete
+                if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                    raise
+            await db["notifications"].delete_many({"_id": {"$in": [n["_id"] for n in batch]}})
+
+            unread = Counter(n["user_email"] for n in batch if not n.get("is_read"))
+            for user_email, count in unread.items():
+                await remove_unread(user_email, count)
+            moved += len(batch)
+        return moved
+
+    def stats(self):
+        return {
+            "runs": self.runs,
+            "archived": self.archived,
+            "last_run_at": self.last_run_at,
+            "last_run_ms": round(self.last_run_ms, 2),
+        }
+
+retention = NotificationRetention()
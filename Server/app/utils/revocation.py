@@ -0,0 +1,129 @@
+import asyncio
+import calendar
+import os
+from datetime import datetime
+from pymongo.errors import OperationFailure, PyMongoError
+from dotenv import load_dotenv
+from app.config.database import db
+
+load_dotenv()
+# Used when change streams are unavailable (standalone mongod)
+REVOCATION_POLL_INTERVAL = float(os.getenv("REVOCATION_POLL_INTERVAL", 5))
+# Wait before reopening a change stream that failed
+REVOCATION_RETRY_DELAY = float(os.getenv("REVOCATION_RETRY_DELAY", 5))
+
+def _timestamp(value: datetime):
+    # users timestamps are naive UTC (datetime.utcnow), like the JWT iat claim
+    return calendar.timegm(value.utctimetuple())
+
+class RevocationSet:
+    """
+    In-memory map of user -> time before which their tokens are invalid
+
+    Backed by users.tokens_revoked_at: every worker loads it at startup and
+    follows changes through a change stream on users (or polling when the
+    server has no change streams), so a ban made on one worker is enforced
+    by all of them without a database read per request.
+    """
+
+    def __init__(self):
+        self._by_user_id = {}
+        self._by_email = {}
+        self._task = None
+        self.mode = None
+        self.last_sync_at = None
+        self._high_water = None
+
+    def is_revoked(self, payload: dict):
+        """
+        True if the token was issued at or before its user's revocation time
+        """
+        revoked_at = max(
+            self._by_user_id.get(payload.get("user_id"), -1),
+            self._by_email.get(payload.get("email"), -1),
+        )
+        if revoked_at < 0:
+            return False
+        return payload.get("iat", 0) <= revoked_at
+
+    def apply(self, user: dict):
+        revoked_at = user.get("tokens_revoked_at")
+        if not revoked_at:
+            return
+        seconds = _timestamp(revoked_at)
+        self._by_user_id[str(user["_id"])] = seconds
+        if user.get("email"):
+            self._by_email[user["email"]] = seconds
+        if self._high_water is None or revoked_at > self._high_water:
+            self._high_water = revoked_at
+
+    async def load(self, since: datetime = None):
+        query = {"tokens_revoked_at": {"$ne": None}}
+        if since is not None:
+            query = {"tokens_revoked_at": {"$gte": since}}
+        cursor = db["users"].find(query, {"email": 1, "tokens_revoked_at": 1})
+        async for user in cursor:
+            self.apply(user)
+        self.last_sync_at = datetime.utcnow()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="token-revocations")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _run(self):
+        # Normally already loaded by the lifespan before serving requests
+        while self.last_sync_at is None:
+            try:
+                await self.load()
+            except PyMongoError as e:
+                print(f"Error loading token revocations: {e}")
+                await asyncio.sleep(REVOCATION_RETRY_DELAY)
+
+        while True:
+            try:
+                await self._watch()
+            except OperationFailure as e:
+                # No change streams here (not a replica set): poll instead
+                print(f"Token revocations: change stream unavailable, polling ({e})")
+                await self._poll()
+            except PyMongoError as e:
+                print(f"Error watching token revocations: {e}")
+                await asyncio.sleep(REVOCATION_RETRY_DELAY)
+                # Catch up on anything missed while the stream was down
+                await self.load(self._high_water)
+
+    async def _watch(self):
+        pipeline = [{"$match": {
+            "operationType": {"$in": ["insert", "update", "replace"]},
+            "fullDocument.tokens_revoked_at": {"$ne": None},
+        }}]
+        async with db["users"].watch(pipeline, full_document="updateLookup") as stream:
+            self.mode = "change_stream"
+            async for change in stream:
+                self.apply(change["fullDocument"])
+                self.last_sync_at = datetime.utcnow()
+
+    async def _poll(self):
+        self.mode = "polling"
+        while True:
+            await asyncio.sleep(REVOCATION_POLL_INTERVAL)
+            try:
+                await self.load(self._high_water)
+            except PyMongoError as e:
+                print(f"Error polling token revocations: {e}")
+
+    def stats(self):
+        return {
+            "mode": self.mode,
+            "revoked_users": len(self._by_user_id),
+            "last_sync_at": self.last_sync_at,
+        }
+
+revocations = RevocationSet()
@@ -0,0 +1,54 @@
+from typing import Optional
+from app.config.database import db
+
+# Text index used by GET /books/search (created by app/config/indexes.py). Weights rank title/ISBN hits above
+# author and category hits, and those above matches buried in the description.
+TEXT_INDEX_NAME = "books_text_search"
+TEXT_INDEX_KEYS = [
+    ("title", "text"),
+    ("author", "text"),
+    ("isbn", "text"),
+    ("category", "text"),
+    ("description", "text"),
+]
+TEXT_INDEX_WEIGHTS = {
+    "title": 10,
+    "isbn": 10,
+    "author": 5,
+    "category": 3,
+    "description": 1,
+}
+
+def build_search_query(q: str, category: Optional[str] = None, available: Optional[bool] = None):
+    """
+    Build the Mongo filter for a ranked catalog search
+
+    Args:
+        q: Free text query matched against title, author, ISBN, category and description
+        category: Exact category to restrict results to
+        available: True for books with free copies, False for fully borrowed books
+    """
+    query = {"$text": {"$search": q}}
+    if category:
+        query["category"] = category
+    if available is True:
+        query["available_copies"] = {"$gt": 0}
+    elif available is False:
+        query["available_copies"] = {"$lte": 0}
+    return query
+
+async def search_books(query: dict, page: int, limit: int):
+    """
+    Run a text search and return one page of results ordered by relevance
+    """
+    projection = {"score": {"$meta": "textScore"}}
+    cursor = (
+        db["books"]
+        .find(query, projection)
+        .sort([("score", {"$meta": "textScore"}), ("_id", 1)])
+        .skip((page - 1) * limit)
+        .limit(limit)
+    )
+    books = await cursor.to_list(limit)
+    total = await db["books"].count_documents(query)
+    return books, total
@@ -0,0 +1,107 @@
+import hashlib
+import hmac
+import os
+import secrets
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import ReturnDocument
+from dotenv import load_dotenv
+from app.config.database import db
+
+load_dotenv()
+REFRESH_TOKEN_DAYS = int(os.getenv("REFRESH_TOKEN_DAYS", 30))
+
+# Fields a session listing may show to its owner
+SESSION_FIELDS = {"created_at": 1, "last_used_at": 1, "expires_at": 1, "user_agent": 1}
+
+def _hash(secret: str):
+    return hashlib.sha256(secret.encode()).hexdigest()
+
+def _split(refresh_token: str):
+    """
+    Refresh tokens look like "<session id>.<secret>"; returns (ObjectId, secret) or None
+    """
+    session_id, _, secret = (refresh_token or "").partition(".")
+    if not secret or not ObjectId.is_valid(session_id):
+        return None
+    return ObjectId(session_id), secret
+
+async def create_session(user: dict, user_agent: str = None):
+    """
+    Start a session for a user who just proved their password
+
+    Only a hash of the refresh token is stored. Expired sessions are removed
+    by the sessions_expiry TTL index.
+
+    Returns:
+        (session id, refresh token)
+    """
+    now = datetime.utcnow()
+    secret = secrets.token_urlsafe(32)
+    session = {
+        "user_id": str(user["_id"]),
+        "email": user["email"],
+        "token_hash": _hash(secret),
+        "created_at": now,
+        "last_used_at": now,
+        "expires_at": now + timedelta(days=REFRESH_TOKEN_DAYS),
+        "user_agent": user_agent,
+    }
+    result = await db["sessions"].insert_one(session)
+    session_id = str(result.inserted_id)
+    return session_id, f"{session_id}.{secret}"
+
+async def rotate_session(refresh_token: str):
+    """
+    Exchange a refresh token for a new one; the old one stops working
+
+    Presenting the refresh token this session was last rotated from means it
+    leaked (or the client raced itself), so the whole session is revoked. Any
+    other wrong secret is just rejected: knowing a session id alone must not
+    let anyone end the session.
+
+    Returns:
+        (session, new refresh token), or None if the token is not valid
+    """
+    parts = _split(refresh_token)
+    if parts is None:
+        return None
+    session_id, secret = parts
+    now = datetime.utcnow()
+    token_hash = _hash(secret)
+    new_secret = secrets.token_urlsafe(32)
+
+    session = await db["sessions"].find_one_and_update(
+        {"_id": session_id, "token_hash": token_hash, "expires_at": {"$gt": now}},
+        {"$set": {"token_hash": _hash(new_secret), "previous_hash": token_hash, "last_used_at": now}},
+        return_document=ReturnDocument.AFTER
+    )
+    if session is None:
+        stale = await db["sessions"].find_one({"_id": session_id}, {"previous_hash": 1})
+        if stale and stale.get("previous_hash") and hmac.compare_digest(stale["previous_hash"], token_hash):
+            await db["sessions"].delete_one({"_id": session_id})
+        return None
+    return session, f"{session_id}.{new_secret}"
+
+async def list_sessions(user_id: str):
+    sessions = await db["sessions"].find(
+        {"user_id": user_id, "expires_at": {"$gt": datetime.utcnow()}},
+        SESSION_FIELDS
+    ).sort("last_used_at", -1).to_list(100)
+    for session in sessions:
+        session["id"] = str(session.pop("_id"))
+    return sessions
+
+async def revoke_session(user_id: str, session_id: str):
+    """
+    Returns:
+        True if the user's session existed and was removed
+    """
+    if not ObjectId.is_valid(session_id):
+        return False
+    result = await db["sessions"].delete_one({"_id": ObjectId(session_id), "user_id": user_id})
+    return result.deleted_count == 1
+
+async def revoke_user_sessions(user_id: str):
+    result = await db["sessions"].delete_many({"user_id": user_id})
+    return result.deleted_count
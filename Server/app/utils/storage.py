@@ -0,0 +1,218 @@
+import os
+import re
+import shutil
+import urllib.parse
+import urllib.request
+from datetime import datetime
+import cloudinary
+import cloudinary.api
+import cloudinary.uploader
+from dotenv import load_dotenv
+
+load_dotenv()
+# "cloudinary" or "local"
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "cloudinary")
+STORAGE_LOCAL_ROOT = os.getenv("STORAGE_LOCAL_ROOT", "media")
+STORAGE_FETCH_TIMEOUT = float(os.getenv("STORAGE_FETCH_TIMEOUT", 10))
+# Where STORAGE_LOCAL_ROOT is served from (see app/main.py)
+STORAGE_LOCAL_URL_PATH = "/media"
+STORAGE_LOCAL_BASE_URL = os.getenv("STORAGE_LOCAL_BASE_URL", STORAGE_LOCAL_URL_PATH)
+
+EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/gif": ".gif",
+    "image/webp": ".webp",
+}
+
+class StorageBackend:
+    """
+    Where image blobs live. Keys look like "<folder>/<sha256>". Methods are
+    blocking; call them from a thread pool.
+    """
+    name = None
+
+    def put(self, path: str, key: str, content_type: str) -> str:
+        """
+        Store the file at `path` under `key` and return its public URL
+        """
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def delete_many(self, keys: list):
+        """
+        Delete several keys (missing ones count as deleted)
+
+        Returns:
+            {key: error message} for the keys that could not be deleted
+        """
+        errors = {}
+        for key in keys:
+            try:
+                self.delete(key)
+            except Exception as e:
+                errors[key] = str(e)
+        return errors
+
+    def list_keys(self, folder: str):
+        """
+        Yield (key, created_at) for every asset stored under `folder`
+        """
+        raise NotImplementedError
+
+    def key_for_url(self, url: str):
+        """
+        The key of an asset of this backend from its URL, or None if the URL
+        points somewhere else (used for images stored before blobs existed)
+        """
+        raise NotImplementedError
+
+    def read(self, url: str, max_size: int) -> bytes:
+        """
+        Fetch a stored image (or any legacy http(s) image URL) by its URL
+        """
+        if not url.startswith(("http://", "https://")):
+            raise ValueError(f"Cannot fetch image from {url}")
+        with urllib.request.urlopen(url, timeout=STORAGE_FETCH_TIMEOUT) as response:
+            data = response.read(max_size + 1)
+        if len(data) > max_size:
+            raise ValueError(f"Image at {url} is larger than {max_size} bytes")
+        return data
+
+# .../image/upload/v1700000000/library_books/abc.jpg -> library_books/abc
+CLOUDINARY_URL_KEY = re.compile(r"/image/upload/(?:v\d+/)?(?P<key>.+?)(?:\.\w+)?$")
+# Admin API limits
+CLOUDINARY_DELETE_BATCH = 100
+CLOUDINARY_LIST_BATCH = 500
+
+class CloudinaryStorage(StorageBackend):
+    name = "cloudinary"
+
+    def __init__(self):
+        cloudinary.config(
+            cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"),
+            api_key=os.getenv("CLOUDINARY_API_KEY"),
+            api_secret=os.getenv("CLOUDINARY_API_SECRET")
+        )
+
+    def put(self, path: str, key: str, content_type: str) -> str:
+        # Content-addressed keys never change meaning, so an existing asset is kept as is
+        return cloudinary.uploader.upload(path, public_id=key, overwrite=False)["secure_url"]
+
+    def delete(self, key: str):
+        result = cloudinary.uploader.destroy(key)
+        if result.get("result") not in ("ok", "not found"):
+            raise RuntimeError(f"Cloudinary destroy failed for {key}: {result}")
+
+    def delete_many(self, keys: list):
+        errors = {}
+        for start in range(0, len(keys), CLOUDINARY_DELETE_BATCH):
+            chunk = keys[start:start + CLOUDINARY_DELETE_BATCH]
+            try:
+                deleted = cloudinary.api.delete_resources(chunk, type="upload").get("deleted", {})
+            except Exception as e:
+                errors.update({key: str(e) for key in chunk})
+                continue
+            for key in chunk:
+                if deleted.get(key) not in ("deleted", "not_found"):
+                    errors[key] = f"Cloudinary delete failed: {deleted.get(key)}"
+        return errors
+
+    def list_keys(self, folder: str):
+        options = {"type": "upload", "prefix": folder + "/", "max_results": CLOUDINARY_LIST_BATCH}
+        while True:
+            result = cloudinary.api.resources(**options)
+            for resource in result.get("resources", []):
+                created_at = datetime.strptime(resource["created_at"], "%Y-%m-%dT%H:%M:%SZ")
+                yield resource["public_id"], created_at
+            if not result.get("next_cursor"):
+                return
+            options["next_cursor"] = result["next_cursor"]
+
+    def key_for_url(self, url: str):
+        parsed = urllib.parse.urlparse(url)
+        if parsed.hostname != "res.cloudinary.com":
+            return None
+        # Public ids may contain characters that are percent-encoded in the URL
+        # (e.g. "profile_a+b@example.com"); list_keys returns them decoded
+        match = CLOUDINARY_URL_KEY.search(urllib.parse.unquote(parsed.path))
+        return match.group("key") if match else None
+
+class LocalStorage(StorageBackend):
+    """
+    Files under STORAGE_LOCAL_ROOT, for offline development and benchmarks
+    """
+    name = "local"
+
+    def __init__(self, root: str = STORAGE_LOCAL_ROOT, base_url: str = STORAGE_LOCAL_BASE_URL):
+        self.root = root
+        self.base_url = base_url.rstrip("/")
+
+    def _filename(self, key: str, content_type: str = None):
+        if content_type:
+            return key + EXTENSIONS.get(content_type, "")
+        # Look the extension up on disk when deleting
+        folder, _, name = key.rpartition("/")
+        directory = os.path.join(self.root, folder)
+        for entry in os.listdir(directory) if os.path.isdir(directory) else []:
+            if os.path.splitext(entry)[0] == name:
+                return f"{folder}/{entry}"
+        return None
+
+    def put(self, path: str, key: str, content_type: str) -> str:
+        filename = self._filename(key, content_type)
+        destination = os.path.join(self.root, filename)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        if not os.path.exists(destination):
+            shutil.copyfile(path, destination + ".part")
+            os.replace(destination + ".part", destination)
+        return f"{self.base_url}/{filename}"
+
+    def read(self, url: str, max_size: int) -> bytes:
+        prefix = self.base_url + "/"
+        if not url.startswith(prefix):
+            return super().read(url, max_size)
+        root = os.path.abspath(self.root)
+        path = os.path.abspath(os.path.join(root, url[len(prefix):]))
+        if not path.startswith(root + os.sep):
+            raise ValueError(f"Cannot fetch image from {url}")
+        with open(path, "rb") as f:
+            data = f.read(max_size + 1)
+        if len(data) > max_size:
+            raise ValueError(f"Image at {url} is larger than {max_size} bytes")
+        return data
+
+    def delete(self, key: str):
+        filename = self._filename(key)
+        if filename:
+            try:
+                os.remove(os.path.join(self.root, filename))
+            except FileNotFoundError:
+                pass
+
+    def list_keys(self, folder: str):
+        directory = os.path.join(self.root, folder)
+        if not os.path.isdir(directory):
+            return
+        for entry in os.listdir(directory):
+            path = os.path.join(directory, entry)
+            if entry.endswith(".part") or not os.path.isfile(path):
+                continue
+            yield f"{folder}/{os.path.splitext(entry)[0]}", datetime.utcfromtimestamp(os.path.getmtime(path))
+
+    def key_for_url(self, url: str):
+        prefix = self.base_url + "/"
+        if not url.startswith(prefix):
+            return None
+        return os.path.splitext(urllib.parse.unquote(url[len(prefix):]))[0]
+
+def get_storage(name: str = STORAGE_BACKEND) -> StorageBackend:
+    if name == "local":
+        return LocalStorage()
+    if name == "cloudinary":
+        return CloudinaryStorage()
+    raise ValueError(f"Unknown STORAGE_BACKEND: {name}")
+
+storage = get_storage()
@@ -0,0 +1,94 @@
+import os
+from collections import Counter
+from datetime import datetime
+from pymongo import UpdateOne
+from dotenv import load_dotenv
+from app.config.database import db
+
+load_dotenv()
+UNREAD_RECONCILE_INTERVAL = float(os.getenv("UNREAD_RECONCILE_INTERVAL", 3600))
+UNREAD_RECONCILE_BATCH = int(os.getenv("UNREAD_RECONCILE_BATCH", 500))
+
+# One small document per user: {"_id": email, "unread": n}. Every path that
+# creates, reads or deletes notifications keeps it current, so the badge is a
+# single primary-key read; the periodic reconciliation repairs any drift.
+counters = db["notification_counters"]
+
+async def add_unread(notifications):
+    """
+    Count freshly created (unread) notifications, one update per user
+
+    Only existing counters are incremented. A user without one may have
+    older unread notifications, so their counter is seeded from the
+    collection by get_unread_count (which then includes these) instead.
+    """
+    per_user = Counter(n["user_email"] for n in notifications if not n.get("is_read"))
+    if not per_user:
+        return
+    await counters.bulk_write([
+        UpdateOne({"_id": email}, {"$inc": {"unread": count}, "$set": {"updated_at": datetime.now()}})
+        for email, count in per_user.items()
+    ], ordered=False)
+
+async def remove_unread(email: str, count: int = 1):
+    """
+    Decrement a user's counter without letting it go below zero
+    """
+    await counters.update_one(
+        {"_id": email},
+        [{"$set": {"unread": {"$max": [{"$subtract": ["$unread", count]}, 0]}, "updated_at": datetime.now()}}]
+    )
+
+async def get_unread_count(email: str):
+    counter = await counters.find_one({"_id": email})
+    if counter is not None:
+        return counter["unread"]
+
+    # First request for this user: create the counter before counting, so
+    # add_unread counts every notification created from now on, then add the
+    # existing ones. One created in between may be counted twice until the
+    # reconciliation; none is missed.
+    result = await counters.update_one(
+        {"_id": email},
+        {"$setOnInsert": {"unread": 0, "updated_at": datetime.now()}},
+        upsert=True
+    )
+    if result.upserted_id is not None:
+        unread = await db["notifications"].count_documents({"user_email": email, "is_read": False})
+        if unread:
+            await counters.update_one({"_id": email}, {"$inc": {"unread": unread}})
+    counter = await counters.find_one({"_id": email})
+    return counter["unread"] if counter else 0
+
+async def reconcile_unread_counts(batch_size: int = UNREAD_RECONCILE_BATCH):
+    """
+    Recount unread notifications for every tracked user, one batch at a time
+
+    Returns:
+        Number of counters that had drifted and were corrected
+    """
+    corrected = 0
+    last_email = None
+    while True:
+        query = {"_id": {"$gt": last_email}} if last_email else {}
+        batch = await counters.find(query, {"unread": 1}).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not batch:
+            return corrected
+        last_email = batch[-1]["_id"]
+
+        emails = [counter["_id"] for counter in batch]
+        actual = {
+            row["_id"]: row["unread"]
+            async for row in db["notifications"].aggregate([
+                {"$match": {"user_email": {"$in": emails}, "is_read": False}},
+                {"$group": {"_id": "$user_email", "unread": {"$sum": 1}}},
+            ])
+        }
+        fixes = [
+            UpdateOne({"_id": counter["_id"]}, {"$set": {"unread": actual.get(counter["_id"], 0), "updated_at": datetime.now()}})
+            for counter in batch
+            if counter.get("unread") != actual.get(counter["_id"], 0)
+        ]
+        if fixes:
+            await counters.bulk_write(fixes, ordered=False)
+            corrected += len(fixes)
@@ -0,0 +1,181 @@
+import asyncio
+import hashlib
+import os
+from fastapi import HTTPException, UploadFile, status
+from starlette.exceptions import HTTPException as StarletteHTTPException
+from dotenv import load_dotenv
+
+load_dotenv()
+UPLOAD_CHUNK_SIZE = 64 * 1024
+MAX_IMAGE_SIZE = 5 * 1024 * 1024  # 5MB
+# Bytes of multipart upload bodies being received at once, across all requests
+UPLOAD_MAX_IN_FLIGHT = int(os.getenv("UPLOAD_MAX_IN_FLIGHT", 64 * 1024 * 1024))
+# Whole multipart request bodies. Every limited route takes at most one image,
+# so this is the per-file limit plus room for the other form fields.
+UPLOAD_MAX_REQUEST = int(os.getenv("UPLOAD_MAX_REQUEST", MAX_IMAGE_SIZE + 256 * 1024))
+# Multipart routes that legitimately take large bodies
+UPLOAD_LIMIT_EXEMPT = {"/books/bulk-import"}
+
+# (offset, signature, content type), checked against the first bytes of a file
+IMAGE_SIGNATURES = [
+    (0, b"\xff\xd8\xff", "image/jpeg"),
+    (0, b"\x89PNG\r\n\x1a\n", "image/png"),
+    (0, b"GIF87a", "image/gif"),
+    (0, b"GIF89a", "image/gif"),
+    (8, b"WEBP", "image/webp"),
+]
+SNIFF_BYTES = 16
+
+def sniff_image_type(head: bytes):
+    """
+    Content type of an image from its leading bytes, or None if not a known image
+    """
+    for offset, signature, content_type in IMAGE_SIGNATURES:
+        if head[offset:offset + len(signature)] == signature:
+            if content_type == "image/webp" and head[:4] != b"RIFF":
+                continue
+            return content_type
+    return None
+
+class UploadBudget:
+    """
+    Global cap on upload bytes being received at the same time
+
+    UploadSizeLimitMiddleware reserves each body chunk as it arrives, before
+    the form parser buffers it, and releases the request's bytes when the
+    request is done; when the cap is reached the upload is refused with 503
+    instead of queueing more disk and memory work behind it.
+    """
+
+    def __init__(self, limit: int = UPLOAD_MAX_IN_FLIGHT):
+        self.limit = limit
+        self.in_flight = 0
+        self.rejected = 0
+
+    def reserve(self, size: int):
+        if self.in_flight + size > self.limit:
+            self.rejected += 1
+            raise StarletteHTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many uploads in progress, please try again",
+                headers={"Retry-After": "2"},
+            )
+        self.in_flight += size
+
+    def release(self, size: int):
+        self.in_flight -= size
+
+    def stats(self):
+        return {"in_flight_bytes": self.in_flight, "limit_bytes": self.limit, "rejected": self.rejected}
+
+upload_budget = UploadBudget()
+
+async def spool_image(file: UploadFile, path: str, max_size: int):
+    """
+    Copy an uploaded image to `path` in chunks
+
+    The type is sniffed from the first bytes (the declared content type is
+    not trusted), and the copy stops with 413 as soon as max_size is crossed,
+    so at most one chunk of the upload is in memory at a time. (The request
+    body was already counted against upload_budget as it arrived.)
+
+    Returns:
+        (size in bytes, sniffed content type, SHA-256 hex digest)
+    """
+    loop = asyncio.get_running_loop()
+    partial = path + ".part"
+    await loop.run_in_executor(None, lambda: os.makedirs(os.path.dirname(path), exist_ok=True))
+    out = await loop.run_in_executor(None, open, partial, "wb")
+    size = 0
+    content_type = None
+    digest = hashlib.sha256()
+    try:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            if content_type is None:
+                content_type = sniff_image_type(chunk[:SNIFF_BYTES])
+                if content_type is None:
+                    raise HTTPException(status_code=400, detail="File must be a JPEG, PNG, GIF or WebP image")
+            size += len(chunk)
+            if size > max_size:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=f"Image size must be less than {max_size // (1024 * 1024)}MB"
+                )
+            digest.update(chunk)
+            await loop.run_in_executor(None, out.write, chunk)
+        if content_type is None:
+            raise HTTPException(status_code=400, detail="Empty image file")
+    except BaseException:
+        out.close()
+        _remove(partial)
+        raise
+    out.close()
+    os.replace(partial, path)
+    return size, content_type, digest.hexdigest()
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+class UploadSizeLimitMiddleware:
+    """
+    Reject oversized multipart bodies before they are parsed
+
+    Requests declaring a Content-Length over UPLOAD_MAX_REQUEST get 413
+    straight away; bodies without one are counted as they stream in. Every
+    chunk is also reserved from `budget` as it arrives (503 once it is
+    exhausted) and released when the request is done.
+    """
+
+    def __init__(self, app, limit: int = UPLOAD_MAX_REQUEST, budget: UploadBudget = upload_budget):
+        self.app = app
+        self.limit = limit
+        self.budget = budget
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in UPLOAD_LIMIT_EXEMPT:
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers") or [])
+        if not headers.get(b"content-type", b"").startswith(b"multipart/form-data"):
+            await self.app(scope, receive, send)
+            return
+
+        declared = headers.get(b"content-length")
+        if declared is not None and declared.isdigit() and int(declared) > self.limit:
+            await _send_too_large(send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                size = len(message.get("body", b""))
+                if received + size > self.limit:
+                    # Raised inside the form parser; FastAPI turns it into a 413 response
+                    raise StarletteHTTPException(status_code=413, detail="Request body too large")
+                # Likewise a 503 when too many uploads are in flight
+                self.budget.reserve(size)
+                received += size
+            return message
+
+        try:
+            await self.app(scope, limited_receive, send)
+        finally:
+            self.budget.release(received)
+
+async def _send_too_large(send):
+    body = b'{"detail":"Request body too large"}'
+    await send({
+        "type": "http.response.start",
+        "status": 413,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,93 @@
+import re
+from typing import Optional
+from app.config.database import db
+
+# Newest accounts first; _id is unique, so it is a valid keyset on its own
+USER_SORT = [("_id", -1)]
+
+# view=compact: what the admin user list shows
+COMPACT_USER_FIELDS = {
+    "email": 1, "name": 1, "role": 1, "is_banned": 1, "ban_reason": 1,
+    "created_at": 1, "profile_image": 1,
+}
+FULL_USER_FIELDS = {
+    **COMPACT_USER_FIELDS,
+    "banned_at": 1, "dob": 1, "gender": 1, "address": 1, "phone": 1,
+}
+
+def user_search_fields(name: Optional[str] = None, email: Optional[str] = None):
+    """
+    Lowercased copies of name/email used for case-insensitive prefix search
+    """
+    fields = {}
+    if name is not None:
+        fields["name_lower"] = name.lower()
+    if email is not None:
+        fields["email_lower"] = email.lower()
+    return fields
+
+def build_user_query(q: Optional[str] = None, role: Optional[str] = None, is_banned: Optional[bool] = None):
+    """
+    Filter for the admin user directory. `q` matches the start of the name or
+    email; anchored regexes on the lowercased fields can use their indexes.
+    """
+    query = {}
+    if role:
+        query["role"] = role
+    if is_banned is not None:
+        # Users created before is_banned existed have no field at all
+        query["is_banned"] = True if is_banned else {"$ne": True}
+    q = (q or "").strip().lower()
+    if q:
+        prefix = {"$regex": "^" + re.escape(q)}
+        query["$or"] = [{"name_lower": prefix}, {"email_lower": prefix}]
+    return query
+
+def serialize_user(user: dict, fields: dict):
+    result = {"id": str(user["_id"])}
+    for field in fields:
+        if field == "name":
+            result[field] = user.get("name", "")
+        elif field == "role":
+            result[field] = user.get("role", "user")
+        elif field == "is_banned":
+            result[field] = user.get("is_banned", False)
+        else:
+            result[field] = user.get(field)
+    return result
+
+async def backfill_user_search_fields():
+    """
+    Fill name_lower/email_lower on users created before they existed
+
+    Returns:
+        Number of users updated
+    """
+    result = await db["users"].update_many(
+        {"$or": [{"name_lower": {"$exists": False}}, {"email_lower": {"$exists": False}}]},
+        [{"$set": {
+            "name_lower": {"$toLower": {"$ifNull": ["$name", ""]}},
+            "email_lower": {"$toLower": {"$ifNull": ["$email", ""]}},
+        }}]
+    )
+    return result.modified_count
+
+async def user_summary():
+    """
+    Counts for the admin dashboard, computed in one aggregation
+    """
+    rows = await db["users"].aggregate([
+        {"$group": {
+            "_id": None,
+            "total": {"$sum": 1},
+            "banned": {"$sum": {"$cond": [{"$eq": ["$is_banned", True]}, 1, 0]}},
+            "admins": {"$sum": {"$cond": [{"$eq": ["$role", "admin"]}, 1, 0]}},
+        }}
+    ]).to_list(1)
+    summary = rows[0] if rows else {"total": 0, "banned": 0, "admins": 0}
+    return {
+        "total": summary["total"],
+        "banned": summary["banned"],
+        "active": summary["total"] - summary["banned"],
+        "admins": summary["admins"],
+    }
@@ -0,0 +1,108 @@
+# scripts/bench_login.py
+# Login throughput vs. latency of other requests, with bcrypt inline or offloaded.
+#
+# Runs against a scratch database (never the real one):
+#   STRESS_DB_NAME=booklibrary_stress python scripts/bench_login.py --logins 200 --concurrency 50
+#   STRESS_DB_NAME=booklibrary_stress python scripts/bench_login.py --inline
+#
+# Seeds one user, fires N concurrent logins through the login handler and,
+# at the same time, keeps issuing a cheap request (GET /books/ first page) in
+# a loop. Reports logins/sec and the p50/p99 of the cheap request; --inline
+# runs bcrypt on the event loop the way login used to.
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ["DB_NAME"] = os.getenv("STRESS_DB_NAME", "booklibrary_stress")
+
+from fastapi import HTTPException
+from app.config.database import db
+from app.models.user import UserLogin
+from app.routes.auth import login
+from app.utils import passwords
+from app.utils.pagination import paginate
+
+EMAIL = "bench-user@example.com"
+PASSWORD = "bench-password"
+
+class InlineHasher:
+    async def hash(self, password):
+        return passwords.pwd_context.hash(password)
+
+    async def verify(self, password, hashed):
+        return passwords.pwd_context.verify(password, hashed)
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+async def probe(stop: asyncio.Event, samples: list):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await paginate(db["books"], {}, [("_id", 1)], None, 20)
+        samples.append((time.perf_counter() - started) * 1000)
+        await asyncio.sleep(0.005)
+
+async def main(logins: int, concurrency: int, inline: bool):
+    if inline:
+        import app.routes.auth as auth_routes
+        auth_routes.password_hasher = InlineHasher()
+
+    await db["users"].delete_many({"email": EMAIL})
+    await db["users"].insert_one({
+        "email": EMAIL, "name": "Bench User", "role": "user", "is_banned": False,
+        "password": passwords.pwd_context.hash(PASSWORD),
+    })
+
+    # Baseline latency of the probe with no logins running
+    baseline = []
+    stop = asyncio.Event()
+    probe_task = asyncio.create_task(probe(stop, baseline))
+    await asyncio.sleep(2)
+    stop.set()
+    await probe_task
+
+    semaphore = asyncio.Semaphore(concurrency)
+    outcomes = {"ok": 0, "shed": 0}
+
+    async def one_login():
+        async with semaphore:
+            try:
+                await login(UserLogin(email=EMAIL, password=PASSWORD), user_agent="bench_login")
+                outcomes["ok"] += 1
+            except HTTPException as e:
+                if e.status_code != 503:
+                    raise
+                outcomes["shed"] += 1
+
+    loaded = []
+    stop = asyncio.Event()
+    probe_task = asyncio.create_task(probe(stop, loaded))
+    started = time.perf_counter()
+    await asyncio.gather(*[one_login() for _ in range(logins)])
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await probe_task
+
+    await db["users"].delete_many({"email": EMAIL})
+    await db["sessions"].delete_many({"email": EMAIL})
+
+    mode = "inline" if inline else f"offloaded ({passwords.PASSWORD_WORKERS} workers)"
+    print(f"mode: {mode}")
+    print(f"logins: {outcomes['ok']} ok, {outcomes['shed']} shed (503) in {elapsed:.2f}s "
+          f"-> {outcomes['ok'] / elapsed:.1f} logins/s")
+    print(f"probe idle:   p50 {percentile(baseline, 0.5):.1f} ms  p99 {percentile(baseline, 0.99):.1f} ms  (n={len(baseline)})")
+    print(f"probe loaded: p50 {percentile(loaded, 0.5):.1f} ms  p99 {percentile(loaded, 0.99):.1f} ms  (n={len(loaded)})")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--inline", action="store_true", help="hash on the event loop (old behaviour)")
+    args = parser.parse_args()
+    asyncio.run(main(args.logins, args.concurrency, args.inline))
@@ -0,0 +1,47 @@
+# scripts/check_storage_keys.py
+# Checks that stored image URLs map back to the keys list_keys reports.
+#
+#   python scripts/check_storage_keys.py
+#
+# The image reconciliation job deletes every listed asset whose key no book
+# or user URL maps to, so a URL that maps to the wrong key (e.g. a
+# percent-encoded legacy public id) would get a live image deleted. Needs no
+# database or credentials; exits non-zero on the first mismatch.
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.utils.storage import CloudinaryStorage, LocalStorage
+
+CLOUDINARY_CASES = [
+    ("https://res.cloudinary.com/demo/image/upload/v1712345678/library_books/3f2a9c.jpg", "library_books/3f2a9c"),
+    ("https://res.cloudinary.com/demo/image/upload/library_books/3f2a9c.png", "library_books/3f2a9c"),
+    # Legacy profile ids were profile_{email}; emails may contain "+" and "@"
+    ("https://res.cloudinary.com/demo/image/upload/v1700000000/user_profiles/profile_jane%2Bbooks%40example.com.jpg",
+     "user_profiles/profile_jane+books@example.com"),
+    ("https://res.cloudinary.com/demo/image/upload/v1700000000/user_profiles/profile_jane+books@example.com.jpg",
+     "user_profiles/profile_jane+books@example.com"),
+    ("https://example.com/covers/book.jpg", None),
+]
+
+LOCAL_CASES = [
+    ("http://localhost:10000/media/library_books/3f2a9c.webp", "library_books/3f2a9c"),
+    ("http://localhost:10000/media/user_profiles/profile_jane%2Bbooks%40example.com.png",
+     "user_profiles/profile_jane+books@example.com"),
+    ("https://res.cloudinary.com/demo/image/upload/library_books/3f2a9c.jpg", None),
+]
+
+def check(backend, cases):
+    for url, expected in cases:
+        actual = backend.key_for_url(url)
+        if actual != expected:
+            print(f"FAIL {backend.name}: {url}\n  expected {expected!r}, got {actual!r}")
+            return False
+        print(f"ok   {backend.name}: {url} -> {actual}")
+    return True
+
+if __name__ == "__main__":
+    ok = check(CloudinaryStorage(), CLOUDINARY_CASES) and \
+        check(LocalStorage(base_url="http://localhost:10000/media"), LOCAL_CASES)
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,88 @@
+# scripts/stress_approvals.py
+# Concurrency stress check for the approve/return inventory path.
+#
+# Runs against a scratch database (never the real one):
+#   STRESS_DB_NAME=booklibrary_stress python scripts/stress_approvals.py --copies 5 --requests 200
+#
+# Creates one book with N copies and M pending requests, approves all of them
+# concurrently, returns the approved ones concurrently (twice each), and
+# checks that the copy counts never go negative or above the total.
+import argparse
+import asyncio
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ["DB_NAME"] = os.getenv("STRESS_DB_NAME", "booklibrary_stress")
+
+from fastapi import HTTPException
+from app.config.database import db
+from app.models.book import BorrowStatus, ReturnRequest
+from app.routes.books import approve_borrow_request, return_book
+
+ADMIN = {"email": "stress-admin@example.com", "role": "admin", "name": "Stress Admin"}
+
+async def attempt(coro):
+    try:
+        await coro
+        return True
+    except HTTPException:
+        return False
+
+async def main(copies: int, requests: int):
+    for name in ("books", "borrow_records", "notifications"):
+        await db[name].delete_many({})
+
+    book = await db["books"].insert_one({
+        "title": "Stress Test Book", "author": "Nobody", "isbn": "stress-0001",
+        "category": "Test", "description": "", "total_copies": copies,
+        "available_copies": copies, "created_at": datetime.now()
+    })
+    book_id = str(book.inserted_id)
+
+    records = await db["borrow_records"].insert_many([{
+        "book_id": book_id, "user_email": f"user{i}@example.com", "user_name": f"User {i}",
+        "status": BorrowStatus.PENDING, "request_date": datetime.now(),
+        "borrow_date": None, "due_date": None, "return_date": None,
+        "approved_date": None, "fine_amount": 0.0
+    } for i in range(requests)])
+    borrow_ids = [str(i) for i in records.inserted_ids]
+
+    # Approve every request twice, all at once
+    started = datetime.now()
+    results = await asyncio.gather(*[
+        attempt(approve_borrow_request(borrow_id, current_user=ADMIN))
+        for borrow_id in borrow_ids + borrow_ids
+    ])
+    elapsed = (datetime.now() - started).total_seconds()
+
+    approved = await db["borrow_records"].count_documents({"status": BorrowStatus.BORROWED})
+    rejected = await db["borrow_records"].count_documents({"status": BorrowStatus.REJECTED})
+    available = (await db["books"].find_one({"_id": book.inserted_id}))["available_copies"]
+    print(f"approvals: {sum(results)} ok / {len(results)} calls in {elapsed:.2f}s")
+    print(f"borrowed={approved} rejected={rejected} available_copies={available}")
+    assert approved == min(copies, requests), "more approvals than copies"
+    assert approved + rejected == requests, "request left in an intermediate state"
+    assert available == copies - approved, "copy count drifted"
+
+    # Return every borrowed record twice, all at once
+    borrowed = await db["borrow_records"].find({"status": BorrowStatus.BORROWED}).to_list(None)
+    await asyncio.gather(*[
+        attempt(return_book(
+            ReturnRequest(borrow_id=str(record["_id"])),
+            current_user={"email": record["user_email"], "role": "user"}
+        ))
+        for record in borrowed + borrowed
+    ])
+    available = (await db["books"].find_one({"_id": book.inserted_id}))["available_copies"]
+    print(f"after returns: available_copies={available}")
+    assert available == copies, "returns released the wrong number of copies"
+    print("OK")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--copies", type=int, default=5)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(main(args.copies, args.requests))
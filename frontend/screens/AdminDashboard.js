@@ -13,7 +13,7 @@ import {
   RefreshControl,
 } from "react-native";
 import * as ImagePicker from 'expo-image-picker';
-import API from "../utils/api";
+import API, { fetchAllPages, waitForImageJob } from "../utils/api";
 import styles from "./AdminDashboard.styles";
 
 // Custom Image Component with Cache Busting
@@ -42,6 +42,8 @@ export default function AdminDashboard({ navigation, route }) {
   const [activeSection, setActiveSection] = useState("manage");
   const [books, setBooks] = useState([]);
   const [users, setUsers] = useState([]);
+  const [userSearch, setUserSearch] = useState("");
+  const [userSummary, setUserSummary] = useState({ total: 0, banned: 0 });
   const [pendingRequests, setPendingRequests] = useState([]);
   const [allBorrowRecords, setAllBorrowRecords] = useState([]);
   const [loading, setLoading] = useState(false);
@@ -79,6 +81,17 @@ export default function AdminDashboard({ navigation, route }) {
     animateSectionChange();
   }, [activeSection]);
 
+  // Search the user directory on the server, debounced while typing
+  const firstUserSearch = useRef(true);
+  useEffect(() => {
+    if (firstUserSearch.current) {
+      firstUserSearch.current = false;
+      return;
+    }
+    const timer = setTimeout(() => loadUsers(), 300);
+    return () => clearTimeout(timer);
+  }, [userSearch]);
+
   const animateSectionChange = () => {
     fadeAnim.setValue(0);
     Animated.timing(fadeAnim, {
@@ -125,6 +138,9 @@ export default function AdminDashboard({ navigation, route }) {
         case "users":
           await loadUsers();
           break;
+        case "stats":
+          await loadUserSummary();
+          break;
         case "requests":
           await loadPendingRequests();
           break;
@@ -148,10 +164,10 @@ export default function AdminDashboard({ navigation, route }) {
   const loadBooks = async () => {
     try {
       setLoading(true);
-      const response = await API.get("/books/all");
+      const allBooks = await fetchAllPages("/books/all");
       
       // Add cache busting to image URLs
-      const booksWithCacheBust = response.data.map(book => ({
+      const booksWithCacheBust = allBooks.map(book => ({
         ...book,
         image_url: book.image_url ? book.image_url : null,
         _version: Date.now() // Force re-render
@@ -169,8 +185,15 @@ export default function AdminDashboard({ navigation, route }) {
   const loadUsers = async () => {
     try {
       setUsersLoading(true);
-      const response = await API.get("/auth/users");
-      setUsers(response.data);
+      const params = { view: "compact" };
+      if (userSearch.trim()) {
+        params.q = userSearch.trim();
+      }
+      const [allUsers] = await Promise.all([
+        fetchAllPages("/auth/users", params),
+        loadUserSummary(),
+      ]);
+      setUsers(allUsers);
     } catch (error) {
       console.error("Error loading users:", error);
       Alert.alert("Error", "Failed to load users");
@@ -179,11 +202,20 @@ export default function AdminDashboard({ navigation, route }) {
     }
   };
 
+  const loadUserSummary = async () => {
+    try {
+      const response = await API.get("/auth/users/summary");
+      setUserSummary(response.data);
+    } catch (error) {
+      console.error("Error loading user summary:", error);
+    }
+  };
+
   const loadPendingRequests = async () => {
     try {
       setRequestsLoading(true);
-      const response = await API.get("/books/pending-requests");
-      setPendingRequests(response.data);
+      const records = await fetchAllPages("/books/pending-requests");
+      setPendingRequests(records);
     } catch (error) {
       console.error("Error loading pending requests:", error);
       Alert.alert("Error", "Failed to load pending requests");
@@ -195,8 +227,8 @@ export default function AdminDashboard({ navigation, route }) {
   const loadAllBorrowRecords = async () => {
     try {
       setRequestsLoading(true);
-      const response = await API.get("/books/admin/borrow-records");
-      setAllBorrowRecords(response.data);
+      const records = await fetchAllPages("/books/admin/borrow-records");
+      setAllBorrowRecords(records);
     } catch (error) {
       console.error("Error loading borrow records:", error);
       Alert.alert("Error", "Failed to load borrow records");
@@ -306,53 +338,13 @@ export default function AdminDashboard({ navigation, route }) {
     }
   };
 
-  // Upload image to server
-  const uploadImage = async (imageUri) => {
-    try {
-      setUploading(true);
-      
-      // Create form data for file upload
-      const uploadFormData = new FormData();
-      uploadFormData.append('image', {
-        uri: imageUri,
-        type: 'image/jpeg',
-        name: `book_${Date.now()}.jpg`,
-      });
-
-      // Upload image to the server
-      const uploadResponse = await API.post('/books/upload-image', uploadFormData, {
-        headers: {
-          'Content-Type': 'multipart/form-data',
-        },
-      });
-
-      return uploadResponse.data.image_url;
-    } catch (error) {
-      console.error('Error uploading image:', error);
-      throw new Error('Failed to upload image');
-    } finally {
-      setUploading(false);
-    }
-  };
-
   const handleAddBook = async () => {
     if (!validateForm()) return;
 
     try {
       setUploading(true);
       
-      let imageUrl = formData.image_url;
-
-      // If a new image is selected, upload it first
-      if (selectedImage) {
-        try {
-          imageUrl = await uploadImage(selectedImage);
-        } catch (error) {
-          Alert.alert("Error", "Failed to upload image. Please try again.");
-          setUploading(false);
-          return;
-        }
-      }
+      const imageUrl = formData.image_url;
 
       // Create FormData for multipart form submission
       const formDataToSend = new FormData();
@@ -374,8 +366,8 @@ export default function AdminDashboard({ navigation, route }) {
         formDataToSend.append('image_url', imageUrl);
       }
 
-      // If we have a new image file, append it directly
-      if (selectedImage && !imageUrl) {
+      // A new image file is sent with the book and uploaded in the background
+      if (selectedImage) {
         formDataToSend.append('image', {
           uri: selectedImage,
           type: 'image/jpeg',
@@ -392,6 +384,9 @@ export default function AdminDashboard({ navigation, route }) {
       Alert.alert("Success", "Book added successfully");
       setModalVisible(false);
       resetForm();
+      if (response.data.image_job_id) {
+        await waitForImageJob(response.data.image_job_id);
+      }
       await loadBooks(); // Wait for reload to complete
     } catch (error) {
       console.error('Add book error:', error.response?.data);
@@ -407,18 +402,7 @@ export default function AdminDashboard({ navigation, route }) {
     try {
       setUploading(true);
       
-      let imageUrl = formData.image_url;
-
-      // If a new image is selected, upload it first
-      if (selectedImage) {
-        try {
-          imageUrl = await uploadImage(selectedImage);
-        } catch (error) {
-          Alert.alert("Error", "Failed to upload image. Please try again.");
-          setUploading(false);
-          return;
-        }
-      }
+      const imageUrl = formData.image_url;
 
       // Create FormData for multipart form submission
       const formDataToSend = new FormData();
@@ -440,6 +424,15 @@ export default function AdminDashboard({ navigation, route }) {
       // Always include image_url, even if empty (to clear existing image)
       formDataToSend.append('image_url', imageUrl || '');
 
+      // A new image file is sent with the book and uploaded in the background
+      if (selectedImage) {
+        formDataToSend.append('image', {
+          uri: selectedImage,
+          type: 'image/jpeg',
+          name: `book_${Date.now()}.jpg`,
+        });
+      }
+
       const response = await API.put(`/books/${editingBook._id}`, formDataToSend, {
         headers: {
           'Content-Type': 'multipart/form-data',
@@ -449,6 +442,9 @@ export default function AdminDashboard({ navigation, route }) {
       Alert.alert("Success", "Book updated successfully");
       setModalVisible(false);
       resetForm();
+      if (response.data.image_job_id) {
+        await waitForImageJob(response.data.image_job_id);
+      }
       
       // Force reload books and update state
       await loadBooks();
@@ -459,7 +455,7 @@ export default function AdminDashboard({ navigation, route }) {
           book._id === editingBook._id 
             ? { 
                 ...book, 
-                image_url: imageUrl ? `${imageUrl}?t=${Date.now()}` : imageUrl,
+                image_url: book.image_url ? `${book.image_url}?t=${Date.now()}` : book.image_url,
                 _version: Date.now() // Force re-render
               } 
             : book
@@ -572,30 +568,21 @@ export default function AdminDashboard({ navigation, route }) {
   // STATUS MANAGEMENT
   const handleUpdateStatus = async (borrowId, newStatus) => {
     try {
-      let endpoint = '';
-      let payload = {};
-
-      switch (newStatus) {
-        case 'approved':
-          endpoint = `/books/approve-borrow/${borrowId}`;
-          break;
-        case 'rejected':
-          endpoint = `/books/reject-borrow/${borrowId}`;
-          break;
-        case 'returned':
-          // For marking as returned, we need to call the return endpoint
-          endpoint = '/books/return';
-          payload = { borrow_id: borrowId };
-          break;
-        default:
-          Alert.alert("Error", "Invalid status");
-          return;
+      const actions = { approved: 'approve', rejected: 'reject', returned: 'return' };
+      const action = actions[newStatus];
+      if (!action) {
+        Alert.alert("Error", "Invalid status");
+        return;
       }
 
-      if (newStatus === 'returned') {
-        await API.post(endpoint, payload);
-      } else {
-        await API.put(endpoint);
+      // One bulk endpoint handles approve, reject and return
+      const response = await API.post('/books/admin/borrow-actions', {
+        actions: [{ borrow_id: borrowId, action }],
+      });
+      const [result] = response.data.results;
+      if (!result.ok) {
+        Alert.alert("Error", result.error || "Failed to update status");
+        return;
       }
 
       Alert.alert("Success", `Status updated to ${newStatus}`);
@@ -806,6 +793,15 @@ export default function AdminDashboard({ navigation, route }) {
         </TouchableOpacity>
       </View>
 
+      <TextInput
+        style={styles.input}
+        placeholder="Search users by name or email"
+        placeholderTextColor="#8b7355"
+        value={userSearch}
+        onChangeText={setUserSearch}
+        autoCapitalize="none"
+      />
+
       {usersLoading ? (
         <View style={styles.loadingContainer}>
           <Text style={styles.loadingText}>Loading users...</Text>
@@ -1151,7 +1147,7 @@ export default function AdminDashboard({ navigation, route }) {
             <Text style={styles.statIcon}>👥</Text>
           </View>
           <Text style={styles.statNumber}>
-            {users.length}
+            {userSummary.total}
           </Text>
           <Text style={styles.statLabel}>Total Users</Text>
         </View>
@@ -1160,7 +1156,7 @@ export default function AdminDashboard({ navigation, route }) {
             <Text style={styles.statIcon}>🚫</Text>
           </View>
           <Text style={styles.statNumber}>
-            {users.filter(user => user.is_banned).length}
+            {userSummary.banned}
           </Text>
           <Text style={styles.statLabel}>Banned Users</Text>
         </View>
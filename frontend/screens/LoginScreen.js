@@ -54,6 +54,7 @@ export default function LoginScreen({ navigation }) {
       const res = await API.post("/auth/login", { email, password });
   
       global.authToken = res.data.access_token;
+      global.refreshToken = res.data.refresh_token;
       global.userName = res.data.name; // ✅ store name globally
   
       setMsg("Login success!");
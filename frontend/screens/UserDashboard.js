@@ -14,7 +14,7 @@ import {
   ActivityIndicator,
 } from "react-native";
 import { MaterialCommunityIcons, Feather, FontAwesome5 } from "@expo/vector-icons";
-import API from "../utils/api";
+import API, { coverUri, fetchAllPages, refreshAccessToken, waitForImageJob } from "../utils/api";
 import styles from "./UserDashboard.styles";
 import * as ImagePicker from 'expo-image-picker';
 
@@ -34,6 +34,7 @@ export default function UserDashboard({ navigation, route }) {
   const [borrowedBooks, setBorrowedBooks] = useState([]);
   const [borrowingHistory, setBorrowingHistory] = useState([]);
   const [notifications, setNotifications] = useState([]);
+  const [unreadCount, setUnreadCount] = useState(0);
   const [loading, setLoading] = useState(false);
   const [refreshing, setRefreshing] = useState(false);
   const [fadeAnim] = useState(new Animated.Value(0));
@@ -77,11 +78,21 @@ export default function UserDashboard({ navigation, route }) {
 
   useEffect(() => {
     loadSectionData();
+    loadUnreadCount();
     if (activeSection === "profile") {
       loadProfileData();
     }
   }, [activeSection]);
 
+  const loadUnreadCount = async () => {
+    try {
+      const response = await API.get("/books/notifications/unread-count");
+      setUnreadCount(response.data.unread);
+    } catch (error) {
+      console.error("Error loading unread count:", error);
+    }
+  };
+
   useEffect(() => {
     Animated.timing(fadeAnim, {
       toValue: 1,
@@ -108,14 +119,7 @@ export default function UserDashboard({ navigation, route }) {
 
     switch (activeSection) {
       case "available":
-        const filteredAvailable = availableBooks.filter(book => 
-          book.title?.toLowerCase().includes(query) ||
-          book.author?.toLowerCase().includes(query) ||
-          book.category?.toLowerCase().includes(query) ||
-          book.genre?.toLowerCase().includes(query) ||
-          book.isbn?.toLowerCase().includes(query)
-        );
-        setFilteredAvailableBooks(filteredAvailable);
+        // Catalog search runs on the server, see the effect below
         break;
       
       case "borrowed":
@@ -152,6 +156,76 @@ export default function UserDashboard({ navigation, route }) {
     }
   };
 
+  // Live notifications over WebSocket; on reconnect the server replays
+  // everything newer than the last notification we have seen
+  const lastNotificationId = useRef(null);
+
+  useEffect(() => {
+    const newest = notifications[0]?._id;
+    if (newest && (!lastNotificationId.current || newest > lastNotificationId.current)) {
+      lastNotificationId.current = newest;
+    }
+  }, [notifications]);
+
+  useEffect(() => {
+    if (!global.authToken) return;
+    let socket = null;
+    let retryTimer = null;
+    let stopped = false;
+
+    const connect = () => {
+      const base = API.defaults.baseURL.replace(/^http/, "ws");
+      const params = `token=${encodeURIComponent(global.authToken)}` +
+        (lastNotificationId.current ? `&last_id=${lastNotificationId.current}` : "");
+      socket = new WebSocket(`${base}/books/notifications/ws?${params}`);
+
+      socket.onmessage = (event) => {
+        const message = JSON.parse(event.data);
+        if (message.event === "notification") {
+          setNotifications((current) =>
+            current.some((n) => n._id === message.data._id) ? current : [message.data, ...current]
+          );
+          loadUnreadCount();
+        }
+      };
+      socket.onclose = (event) => {
+        if (stopped) return;
+        // 1008: the access token expired; renew it before reconnecting
+        if (event.code === 1008 && global.refreshToken) {
+          refreshAccessToken().then(connect, () => {});
+          return;
+        }
+        retryTimer = setTimeout(connect, 5000);
+      };
+    };
+
+    connect();
+    return () => {
+      stopped = true;
+      clearTimeout(retryTimer);
+      socket?.close();
+    };
+  }, []);
+
+  // Server-side ranked search for the available books section
+  useEffect(() => {
+    const query = searchQuery.trim();
+    if (activeSection !== "available" || !query) return;
+
+    const timer = setTimeout(async () => {
+      try {
+        const response = await API.get("/books/search", {
+          params: { q: query, available: true, limit: 50 },
+        });
+        setFilteredAvailableBooks(response.data.items);
+      } catch (error) {
+        console.error("Error searching books:", error);
+      }
+    }, 300);
+
+    return () => clearTimeout(timer);
+  }, [searchQuery, activeSection]);
+
   const clearSearch = () => {
     setSearchQuery("");
   };
@@ -163,8 +237,10 @@ export default function UserDashboard({ navigation, route }) {
 
   const confirmLogout = () => {
     setLogoutConfirmVisible(false);
-    // Clear any global states if needed
+    // End the server session, then clear any global states
+    API.post("/auth/logout").catch(() => {});
     global.authToken = null;
+    global.refreshToken = null;
     global.userName = null;
     navigation.replace("Login");
   };
@@ -243,20 +319,20 @@ export default function UserDashboard({ navigation, route }) {
       fadeAnim.setValue(0);
       switch (activeSection) {
         case "available":
-          const booksResponse = await API.get("/books/");
-          setAvailableBooks(booksResponse.data);
+          const booksResponse = await fetchAllPages("/books/");
+          setAvailableBooks(booksResponse);
           break;
         case "borrowed":
-          const borrowsResponse = await API.get("/books/my-borrows");
-          setBorrowedBooks(borrowsResponse.data);
+          const borrowsResponse = await fetchAllPages("/books/my-borrows");
+          setBorrowedBooks(borrowsResponse);
           break;
         case "history":
-          const historyResponse = await API.get("/books/borrowing-history");
-          setBorrowingHistory(historyResponse.data);
+          const historyResponse = await fetchAllPages("/books/borrowing-history");
+          setBorrowingHistory(historyResponse);
           break;
         case "notifications":
-          const notificationsResponse = await API.get("/books/notifications");
-          setNotifications(notificationsResponse.data);
+          const notificationsResponse = await fetchAllPages("/books/notifications");
+          setNotifications(notificationsResponse);
           break;
         default:
           break;
@@ -345,6 +421,7 @@ export default function UserDashboard({ navigation, route }) {
       setNotifications(notifications.map(notif => 
         notif._id === notificationId ? {...notif, is_read: true} : notif
       ));
+      setUnreadCount((count) => Math.max(count - 1, 0));
     } catch (error) {
       console.error("Error marking notification as read:", error);
     }
@@ -354,6 +431,7 @@ export default function UserDashboard({ navigation, route }) {
     try {
       await API.delete(`/books/notifications/${notificationId}`);
       setNotifications(notifications.filter(notif => notif._id !== notificationId));
+      loadUnreadCount();
     } catch (error) {
       console.error("Error deleting notification:", error);
     }
@@ -444,6 +522,9 @@ export default function UserDashboard({ navigation, route }) {
       Alert.alert("Success", "Profile updated successfully");
       setEditProfileVisible(false);
       setSelectedImage(null);
+      if (response.data.image_job_id) {
+        await waitForImageJob(response.data.image_job_id);
+      }
       await loadProfileData();
       
     } catch (error) {
@@ -763,7 +844,7 @@ export default function UserDashboard({ navigation, route }) {
               <View style={styles.bookImageContainer}>
                 {selectedBook?.image_url ? (
                   <Image 
-                    source={{ uri: selectedBook.image_url }} 
+                    source={{ uri: coverUri(selectedBook, "medium") }} 
                     style={styles.bookDetailsImage}
                     resizeMode="cover"
                   />
@@ -1098,7 +1179,7 @@ export default function UserDashboard({ navigation, route }) {
                 >
                   {book.image_url ? (
                     <Image 
-                      source={{ uri: book.image_url }} 
+                      source={{ uri: coverUri(book, "thumb") }} 
                       style={styles.bookImage}
                       resizeMode="cover"
                       onError={(e) => console.log('Image load error:', e.nativeEvent.error)}
@@ -1711,10 +1792,10 @@ export default function UserDashboard({ navigation, route }) {
                   <Text style={[styles.menuText, activeSection === item.id && styles.activeMenuText]}>
                     {item.label}
                   </Text>
-                  {item.id === "notifications" && notifications.filter(n => !n.is_read).length > 0 && (
+                  {item.id === "notifications" && unreadCount > 0 && (
                     <View style={styles.badge}>
                       <Text style={styles.badgeText}>
-                        {notifications.filter(n => !n.is_read).length}
+                        {unreadCount}
                       </Text>
                     </View>
                   )}
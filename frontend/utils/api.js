@@ -3,16 +3,117 @@ import axios from "axios";
 
 const API = axios.create({
   baseURL: "http://192.168.1.44:10000", 
+  // 304 Not Modified is answered from the ETag cache below
+  validateStatus: (status) => (status >= 200 && status < 300) || status === 304,
 });
 
+// Conditional GETs: remember the last ETag and body per URL
+const ETAG_CACHE_SIZE = 100;
+const etagCache = new Map();
+
 API.interceptors.request.use(async (config) => {
   const token = global.authToken;
   if (token) {
     config.headers.Authorization = `Bearer ${token}`;
   }
+  if ((config.method || "get") === "get") {
+    const cached = etagCache.get(API.getUri(config));
+    if (cached) {
+      config.headers["If-None-Match"] = cached.etag;
+    }
+  }
   return config;
 });
 
+API.interceptors.response.use((response) => {
+  const { config } = response;
+  if ((config.method || "get") !== "get") {
+    return response;
+  }
+  const key = API.getUri(config);
+  if (response.status === 304 && etagCache.has(key)) {
+    response.data = etagCache.get(key).data;
+    return response;
+  }
+  const etag = response.headers?.etag;
+  if (etag) {
+    etagCache.delete(key);
+    etagCache.set(key, { etag, data: response.data });
+    if (etagCache.size > ETAG_CACHE_SIZE) {
+      etagCache.delete(etagCache.keys().next().value);
+    }
+  }
+  return response;
+}, async (error) => {
+  // Expired access token: renew it once with the refresh token and retry
+  const { config, response } = error;
+  if (
+    response?.status !== 401 ||
+    !config ||
+    config._retried ||
+    !global.refreshToken ||
+    config.url === "/auth/refresh"
+  ) {
+    throw error;
+  }
+  config._retried = true;
+  await refreshAccessToken();
+  config.headers.Authorization = `Bearer ${global.authToken}`;
+  return API(config);
+});
+
+// Concurrent 401s share one refresh; refresh tokens rotate on every use
+let refreshing = null;
+export const refreshAccessToken = () => {
+  if (!refreshing) {
+    refreshing = API.post("/auth/refresh", { refresh_token: global.refreshToken })
+      .then((res) => {
+        global.authToken = res.data.access_token;
+        global.refreshToken = res.data.refresh_token;
+      })
+      .catch((err) => {
+        global.authToken = null;
+        global.refreshToken = null;
+        throw err;
+      })
+      .finally(() => {
+        refreshing = null;
+      });
+  }
+  return refreshing;
+};
+
+// Image uploads finish in the background; wait (bounded) for the job to settle
+export const waitForImageJob = async (jobId, { interval = 1000, timeout = 30000 } = {}) => {
+  const deadline = Date.now() + timeout;
+  while (Date.now() < deadline) {
+    const response = await API.get(`/uploads/jobs/${jobId}`);
+    if (response.data.status === "done" || response.data.status === "failed") {
+      return response.data;
+    }
+    await new Promise((resolve) => setTimeout(resolve, interval));
+  }
+  return null;
+};
+
+// Catalog books carry resized cover URLs ("thumb", "medium"); fall back to the original
+export const coverUri = (book, variant = "thumb") => {
+  const path = book?.image_variants?.[variant];
+  return path ? `${API.defaults.baseURL}${path}` : book?.image_url;
+};
+
+// List endpoints return { items, next_cursor }; follow the cursor to the end
+export const fetchAllPages = async (url, params = {}) => {
+  const items = [];
+  let after = null;
+  do {
+    const response = await API.get(url, { params: { ...params, after, limit: 200 } });
+    items.push(...response.data.items);
+    after = response.data.next_cursor;
+  } while (after);
+  return items;
+};
+
 export default API;
 
 